@@ -1,12 +1,25 @@
-
-
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-INPUT_DIR = os.path.join(BASE_DIR, "input")
-OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+
+# Skin sample of the head texture: x, y, width, height
+SKIN_REGION = (70, 110, 130, 20)
+
+# Body textures each gender's body template uses
+BODY_TEXTURES = {
+    "male": ["Std_Skin_Leg_Diffuse.png", "Std_Skin_Arm_Diffuse.png", "Std_Skin_Body_Diffuse.png"],
+    "female": ["female.png"],
+}
+
+_templates = {}
+_lock = threading.Lock()
+
 
 def find_input_image(folder, extensions=("png", "jpg", "jpeg")):
     for fname in os.listdir(folder):
@@ -15,76 +28,112 @@ def find_input_image(folder, extensions=("png", "jpg", "jpeg")):
     raise FileNotFoundError(f"No image found in {folder} with extensions {extensions}")
 
 
-def extract_region_hsv(uv_texture_path, region_coords):
-
-    image = cv2.imread(uv_texture_path)
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
+def extract_region_hsv(image, region_coords=SKIN_REGION):
+    """Average HSV of `region_coords` (x, y, width, height) of a BGR image."""
     x, y, w, h = region_coords
-    region_rgb = image_rgb[y:y+h, x:x+w]
-    region_hsv = cv2.cvtColor(region_rgb, cv2.COLOR_RGB2HSV)
-
-    avg_hsv = region_hsv.mean(axis=(0, 1)).astype(int)
-
-    # Visualize the region and a patch with the average HSV color converted back to RGB for display
-    avg_hsv_color = np.uint8([[avg_hsv]])  # Shape (1,1,3)
-    avg_rgb_color = cv2.cvtColor(avg_hsv_color, cv2.COLOR_HSV2RGB)[0][0]
-
-    plt.figure(figsize=(4, 2))
-    plt.subplot(1, 2, 1)
-    plt.imshow(region_rgb)
-    plt.title("Sampled Region")
-    plt.axis("off")
-
-    plt.subplot(1, 2, 2)
-    plt.imshow(np.ones((100, 100, 3), dtype=np.uint8) * avg_rgb_color)
-    plt.title(f"Avg HSV: {tuple(avg_hsv)}")
-    plt.axis("off")
-
-    return tuple(avg_hsv)
-
-# Example usage
-uv_texture_path = find_input_image(INPUT_DIR)
-region_coords = (70, 110, 130, 20)  # x, y, width, height
-avg_hsv = extract_region_hsv(uv_texture_path, region_coords)
-print("Average skin color (HSV):", avg_hsv)
-
-
-
-texture_filenames = [
-    "Std_Skin_Leg_Diffuse.png",
-    "Std_Skin_Arm_Diffuse.png",
-    "Std_Skin_Body_Diffuse.png",
-    "female.png"
-]
-
-for texture_file in texture_filenames:
-    texture_path = os.path.join(BASE_DIR, texture_file)
-    image = cv2.imread(texture_path)
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-    # Convert to HSV
-    image_hsv = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2HSV)
-
-    # Calculate current average HSV
-    avg_hsv_current = image_hsv.mean(axis=(0, 1)).astype(np.int32)
-
-    # Target HSV (already computed above)
-    target_hsv = np.array(list(avg_hsv), dtype=np.int32)
-
-    # Compute difference and apply shift
-    hsv_shift = target_hsv - avg_hsv_current
-    image_hsv_shifted = image_hsv.astype(np.int32)
-    image_hsv_shifted[:, :, 0] = (image_hsv_shifted[:, :, 0] + hsv_shift[0]) % 180
-    image_hsv_shifted[:, :, 1] = np.clip(image_hsv_shifted[:, :, 1] + hsv_shift[1], 0, 255)
-    image_hsv_shifted[:, :, 2] = np.clip(image_hsv_shifted[:, :, 2] + hsv_shift[2], 0, 255)
-    image_hsv_shifted = image_hsv_shifted.astype(np.uint8)
-
-    # Convert back to RGB
-    recolored_rgb = cv2.cvtColor(image_hsv_shifted, cv2.COLOR_HSV2RGB)
-
-    # Save the result with the same name in OUTPUT_DIR
-    output_path = os.path.join(OUTPUT_DIR, texture_file)
-    cv2.imwrite(output_path, cv2.cvtColor(recolored_rgb, cv2.COLOR_RGB2BGR))
-
-    print(f"Saved recolored texture: {output_path}")
\ No newline at end of file
+    region_hsv = cv2.cvtColor(image[y:y+h, x:x+w], cv2.COLOR_BGR2HSV)
+    return tuple(region_hsv.mean(axis=(0, 1)).astype(int).tolist())
+
+
+def load_template(texture_file):
+    """HSV planes and mean HSV of a body texture, decoded once per process."""
+    with _lock:
+        if texture_file not in _templates:
+            image = cv2.imread(os.path.join(BASE_DIR, texture_file))
+            if image is None:
+                raise FileNotFoundError(f"❌ Body texture {texture_file} not found in {BASE_DIR}")
+            image_hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            _templates[texture_file] = (image_hsv, image_hsv.mean(axis=(0, 1)).astype(np.int32))
+        return _templates[texture_file]
+
+
+def shift_lut(hsv_shift):
+    """(256, 1, 3) uint8 lookup table adding `hsv_shift` per channel, hue wrapping at 180."""
+    values = np.arange(256, dtype=np.int32)
+    lut = np.empty((256, 1, 3), dtype=np.uint8)
+    lut[:, 0, 0] = (values + hsv_shift[0]) % 180
+    lut[:, 0, 1] = np.clip(values + hsv_shift[1], 0, 255)
+    lut[:, 0, 2] = np.clip(values + hsv_shift[2], 0, 255)
+    return lut
+
+
+def recolor_texture(texture_file, target_hsv):
+    """Body texture shifted so its mean HSV becomes `target_hsv`, as a BGR image."""
+    image_hsv, avg_hsv_current = load_template(texture_file)
+    lut = shift_lut(np.asarray(target_hsv, dtype=np.int32) - avg_hsv_current)
+    return cv2.cvtColor(cv2.LUT(image_hsv, lut), cv2.COLOR_HSV2BGR)
+
+
+def body_gender(gender):
+    """`gender` as a key of BODY_TEXTURES ("Male" -> "male"); ValueError for anything else."""
+    key = str(gender).strip().lower()
+    if key not in BODY_TEXTURES:
+        raise ValueError(f"❌ Unknown gender {gender!r}, expected one of {', '.join(BODY_TEXTURES)}")
+    return key
+
+
+def recolor_body(gender, target_hsv, workers=None):
+    """Recolors the body textures of `gender` only; returns {file name: BGR image}.
+
+    Textures are processed on `workers` threads (OpenCV releases the GIL),
+    one per texture by default.
+    """
+    texture_files = BODY_TEXTURES[body_gender(gender)]
+    workers = workers or len(texture_files)
+    if workers == 1:
+        images = [recolor_texture(name, target_hsv) for name in texture_files]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            images = list(pool.map(lambda name: recolor_texture(name, target_hsv), texture_files))
+    return dict(zip(texture_files, images))
+
+
+def recolor_body_dir(gender, skin_image_path, output_dir, workers=None, tone_cache=None):
+    """Samples the skin tone of `skin_image_path` (blend_image.jpg) and writes
+    the recolored body textures of `gender` to `output_dir`.
+
+    With a `tone_cache` (tone_cache.ToneCache), skin tones of the same bucket
+    reuse the already recolored (and encoded) textures.
+    """
+    # before the tone cache key: "Male" and "male" share one entry
+    gender = body_gender(gender)
+    os.makedirs(output_dir, exist_ok=True)
+    skin_image = cv2.imread(skin_image_path)
+    if skin_image is None:
+        raise ValueError(f"❌ Could not read {skin_image_path}")
+    avg_hsv = extract_region_hsv(skin_image)
+    print("Average skin color (HSV):", avg_hsv)
+
+    if tone_cache is not None:
+        saved = tone_cache.write(gender, avg_hsv, lambda target_hsv: recolor_body(gender, target_hsv, workers), output_dir)
+    else:
+        def save(item):
+            texture_file, image = item
+            output_path = os.path.join(output_dir, texture_file)
+            cv2.imwrite(output_path, image)
+            return output_path
+
+        textures = recolor_body(gender, avg_hsv, workers)
+        with ThreadPoolExecutor(max_workers=workers or len(textures)) as pool:
+            saved = list(pool.map(save, textures.items()))
+    for output_path in saved:
+        print(f"Saved recolored texture: {output_path}")
+    return saved
+
+
+if __name__ == "__main__":
+    # Input/output folders can be pointed at a per-job workspace
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_dir", default=os.path.join(BASE_DIR, "input"), help="Folder holding blend_image.jpg")
+    parser.add_argument("--output_dir", default=os.path.join(BASE_DIR, "output"), help="Folder for the recolored body textures")
+    parser.add_argument("--g", default=None, help="Only recolor the textures of this gender (default: both)")
+    parser.add_argument("--workers", type=int, default=None, help="Threads per gender (default: one per texture)")
+    args, unknown = parser.parse_known_args()
+
+    input_path = os.path.join(args.input_dir, "blend_image.jpg")
+    if not os.path.exists(input_path):
+        input_path = find_input_image(args.input_dir)
+    start = time.time()
+    for gender in [args.g] if args.g else list(BODY_TEXTURES):
+        recolor_body_dir(gender, input_path, args.output_dir, args.workers)
+    print(f"✅ Body textures recolored in {(time.time() - start) * 1000:.1f} ms")
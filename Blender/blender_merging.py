@@ -5,6 +5,8 @@ import bmesh
 import math
 import glob
 import argparse
+import sys
+import numpy as np
 
 # Get the directory where the current script is located
 BASE_DIR = os.path.dirname(__file__)
@@ -13,6 +15,9 @@ def abs_path(rel_path):
     """Helper to build an absolute path from a relative one."""
     return os.path.join(BASE_DIR, rel_path)
 
+sys.path.append(os.path.abspath(BASE_DIR))
+from seam_weld import SeamWelder, near_duplicates, seam_vertices
+
 # Helper to delete all objects
 def delete_all_objects():
     bpy.ops.object.select_all(action='SELECT')
@@ -26,6 +31,10 @@ def import_obj(filepath):
 # Parse command-line arguments
 parser = argparse.ArgumentParser()
 parser.add_argument("--g", type=str, required=True, help="Specify gender: 'male' or 'female'")
+parser.add_argument("--head_dir", default=abs_path("ready to use model/head"), help="Folder holding the DECA head .obj")
+parser.add_argument("--head_texture", default=abs_path("ready to use model/head/final_texture.jpeg"), help="Final head texture")
+parser.add_argument("--body_texture_dir", default=abs_path("Texture_body/output"), help="Folder holding the recolored body textures")
+parser.add_argument("--output_dir", default=abs_path("output"), help="Folder for the exported .glb")
 args, unknown = parser.parse_known_args()
 gender = args.g.lower()
 
@@ -36,7 +45,7 @@ if gender not in ["male", "female"]:
 # Reset scene
 delete_all_objects()
 
-head_folder = abs_path("ready to use model/head")
+head_folder = args.head_dir
 
 # Find the first .obj file in the folder
 obj_files = glob.glob(os.path.join(head_folder, "*.obj"))
@@ -56,7 +65,7 @@ imported_objs1 = import_obj(obj1_path)
 obj1 = imported_objs1[0]
 bpy.context.view_layer.objects.active = obj1
 
-texture_path = abs_path("ready to use model/head/final_texture.jpeg")
+texture_path = args.head_texture
 img = bpy.data.images.load(texture_path)
 
 # Get the first material from obj1
@@ -107,7 +116,7 @@ if gender == "male":
     }
 
     for mat_name, img_filename in body_textures.items():
-        texture_path = abs_path(f"Texture_body/output/{img_filename}")
+        texture_path = os.path.join(args.body_texture_dir, img_filename)
         mat = bpy.data.materials.get(mat_name)
         if not mat or not mat.use_nodes:
             print(f"❌ Material {mat_name} not found or doesn't use nodes.")
@@ -157,7 +166,7 @@ else:
 
     if material and material.use_nodes:
         # Load image
-        image_path = abs_path("Texture_body/output/female.png")
+        image_path = os.path.join(args.body_texture_dir, "female.png")
         image = bpy.data.images.load(image_path)
 
         # Create Image Texture node
@@ -181,6 +190,9 @@ else:
         print(f"Material '{material_name}' not found or doesn't use nodes.")
 
 
+# Head vertices come first in the joined mesh
+n_head = len(obj1.data.vertices)
+
 # Join objects
 for obj in imported_objs2:
     obj.select_set(True)
@@ -191,43 +203,46 @@ bpy.ops.object.join()
 bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
 
 obj = bpy.context.object
-bpy.ops.object.mode_set(mode='EDIT')
-bm = bmesh.from_edit_mesh(obj.data)
-bm.normal_update()
-
-# Deselect all geometry
-for v in bm.verts:
-    v.select = False
-for e in bm.edges:
-    e.select = False
-
-# Define z-range for neck seam
-z_min = 7.0
-z_max = 8.0
-
-selected_edge_count = 0
+mesh = obj.data
+
+# Read the joined mesh into arrays
+positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+mesh.vertices.foreach_get("co", positions)
+positions = positions.reshape(-1, 3)
+edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+mesh.edges.foreach_get("vertices", edges)
+edges = edges.reshape(-1, 2)
+loop_edges = np.empty(len(mesh.loops), dtype=np.int32)
+mesh.loops.foreach_get("edge_index", loop_edges)
+
+# Neck seam: open edges (a single face) in the z-range, split into head and body vertices
+face_counts = np.bincount(loop_edges, minlength=len(edges))
+seam = seam_vertices(edges[face_counts == 1], positions, up_axis=2)
+head_seam = seam[seam < n_head]
+body_seam = seam[seam >= n_head]
+print(f"✅ Found {len(head_seam)} head and {len(body_seam)} body neck seam vertices.")
+
+# Merge each head seam vertex into the closest body seam vertex, and, as the former
+# remove_doubles pass did, near-duplicates within the body seam and the unmatched head seam
+body_dups, body_targets = near_duplicates(positions, body_seam)
+targetmap = dict(zip(body_dups.tolist(), body_targets.tolist()))
+welder = SeamWelder(positions, body_seam)
+head_ids, body_ids = welder.match(positions, head_seam)
+targetmap.update((h, targetmap.get(b, b)) for h, b in zip(head_ids.tolist(), body_ids.tolist()))
+head_dups, head_targets = near_duplicates(positions, np.setdiff1d(head_seam, head_ids))
+targetmap.update(zip(head_dups.tolist(), head_targets.tolist()))
+bm = bmesh.new()
+bm.from_mesh(mesh)
 bm.verts.ensure_lookup_table()
-
-for e in bm.edges:
-    if len(e.link_faces) == 1:
-        v1, v2 = e.verts
-        if z_min <= v1.co.z <= z_max and z_min <= v2.co.z <= z_max:
-            e.select = True
-            v1.select = True
-            v2.select = True
-            selected_edge_count += 1
-bmesh.update_edit_mesh(obj.data)
-
-sample_zs = [v.co.z for v in bm.verts[:10]]
-print(f"✅ Selected {selected_edge_count} neck seam edges.")
-
-bpy.ops.mesh.remove_doubles(threshold=0.075)
-bpy.ops.object.mode_set(mode='OBJECT')
-
-
+bmesh.ops.weld_verts(bm, targetmap={bm.verts[v]: bm.verts[target] for v, target in targetmap.items()})
+bm.normal_update()
+bm.to_mesh(mesh)
+bm.free()
+mesh.update()
+print(f"✅ Welded {len(targetmap)} neck seam vertices ({len(head_ids)} head onto body).")
 
 
-output_path = abs_path(f"output/{obj1_name_wo_ext}_model.glb")
+output_path = os.path.join(args.output_dir, f"{obj1_name_wo_ext}_model.glb")
 os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
 # Create a temporary collection for export
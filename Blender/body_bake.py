@@ -0,0 +1,150 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+
+from glb_export import GENDER_CONFIGS, load_obj, prepare_body, body_material
+from seam_weld import SeamWelder
+
+# Get the directory where the current script is located
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BAKE_DIR = os.getenv("BODY_BAKE_DIR", os.path.join(BASE_DIR, "ready to use model", "baked"))
+
+# bump whenever the baked layout or prepare_body changes
+BAKE_VERSION = 2
+
+PRIMITIVE_ARRAYS = ("POSITION", "NORMAL", "TEXCOORD_0", "indices")
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def source_files(gender):
+    """The body OBJ of `gender` and the MTL next to it."""
+    obj_path = GENDER_CONFIGS[gender]["body_obj"]
+    return [obj_path, os.path.splitext(obj_path)[0] + ".mtl"]
+
+
+def content_hash(gender):
+    """Hash of everything a bake depends on: layout version, OBJ/MTL bytes and the material table."""
+    digest = hashlib.sha256(f"body-bake-v{BAKE_VERSION}".encode())
+    for path in source_files(gender):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    materials = [body_material(gender, name) for name in GENDER_CONFIGS[gender]["body_textures"]]
+    digest.update(json.dumps(materials, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def source_stamp(gender):
+    """Cheap (size, mtime) fingerprint used to skip re-hashing unchanged sources."""
+    return [[os.path.getsize(path), os.path.getmtime(path)] for path in source_files(gender) if os.path.exists(path)]
+
+
+def bake_body(gender, bake_dir=BAKE_DIR):
+    """Parses the body OBJ once and stores it as .npy arrays plus manifest.json.
+
+    Layout of `<bake_dir>/<gender>/`:
+        positions.npy, seam.npy     template vertices and neck seam vertex ids
+        <i>_<array>.npy             POSITION/NORMAL/TEXCOORD_0/indices of primitive i
+        manifest.json               version, content hash, source stamp, material table
+    """
+    print(f"🔥 Baking {gender} body template ...")
+    body = prepare_body(load_obj(GENDER_CONFIGS[gender]["body_obj"]), gender)
+
+    target = os.path.join(bake_dir, gender)
+    tmp = target + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    np.save(os.path.join(tmp, "positions.npy"), np.ascontiguousarray(body["positions"], dtype=np.float32))
+    np.save(os.path.join(tmp, "seam.npy"), np.ascontiguousarray(body["seam"], dtype=np.int64))
+    materials = []
+    for i, primitive in enumerate(body["primitives"]):
+        for name in PRIMITIVE_ARRAYS:
+            if name in primitive:
+                np.save(os.path.join(tmp, f"{i}_{name}.npy"), np.ascontiguousarray(primitive[name]))
+        materials.append(primitive["material"])
+
+    manifest = {
+        "version": BAKE_VERSION,
+        "gender": gender,
+        "hash": content_hash(gender),
+        "stamp": source_stamp(gender),
+        "materials": materials,
+    }
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.rename(tmp, target)
+    print(f"✅ Baked {gender} body to {target}")
+    return target
+
+
+def read_manifest(gender, bake_dir=BAKE_DIR):
+    path = os.path.join(bake_dir, gender, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def is_fresh(gender, manifest, bake_dir=BAKE_DIR):
+    """True when the bake matches the current sources; re-hashes only if their size/mtime moved."""
+    if manifest is None or manifest.get("version") != BAKE_VERSION:
+        return False
+    if manifest.get("stamp") == source_stamp(gender):
+        return True
+    if manifest.get("hash") != content_hash(gender):
+        return False
+    # same content, new mtime (e.g. fresh checkout): refresh the stamp
+    manifest["stamp"] = source_stamp(gender)
+    with open(os.path.join(bake_dir, gender, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return True
+
+
+def load_baked_body(gender, bake_dir=BAKE_DIR):
+    """Returns the `prepare_body` dict of `gender` with memory-mapped arrays.
+
+    The bake is (re)built when missing or stale, and kept in memory afterwards
+    together with the `welder` (SeamWelder) of its neck seam.
+    """
+    with _lock:
+        if gender in _loaded:
+            return _loaded[gender]
+        manifest = read_manifest(gender, bake_dir)
+        if not is_fresh(gender, manifest, bake_dir):
+            bake_body(gender, bake_dir)
+            manifest = read_manifest(gender, bake_dir)
+
+        folder = os.path.join(bake_dir, gender)
+        load = lambda name: np.load(os.path.join(folder, name + ".npy"), mmap_mode="r")
+        primitives = []
+        for i, material in enumerate(manifest["materials"]):
+            primitive = {name: load(f"{i}_{name}") for name in PRIMITIVE_ARRAYS
+                         if os.path.exists(os.path.join(folder, f"{i}_{name}.npy"))}
+            primitive["material"] = material
+            primitives.append(primitive)
+        body = {"positions": load("positions"), "seam": load("seam"), "primitives": primitives}
+        body["welder"] = SeamWelder(body["positions"], body["seam"])
+        _loaded[gender] = body
+        return body
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bake the body templates into binary arrays")
+    parser.add_argument("--g", nargs="*", default=sorted(GENDER_CONFIGS), help="Genders to bake (default: all)")
+    parser.add_argument("--force", action="store_true", help="Rebake even when the bake is up to date")
+    args = parser.parse_args()
+    for gender in args.g:
+        if args.force or not is_fresh(gender, read_manifest(gender)):
+            bake_body(gender)
+        else:
+            print(f"✅ {gender} bake is up to date")
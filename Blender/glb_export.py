@@ -0,0 +1,375 @@
+import os
+import glob
+import json
+import math
+import struct
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+from seam_weld import SeamWelder, near_duplicates, open_edges, seam_vertices
+
+# Get the directory where the current script is located
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def abs_path(rel_path):
+    """Helper to build an absolute path from a relative one."""
+    return os.path.join(BASE_DIR, rel_path)
+
+
+# Same scene as blender_merging.py, expressed without Blender.
+# Head transforms are in Blender's Z-up space; textures map material names to body textures.
+GENDER_CONFIGS = {
+    "male": {
+        "location": (0.0166, 0.069, 8.712),
+        "rotation": (72, 0, 0),
+        "scale": 5.5,
+        "body_obj": abs_path("ready to use model/male/male body.obj"),
+        "body_textures": {
+            "untitled:lambert1SG.001": "Std_Skin_Body_Diffuse.png",
+            "untitled:lambert2SG.001": "Std_Skin_Arm_Diffuse.png",
+            "untitled:lambert3SG.001": "Std_Skin_Leg_Diffuse.png",
+        },
+        "roughness": 0.535,
+        "metallic": 0.173,
+    },
+    "female": {
+        "location": (0.0321, -0.06828, 8.5042),
+        "rotation": (84, 0, 4.63),
+        "scale": 4.7,
+        "body_obj": abs_path("ready to use model/female/famale_pubg.obj"),
+        "body_textures": {
+            "famale_pubg:Material__45.002": "female.png",
+        },
+        "roughness": 0.8,
+        "metallic": 0.0,
+    },
+}
+
+HEAD_MATERIAL = {"name": "FaceTexture", "roughness": 0.5, "metallic": 0.0}
+
+
+# ---------------------------------------------------------------- OBJ input
+def load_obj(path):
+    """Reads an OBJ into numpy arrays.
+
+    Returns a dict with `positions` (N, 3), `uvs` (M, 2), `normals` (K, 3) and
+    `groups`: an ordered {material name: (T, 3, 3) int array} of triangles,
+    each corner holding 0-based (position, uv, normal) indices, -1 when missing.
+    Polygons are fan-triangulated.
+    """
+    positions, uvs, normals = [], [], []
+    groups = OrderedDict()
+    triangles = groups.setdefault(None, [])
+    with open(path) as f:
+        for line in f:
+            if line.startswith("v "):
+                positions.append(line.split()[1:4])
+            elif line.startswith("vt "):
+                uvs.append(line.split()[1:3])
+            elif line.startswith("vn "):
+                normals.append(line.split()[1:4])
+            elif line.startswith("usemtl "):
+                triangles = groups.setdefault(line[7:].strip(), [])
+            elif line.startswith("f "):
+                corners = [(corner.split("/") + ["", ""])[:3] for corner in line.split()[1:]]
+                corners = [[int(index) if index else 0 for index in corner] for corner in corners]
+                for i in range(1, len(corners) - 1):
+                    triangles.append((corners[0], corners[i], corners[i + 1]))
+
+    return {
+        "positions": np.array(positions, dtype=np.float32).reshape(-1, 3),
+        "uvs": np.array(uvs, dtype=np.float32).reshape(-1, 2),
+        "normals": np.array(normals, dtype=np.float32).reshape(-1, 3),
+        "groups": OrderedDict((name, np.array(tris, dtype=np.int64).reshape(-1, 3, 3) - 1)
+                              for name, tris in groups.items() if tris),
+    }
+
+
+def head_from_arrays(vertices, faces, uvcoords, uvfaces, material="FaceTexture"):
+    """Wraps in-memory DECA arrays (as passed to util.write_obj) in the `load_obj` layout.
+
+    OBJ UVs are stored as-is, so `uvcoords` are the (nuv, 2) raw uv coordinates.
+    """
+    corners = np.stack([faces, uvfaces, -np.ones_like(faces)], axis=2).astype(np.int64)
+    return {
+        "positions": np.asarray(vertices, dtype=np.float32),
+        "uvs": np.asarray(uvcoords, dtype=np.float32),
+        "normals": np.zeros((0, 3), dtype=np.float32),
+        "groups": OrderedDict([(material, corners)]),
+    }
+
+
+# ---------------------------------------------------------------- geometry
+def euler_matrix(degrees):
+    """Rotation matrix of a Blender XYZ euler given in degrees."""
+    x, y, z = (math.radians(angle) for angle in degrees)
+    rx = np.array([[1, 0, 0], [0, math.cos(x), -math.sin(x)], [0, math.sin(x), math.cos(x)]])
+    ry = np.array([[math.cos(y), 0, math.sin(y)], [0, 1, 0], [-math.sin(y), 0, math.cos(y)]])
+    rz = np.array([[math.cos(z), -math.sin(z), 0], [math.sin(z), math.cos(z), 0], [0, 0, 1]])
+    return rz @ ry @ rx
+
+
+def transform_head(positions, gender):
+    """Places the DECA head on the body, in glTF (Y-up) coordinates.
+
+    Blender's OBJ importer stores the Y-up -> Z-up conversion as the object
+    rotation (90 degrees around X). blender_merging.py overwrites that rotation
+    on the head with its own euler, while the body keeps it; glTF export then
+    turns Z-up back into Y-up, so body vertices stay as they are in the OBJ.
+    """
+    config = GENDER_CONFIGS[gender]
+    to_blender = euler_matrix((90, 0, 0))
+    blender = (positions.astype(np.float64) * config["scale"]) @ euler_matrix(config["rotation"]).T + np.array(config["location"])
+    return (blender @ to_blender).astype(np.float32)
+
+
+def vertex_normals(positions, triangles):
+    """Area-weighted smooth normals for a triangle index array (T, 3)."""
+    tri = positions[triangles]
+    face_normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    normals = np.zeros_like(positions, dtype=np.float64)
+    for corner in range(3):
+        np.add.at(normals, triangles[:, corner], face_normals)
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    return (normals / np.maximum(length, 1e-12)).astype(np.float32)
+
+
+def build_primitive(positions, uvs, normals, corners):
+    """Splits OBJ corners into glTF vertices (one per distinct position/uv/normal triple).
+
+    `corners` is a (T, 3, 3) array from `load_obj`; missing normals are
+    replaced by smooth vertex normals.
+    """
+    keys = corners.reshape(-1, 3)
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    vertex_ids, uv_ids, normal_ids = unique[:, 0], unique[:, 1], unique[:, 2]
+
+    if len(normals) and np.all(normal_ids >= 0):
+        corner_normals = normals[normal_ids]
+    else:
+        corner_normals = vertex_normals(positions, corners[:, :, 0])[vertex_ids]
+    primitive = {
+        "POSITION": positions[vertex_ids],
+        "NORMAL": corner_normals,
+        "indices": inverse.astype(np.uint32),
+    }
+    if len(uvs) and np.all(uv_ids >= 0):
+        # glTF puts the UV origin at the top-left corner
+        texcoords = uvs[uv_ids].copy()
+        texcoords[:, 1] = 1.0 - texcoords[:, 1]
+        primitive["TEXCOORD_0"] = texcoords
+    return primitive
+
+
+# ---------------------------------------------------------------- GLB output
+def write_glb(path, primitives, materials, images, mesh_name="avatar"):
+    """Writes one mesh as a binary glTF with every image embedded.
+
+    primitives: dicts of POSITION/NORMAL/TEXCOORD_0 float arrays, uint32 `indices`
+    and a `material` index; materials: dicts with name, image (index or None),
+    roughness and metallic; images: image file paths (PNG or JPEG).
+    """
+    binary = bytearray()
+    buffer_views, accessors = [], []
+
+    def add_view(data, target=None):
+        while len(binary) % 4:
+            binary.append(0)
+        view = {"buffer": 0, "byteOffset": len(binary), "byteLength": len(data)}
+        if target:
+            view["target"] = target
+        binary.extend(data)
+        buffer_views.append(view)
+        return len(buffer_views) - 1
+
+    def add_accessor(array, type_, target):
+        array = np.ascontiguousarray(array)
+        component = 5126 if array.dtype == np.float32 else 5125
+        accessor = {
+            "bufferView": add_view(array.tobytes(), target),
+            "componentType": component,
+            "count": int(array.shape[0]),
+            "type": type_,
+        }
+        if type_ == "VEC3" and component == 5126:
+            accessor["min"] = array.min(axis=0).tolist()
+            accessor["max"] = array.max(axis=0).tolist()
+        accessors.append(accessor)
+        return len(accessors) - 1
+
+    gltf_primitives = []
+    for primitive in primitives:
+        attributes = {
+            "POSITION": add_accessor(primitive["POSITION"].astype(np.float32), "VEC3", 34962),
+            "NORMAL": add_accessor(primitive["NORMAL"].astype(np.float32), "VEC3", 34962),
+        }
+        if "TEXCOORD_0" in primitive:
+            attributes["TEXCOORD_0"] = add_accessor(primitive["TEXCOORD_0"].astype(np.float32), "VEC2", 34962)
+        gltf_primitives.append({
+            "attributes": attributes,
+            "indices": add_accessor(primitive["indices"].astype(np.uint32), "SCALAR", 34963),
+            "material": primitive["material"],
+            "mode": 4,
+        })
+
+    gltf_images = []
+    for image_path in images:
+        with open(image_path, "rb") as f:
+            data = f.read()
+        mime_type = "image/png" if data[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
+        gltf_images.append({"bufferView": add_view(data), "mimeType": mime_type})
+
+    gltf_materials = []
+    for material in materials:
+        pbr = {"metallicFactor": material["metallic"], "roughnessFactor": material["roughness"]}
+        if material.get("image") is not None:
+            pbr["baseColorTexture"] = {"index": material["image"]}
+        gltf_materials.append({"name": material["name"], "doubleSided": True, "pbrMetallicRoughness": pbr})
+
+    gltf = {
+        "asset": {"version": "2.0", "generator": "3D-GLB glb_export.py"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0, "name": mesh_name}],
+        "meshes": [{"name": mesh_name, "primitives": gltf_primitives}],
+        "materials": gltf_materials,
+        "buffers": [{"byteLength": 0}],
+        "bufferViews": buffer_views,
+        "accessors": accessors,
+    }
+    if gltf_images:
+        gltf["images"] = gltf_images
+        gltf["samplers"] = [{"magFilter": 9729, "minFilter": 9987, "wrapS": 10497, "wrapT": 10497}]
+        gltf["textures"] = [{"sampler": 0, "source": index} for index in range(len(gltf_images))]
+
+    while len(binary) % 4:
+        binary.append(0)
+    gltf["buffers"][0]["byteLength"] = len(binary)
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * (-len(json_chunk) % 4)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<III", 0x46546C67, 2, 12 + 8 + len(json_chunk) + 8 + len(binary)))
+        f.write(struct.pack("<II", len(json_chunk), 0x4E4F534A))
+        f.write(json_chunk)
+        f.write(struct.pack("<II", len(binary), 0x004E4942))
+        f.write(binary)
+
+
+# ---------------------------------------------------------------- assembly
+def body_material(gender, material_name):
+    """Material table entry of one body material: texture file name, roughness and metallic."""
+    config = GENDER_CONFIGS[gender]
+    return {
+        "name": material_name or "body",
+        "texture": config["body_textures"].get(material_name),
+        "roughness": config["roughness"],
+        "metallic": config["metallic"],
+    }
+
+
+def prepare_body(body, gender):
+    """Turns the body template of `gender`, read by `load_obj`, into what `export_avatar` needs.
+
+    Returns `positions`, the neck `seam` vertex indices and one glTF-ready
+    primitive per material, with its `body_material` entry under `material`.
+    Everything depends on the template only, so body_bake.py stores it.
+    """
+    triangles = np.concatenate([corners[:, :, 0] for corners in body["groups"].values()])
+    # near-duplicate neck seam vertices are snapped together, as blender_merging.py welds them
+    positions = body["positions"].copy()
+    seam = seam_vertices(open_edges(triangles), positions)
+    duplicates, targets = near_duplicates(positions, seam)
+    positions[duplicates] = positions[targets]
+    primitives = []
+    for material_name, corners in body["groups"].items():
+        primitive = build_primitive(positions, body["uvs"], body["normals"], corners)
+        primitive["material"] = body_material(gender, material_name)
+        primitives.append(primitive)
+    return {
+        "positions": positions,
+        "seam": seam,
+        "primitives": primitives,
+    }
+
+
+def export_avatar(gender, head, head_texture, body_texture_dir, output_path, body=None):
+    """Builds the avatar GLB from the DECA head and the body template of `gender`.
+
+    head: dict shaped like `load_obj` output (positions, uvs, normals, groups),
+    e.g. arrays straight from DECA; body: a `prepare_body` dict, taken from the
+    body_bake.py cache when omitted.
+    """
+    gender = gender.lower()
+    if gender not in GENDER_CONFIGS:
+        raise ValueError("Invalid gender. Use 'male' or 'female'.")
+    if body is None:
+        from body_bake import load_baked_body
+        body = load_baked_body(gender)
+
+    head_positions = transform_head(head["positions"], gender)
+    head_triangles = np.concatenate([corners[:, :, 0] for corners in head["groups"].values()])
+    head_seam = seam_vertices(open_edges(head_triangles), head_positions)
+    # the body seam never changes: body_bake.py builds its KD-tree once with the cached body
+    welder = body.get("welder")
+    if welder is None:
+        welder = SeamWelder(body["positions"], body["seam"])
+    head_ids, _ = welder.weld(head_positions, head_seam, body["positions"])
+    duplicates, targets = near_duplicates(head_positions, np.setdiff1d(head_seam, head_ids))
+    head_positions[duplicates] = head_positions[targets]
+    print(f"✅ Welded {len(head_ids) + len(duplicates)} neck seam vertices ({len(head_ids)} head onto body).")
+
+    images = [head_texture]
+    materials = [dict(HEAD_MATERIAL, image=0)]
+    primitives = []
+    for corners in head["groups"].values():
+        primitive = build_primitive(head_positions, head["uvs"], head["normals"], corners)
+        primitive["material"] = 0
+        primitives.append(primitive)
+
+    for body_primitive in body["primitives"]:
+        material = body_primitive["material"]
+        image = None
+        if material["texture"]:
+            images.append(os.path.join(body_texture_dir, material["texture"]))
+            image = len(images) - 1
+        else:
+            print(f"❌ No texture mapped for material {material['name']}")
+        materials.append({"name": material["name"], "image": image,
+                          "roughness": material["roughness"], "metallic": material["metallic"]})
+        primitives.append(dict(body_primitive, material=len(materials) - 1))
+
+    write_glb(output_path, primitives, materials, images)
+    print(f"✅ Exported GLB to {output_path}")
+    return output_path
+
+
+def export_avatar_from_dir(gender, head_dir, head_texture, body_texture_dir, output_dir, heads=None):
+    """Same inputs as blender_merging.py: the first head OBJ of `head_dir` gives the GLB its name.
+
+    heads: optional {name: DECA head arrays} (`head_from_arrays` arguments, as returned by
+    DECA's demo_reconstruct.main); the head named like the OBJ is used instead of parsing it.
+    """
+    obj_files = glob.glob(os.path.join(head_dir, "*.obj"))
+    if not obj_files:
+        raise FileNotFoundError("❌ No .obj file found in the head folder.")
+    head_path = obj_files[0]
+    name = os.path.splitext(os.path.basename(head_path))[0]
+    output_path = os.path.join(output_dir, f"{name}_model.glb")
+    head = head_from_arrays(**heads[name]) if heads and name in heads else load_obj(head_path)
+    return export_avatar(gender, head, head_texture, body_texture_dir, output_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble the avatar GLB without Blender")
+    parser.add_argument("--g", type=str, required=True, help="Specify gender: 'male' or 'female'")
+    parser.add_argument("--head_dir", default=abs_path("ready to use model/head"), help="Folder holding the DECA head .obj")
+    parser.add_argument("--head_texture", default=abs_path("ready to use model/head/final_texture.jpeg"), help="Final head texture")
+    parser.add_argument("--body_texture_dir", default=abs_path("Texture_body/output"), help="Folder holding the recolored body textures")
+    parser.add_argument("--output_dir", default=abs_path("output"), help="Folder for the exported .glb")
+    args = parser.parse_args()
+    export_avatar_from_dir(args.g, args.head_dir, args.head_texture, args.body_texture_dir, args.output_dir)
@@ -0,0 +1,114 @@
+import numpy as np
+
+# KD-tree backends, best first: scipy (both Python envs), mathutils (inside Blender), plain numpy
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+try:
+    from mathutils.kdtree import KDTree as BlenderKDTree
+except ImportError:
+    BlenderKDTree = None
+
+# neck seam: open edges in this height band get welded, like the former remove_doubles pass
+SEAM_Z_RANGE = (7.0, 8.0)
+SEAM_THRESHOLD = 0.075
+
+
+def open_edges(triangles):
+    """Edges (E, 2) used by exactly one triangle of a (T, 3) index array."""
+    edges = np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]])
+    edges = np.sort(edges, axis=1)
+    unique, counts = np.unique(edges, axis=0, return_counts=True)
+    return unique[counts == 1]
+
+
+def seam_vertices(edges, positions, z_range=SEAM_Z_RANGE, up_axis=1):
+    """Vertex ids of the open `edges` lying entirely in the `z_range` height band.
+
+    Height is axis 1 in glTF/OBJ space (Y-up) and axis 2 inside Blender (Z-up).
+    """
+    heights = np.asarray(positions)[edges, up_axis]
+    in_range = np.all((heights >= z_range[0]) & (heights <= z_range[1]), axis=1)
+    return np.unique(edges[in_range])
+
+
+def near_duplicates(positions, ids, threshold=SEAM_THRESHOLD):
+    """Near-duplicate vertices among `ids`, merged greedily like remove_doubles: each vertex
+    not merged yet is kept and takes every later one within `threshold`.
+
+    Returns (merged vertex ids, the kept vertex id each one merges into).
+    """
+    ids = np.asarray(ids)
+    points = np.asarray(positions, dtype=np.float64)[ids]
+    close = np.linalg.norm(points[:, None, :] - points[None, :, :], axis=2) <= threshold
+    target = np.arange(len(ids))
+    for i in range(len(ids)):
+        if target[i] == i:
+            later = close[i] & (target == np.arange(len(ids)))
+            later[:i + 1] = False
+            target[later] = i
+    merged = target != np.arange(len(ids))
+    return ids[merged], ids[target[merged]]
+
+
+class SeamWelder:
+    """Nearest-vertex lookups against the body's neck boundary loop.
+
+    The body topology never changes, so build one welder per body template
+    and reuse it: each weld only queries the head's neck vertices.
+    """
+
+    def __init__(self, body_positions, body_seam):
+        self.body_seam = np.asarray(body_seam)
+        self.points = np.asarray(body_positions, dtype=np.float64)[self.body_seam]
+        if cKDTree is not None:
+            self.tree = cKDTree(self.points)
+        elif BlenderKDTree is not None:
+            self.tree = BlenderKDTree(len(self.points))
+            for i, point in enumerate(self.points):
+                self.tree.insert(point.tolist(), i)
+            self.tree.balance()
+        else:
+            self.tree = None
+
+    def nearest(self, points):
+        """Distance to and position in `body_seam` of the closest seam vertex, per point."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if len(self.points) == 0:
+            return np.full(len(points), np.inf), np.zeros(len(points), dtype=np.int64)
+        if cKDTree is not None:
+            distances, nearest = self.tree.query(points)
+            return distances, nearest
+        if BlenderKDTree is not None:
+            found = [self.tree.find(point.tolist()) for point in points]
+            return np.array([distance for _, _, distance in found]), np.array([i for _, i, _ in found])
+        distances = np.linalg.norm(points[:, None, :] - self.points[None, :, :], axis=2)
+        nearest = distances.argmin(axis=1)
+        return distances[np.arange(len(points)), nearest], nearest
+
+    def match(self, head_positions, head_seam, threshold=SEAM_THRESHOLD):
+        """Pairs head neck vertices with the closest body seam vertex within `threshold`.
+
+        Returns (head vertex ids, body vertex ids) of the pairs to weld.
+        """
+        head_seam = np.asarray(head_seam)
+        if len(head_seam) == 0:
+            return head_seam, head_seam
+        distances, nearest = self.nearest(np.asarray(head_positions)[head_seam])
+        close = distances <= threshold
+        return head_seam[close], self.body_seam[nearest[close]]
+
+    def weld(self, head_positions, head_seam, body_positions, threshold=SEAM_THRESHOLD):
+        """Snaps the matched head vertices onto their body vertex, in place; returns the pairs."""
+        head_ids, body_ids = self.match(head_positions, head_seam, threshold)
+        head_positions[head_ids] = np.asarray(body_positions)[body_ids]
+        return head_ids, body_ids
+
+
+def welded_indices(indices, head_ids, body_ids, body_offset):
+    """Index buffer of a joined head+body vertex array with every welded head vertex
+    pointing at its body vertex (stored after the head, from `body_offset` on)."""
+    remap = np.arange(max(int(np.max(indices)) + 1, 1), dtype=np.int64)
+    remap[head_ids] = np.asarray(body_ids) + body_offset
+    return remap[indices]
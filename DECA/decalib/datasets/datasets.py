@@ -45,12 +45,28 @@ def video2sequence(video_path, sample_step=10):
     print('video frames are stored in {}'.format(videofolder))
     return imagepath_list
 
+def collate_test_data(items):
+    ''' batches TestData items; original images keep their own sizes and stay a list
+    '''
+    return {'image': torch.stack([item['image'] for item in items]),
+            'imagename': [item['imagename'] for item in items],
+            'tform': torch.stack([item['tform'] for item in items]),
+            'original_image': [item['original_image'] for item in items],
+            }
+
 class TestData(Dataset):
-    def __init__(self, testpath, iscrop=True, crop_size=224, scale=1.25, face_detector='fan', sample_step=10):
+    def __init__(self, testpath, iscrop=True, crop_size=224, scale=1.25, face_detector='fan', sample_step=10, landmarks=None):
         '''
-            testpath: folder, imagepath_list, image path, video path
+            testpath: folder, imagepath_list, image path, video path,
+                      or a dict {imagename: HxWxC uint8 RGB(A) array} of images already in memory
+            landmarks: optional {imagename: (68, 2) keypoints}, used for cropping instead of the detector
         '''
-        if isinstance(testpath, list):
+        self.images = None
+        self.landmarks = landmarks or {}
+        if isinstance(testpath, dict):
+            self.images = testpath
+            self.imagepath_list = list(testpath)
+        elif isinstance(testpath, list):
             self.imagepath_list = testpath
         elif os.path.isdir(testpath): 
             self.imagepath_list = glob(testpath + '/*.jpg') +  glob(testpath + '/*.png') + glob(testpath + '/*.bmp')
@@ -67,8 +83,11 @@ class TestData(Dataset):
         self.scale = scale
         self.iscrop = iscrop
         self.resolution_inp = crop_size
-        if face_detector == 'fan':
-            self.face_detector = detectors.FAN()
+        if not isinstance(face_detector, str):
+            # an already loaded detector, shared across datasets by a resident worker
+            self.face_detector = face_detector
+        elif face_detector == 'fan':
+            self.face_detector = detectors.LazyDetector(detectors.FAN)
         # elif face_detector == 'mtcnn':
         #     self.face_detector = detectors.MTCNN()
         else:
@@ -78,6 +97,21 @@ class TestData(Dataset):
     def __len__(self):
         return len(self.imagepath_list)
 
+    def load_kpt(self, imagepath, imagename):
+        ''' keypoints given in memory, or as txt file / mat file (for AFLW2000) next to the image; None otherwise
+        '''
+        if imagename in self.landmarks:
+            return np.asarray(self.landmarks[imagename])
+        if self.images is not None:
+            return None
+        kpt_matpath = os.path.splitext(imagepath)[0]+'.mat'
+        kpt_txtpath = os.path.splitext(imagepath)[0]+'.txt'
+        if os.path.exists(kpt_matpath):
+            return scipy.io.loadmat(kpt_matpath)['pt3d_68'].T
+        if os.path.exists(kpt_txtpath):
+            return np.loadtxt(kpt_txtpath)
+        return None
+
     def bbox2point(self, left, right, top, bottom, type='bbox'):
         ''' bbox from detector and landmarks are different
         '''
@@ -93,8 +127,12 @@ class TestData(Dataset):
 
     def __getitem__(self, index):
         imagepath = self.imagepath_list[index]
-        imagename = os.path.splitext(os.path.split(imagepath)[-1])[0]
-        image = np.array(imread(imagepath))
+        if self.images is not None:
+            imagename = imagepath
+            image = np.array(self.images[imagename])
+        else:
+            imagename = os.path.splitext(os.path.split(imagepath)[-1])[0]
+            image = np.array(imread(imagepath))
         if len(image.shape) == 2:
             image = image[:,:,None].repeat(1,1,3)
         if len(image.shape) == 3 and image.shape[2] > 3:
@@ -102,16 +140,9 @@ class TestData(Dataset):
 
         h, w, _ = image.shape
         if self.iscrop:
-            # provide kpt as txt file, or mat file (for AFLW2000)
-            kpt_matpath = os.path.splitext(imagepath)[0]+'.mat'
-            kpt_txtpath = os.path.splitext(imagepath)[0]+'.txt'
-            if os.path.exists(kpt_matpath):
-                kpt = scipy.io.loadmat(kpt_matpath)['pt3d_68'].T        
-                left = np.min(kpt[:,0]); right = np.max(kpt[:,0]); 
-                top = np.min(kpt[:,1]); bottom = np.max(kpt[:,1])
-                old_size, center = self.bbox2point(left, right, top, bottom, type='kpt68')
-            elif os.path.exists(kpt_txtpath):
-                kpt = np.loadtxt(kpt_txtpath)
+            # provide kpt in memory, as txt file, or mat file (for AFLW2000)
+            kpt = self.load_kpt(imagepath, imagename)
+            if kpt is not None:
                 left = np.min(kpt[:,0]); right = np.max(kpt[:,0]); 
                 top = np.min(kpt[:,1]); bottom = np.max(kpt[:,1])
                 old_size, center = self.bbox2point(left, right, top, bottom, type='kpt68')
@@ -13,9 +13,33 @@
 # For comments or questions, please email us at deca@tue.mpg.de
 # For commercial licensing contact, please contact ps-license@tuebingen.mpg.de
 
+import threading
 import numpy as np
 import torch
 
+class LazyDetector(object):
+    ''' builds the detector with `loader()` on the first run, so it is never loaded
+    when every image comes with its keypoints
+    '''
+    def __init__(self, loader):
+        self.loader = loader
+        self.detector = None
+        self.lock = threading.Lock()
+
+    def run(self, image):
+        with self.lock:
+            if self.detector is None:
+                self.detector = self.loader()
+        return self.detector.run(image)
+
+    # DataLoader workers get a pickled copy of the dataset (always on Windows' spawn):
+    # locks do not pickle, so each copy gets its own lock and loads its own detector
+    def __getstate__(self):
+        return {'loader': self.loader}
+
+    def __setstate__(self, state):
+        self.__init__(state['loader'])
+
 class FAN(object):
     def __init__(self):
         import face_alignment
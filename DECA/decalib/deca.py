@@ -88,7 +88,7 @@ class DECA(nn.Module):
         model_path = self.cfg.pretrained_modelpath
         if os.path.exists(model_path):
             print(f'trained model found. load {model_path}')
-            checkpoint = torch.load(model_path)
+            checkpoint = torch.load(model_path, map_location=self.device)
             self.checkpoint = checkpoint
             util.copy_state_dict(self.E_flame.state_dict(), checkpoint['E_flame'])
             util.copy_state_dict(self.E_detail.state_dict(), checkpoint['E_detail'])
@@ -263,6 +263,46 @@ class DECA(nn.Module):
         else:
             return opdict
 
+    def decode_lean(self, codedict):
+        ''' production mode: computes only what save_obj needs
+        (verts, uv_texture_gt, uv_detail_normals, normals, displacement_map);
+        skips the image-space render passes, landmark projection and visualizations.
+        outputs are identical to the same keys of decode(codedict)
+        '''
+        images = codedict['images']
+        batch_size = images.shape[0]
+
+        verts, _, _ = self.flame(shape_params=codedict['shape'], expression_params=codedict['exp'], pose_params=codedict['pose'])
+        if self.cfg.model.use_tex:
+            albedo = self.flametex(codedict['tex'])
+        else:
+            albedo = torch.zeros([batch_size, 3, self.uv_size, self.uv_size], device=images.device)
+        trans_verts = util.batch_orth_proj(verts, codedict['cam']); trans_verts[:,:,1:] = -trans_verts[:,:,1:]
+        normals = util.vertex_normals(verts, self.render.faces.expand(batch_size, -1, -1))
+
+        uv_z = self.D_detail(torch.cat([codedict['pose'][:,3:], codedict['exp'], codedict['detail']], dim=1))
+        uv_detail_normals = self.displacement2normal(uv_z, verts, normals)
+        opdict = {
+            'verts': verts,
+            'normals': normals,
+            'uv_detail_normals': uv_detail_normals,
+            'displacement_map': uv_z+self.fixed_uv_dis[None,None,:,:],
+        }
+
+        ## extract texture
+        uv_pverts = self.render.world2uv(trans_verts)
+        uv_gt = F.grid_sample(images, uv_pverts.permute(0,2,3,1)[:,:,:,:2], mode='bilinear', align_corners=False)
+        if self.cfg.model.use_tex:
+            uv_texture = albedo*self.render.add_SHlight(uv_detail_normals, codedict['light'])
+            if self.cfg.model.extract_tex:
+                uv_texture_gt = uv_gt[:,:3,:,:]*self.uv_face_eye_mask + (uv_texture[:,:3,:,:]*(1-self.uv_face_eye_mask))
+            else:
+                uv_texture_gt = uv_texture[:,:3,:,:]
+        else:
+            uv_texture_gt = uv_gt[:,:3,:,:]*self.uv_face_eye_mask + (torch.ones_like(uv_gt[:,:3,:,:])*(1-self.uv_face_eye_mask)*0.7)
+        opdict['uv_texture_gt'] = uv_texture_gt
+        return opdict
+
     def visualize(self, visdict, size=224, dim=2):
         '''
         image range should be [0,1]
@@ -282,17 +322,27 @@ class DECA(nn.Module):
         grid_image = np.minimum(np.maximum(grid_image, 0), 255).astype(np.uint8)
         return grid_image
     
+    def head_mesh(self, opdict, i=0):
+        ''' coarse mesh arrays of item `i`, as save_obj writes them:
+        vertices [nv, 3], faces [nf, 3], uvcoords [nuv, 2] (raw), uvfaces [nf, 3]
+        '''
+        return {
+            'vertices': opdict['verts'][i].cpu().numpy(),
+            'faces': self.render.faces[0].cpu().numpy(),
+            'uvcoords': self.render.raw_uvcoords[0].cpu().numpy(),
+            'uvfaces': self.render.uvfaces[0].cpu().numpy(),
+        }
+
     def save_obj(self, filename, opdict):
         '''
         vertices: [nv, 3], tensor
         texture: [3, h, w], tensor
         '''
         i = 0
-        vertices = opdict['verts'][i].cpu().numpy()
-        faces = self.render.faces[0].cpu().numpy()
+        mesh = self.head_mesh(opdict, i)
+        vertices, faces = mesh['vertices'], mesh['faces']
         texture = util.tensor2image(opdict['uv_texture_gt'][i])
-        uvcoords = self.render.raw_uvcoords[0].cpu().numpy()
-        uvfaces = self.render.uvfaces[0].cpu().numpy()
+        uvcoords, uvfaces = mesh['uvcoords'], mesh['uvfaces']
         # save coarse mesh, with texture and normal map
         normal_map = util.tensor2image(opdict['uv_detail_normals'][i]*0.5 + 0.5)
         util.write_obj(filename, vertices, faces, 
@@ -0,0 +1,288 @@
+'''
+CPU version of standard_rasterize_cuda.standard_rasterize, for machines without CUDA.
+
+Same inputs and buffers as the CUDA kernel (face vertices in pixel space, depth,
+triangle id and barycentric buffers filled in place), same per-pixel arithmetic,
+vectorized with PyTorch instead of one thread per face:
+    1. faces are binned into TILE_SIZE x TILE_SIZE tiles of the image by their bounding box
+    2. every (face, tile) pair tests the pixels of its tile that lie in the face bounding box
+    3. the closest face of each pixel wins; on equal depth the lowest face id
+       (the CUDA kernel leaves such ties to whichever thread writes last)
+
+Parity check against fixtures recorded from the CUDA kernel (run from DECA/):
+    PYTHONPATH=.. python -m decalib.utils.rasterizer.standard_rasterize_cpu --record   # on a CUDA machine
+    python -m decalib.utils.rasterizer.standard_rasterize_cpu                          # anywhere
+Without the fixtures the check fails, as CUDA parity is then unverified;
+--reference-only checks against the face-by-face reference alone.
+'''
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import torch
+
+TILE_SIZE = 8
+# (face, tile) pairs rasterized at once, bounds the memory to ~CHUNK_SIZE*TILE_SIZE**2 pixel tests
+CHUNK_SIZE = 65536
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'standard_rasterize_cuda.npz')
+
+
+def _setup_faces(face_vertices, h, w):
+    ''' per-face terms of the kernel's barycentric_weight and the clipped pixel bounding box
+    face_vertices: [N, 3, 3]
+    '''
+    p0, p1, p2 = face_vertices[:, 0, :2], face_vertices[:, 1, :2], face_vertices[:, 2, :2]
+    v0 = p2 - p0
+    v1 = p1 - p0
+    dot00 = v0[:, 0]*v0[:, 0] + v0[:, 1]*v0[:, 1]
+    dot01 = v0[:, 0]*v1[:, 0] + v0[:, 1]*v1[:, 1]
+    dot11 = v1[:, 0]*v1[:, 0] + v1[:, 1]*v1[:, 1]
+    deno = dot00*dot11 - dot01*dot01
+    # degenerate faces get u = v = 0, i.e. weights (1, 0, 0) over their whole bounding box, as in the kernel
+    inverse_deno = torch.where(deno == 0, torch.zeros_like(deno), 1/deno)
+
+    xy = face_vertices[:, :, :2]
+    xy_min = torch.ceil(xy.min(1)[0])
+    xy_max = torch.floor(xy.max(1)[0])
+    size = torch.tensor([w, h], dtype=xy.dtype, device=xy.device)
+    xy_min = torch.max(xy_min, torch.zeros_like(xy_min))
+    xy_max = torch.min(xy_max, size - 1)
+    # NaN vertices fail these comparisons too
+    visible = (xy_min <= xy_max).all(1)
+    return p0, v0, v1, dot00, dot01, dot11, inverse_deno, xy_min, xy_max, visible
+
+
+def standard_rasterize(face_vertices, depth_buffer, triangle_buffer, baryw_buffer, h, w,
+                       tile_size=TILE_SIZE, chunk_size=CHUNK_SIZE):
+    ''' drop-in for standard_rasterize_cuda.standard_rasterize
+    face_vertices: [bz, ntri, 3, 3], x and y in pixels
+    depth_buffer: [bz, h, w], triangle_buffer: [bz, h, w] int, baryw_buffer: [bz, h, w, 3]
+    returns the updated buffers, like the extension
+    '''
+    bz, ntri = face_vertices.shape[:2]
+    device = face_vertices.device
+    face_vertices = face_vertices.reshape(bz*ntri, 3, 3)
+    depth_flat = depth_buffer.view(-1)
+    triangle_flat = triangle_buffer.view(-1)
+    baryw_flat = baryw_buffer.view(-1, 3)
+
+    p0, v0, v1, dot00, dot01, dot11, inverse_deno, xy_min, xy_max, visible = _setup_faces(face_vertices, h, w)
+    faces = visible.nonzero()[:, 0]
+    if faces.numel() == 0:
+        return [depth_buffer, triangle_buffer, baryw_buffer]
+    bbox_min = xy_min[faces].long()
+    bbox_max = xy_max[faces].long()
+
+    # binning: every tile touched by a face bounding box, in face order
+    tile_min = bbox_min // tile_size
+    tile_count = bbox_max // tile_size - tile_min + 1
+    pair_count = tile_count[:, 0]*tile_count[:, 1]
+    pair_face = torch.repeat_interleave(torch.arange(faces.numel(), device=device), pair_count)
+    pair_offset = torch.repeat_interleave(torch.cumsum(pair_count, 0) - pair_count, pair_count)
+    local = torch.arange(pair_face.numel(), device=device) - pair_offset
+    tiles_x = tile_count[pair_face, 0]
+    corner = (tile_min[pair_face] + torch.stack([local % tiles_x, local // tiles_x], 1))*tile_size
+    # per pair: tile corner x, y, its pixel id and the face
+    pairs = torch.stack([corner[:, 0], corner[:, 1], (faces[pair_face] // ntri)*h*w + corner[:, 1]*w + corner[:, 0],
+                         pair_face], 0)
+
+    # per face: p0 (2), v0 (2), v1 (2), dot00, dot01, dot11, 1/deno, z (3)
+    table = torch.cat([p0, v0, v1, torch.stack([dot00, dot01, dot11, inverse_deno], 1),
+                       face_vertices[:, :, 2]], 1)[faces].t().contiguous()
+    offsets = torch.arange(tile_size, device=device)
+    for start in range(0, pair_face.numel(), chunk_size):
+        chunk = pairs[:, start:start + chunk_size]
+        low, high = bbox_min[chunk[3]], bbox_max[chunk[3]]
+        x = chunk[0, :, None] + offsets
+        y = chunk[1, :, None] + offsets
+        in_x = (x >= low[:, 0:1]) & (x <= high[:, 0:1])
+        in_y = (y >= low[:, 1:2]) & (y <= high[:, 1:2])
+        pair_index, row, column = (in_y[:, :, None] & in_x[:, None, :]).nonzero(as_tuple=True)
+        pair = chunk.index_select(1, pair_index)
+        face = pair[3]
+        t = table.index_select(1, face)
+
+        # barycentric_weight, term by term
+        v2x = (pair[0] + column).to(t.dtype) - t[0]
+        v2y = (pair[1] + row).to(t.dtype) - t[1]
+        dot02 = t[2]*v2x + t[3]*v2y
+        dot12 = t[4]*v2x + t[5]*v2y
+        u = (t[8]*dot02 - t[7]*dot12)*t[9]
+        v = (t[6]*dot12 - t[7]*dot02)*t[9]
+        w0 = 1 - u - v
+        zp = 1/(w0/t[10] + v/t[11] + u/t[12])
+        inside = ((u >= 0) & (v >= 0) & (w0 > 0)).nonzero()[:, 0]
+        bw = torch.stack([w0, v, u], 1).index_select(0, inside)
+        zp = zp.index_select(0, inside)
+        face = face.index_select(0, inside)
+        pixel_id = (pair[2] + row*w + column).index_select(0, inside)
+
+        # closest candidate of each pixel: stable sorts keep the face order among equal depths
+        order = torch.sort(zp, stable=True)[1]
+        order = order[torch.sort(pixel_id[order], stable=True)[1]]
+        first = torch.ones_like(order, dtype=torch.bool)
+        first[1:] = pixel_id[order[1:]] != pixel_id[order[:-1]]
+        winner = order[first]
+        # strictly closer than the buffer: earlier chunks hold lower face ids
+        winner = winner[zp[winner] < depth_flat[pixel_id[winner]]]
+        target = pixel_id[winner]
+        depth_flat[target] = zp[winner]
+        triangle_flat[target] = (faces[face[winner]] % ntri).to(triangle_flat.dtype)
+        baryw_flat[target] = bw[winner]
+    return [depth_buffer, triangle_buffer, baryw_buffer]
+
+
+def reference_rasterize(face_vertices, depth_buffer, triangle_buffer, baryw_buffer, h, w):
+    ''' the CUDA kernel run one face after the other (same tie rule as standard_rasterize), for the parity check
+    '''
+    bz, ntri = face_vertices.shape[:2]
+    for b in range(bz):
+        p0, v0, v1, dot00, dot01, dot11, inverse_deno, xy_min, xy_max, visible = \
+            _setup_faces(face_vertices[b], h, w)
+        for i in visible.nonzero()[:, 0].tolist():
+            x_min, y_min = xy_min[i].long().tolist()
+            x_max, y_max = xy_max[i].long().tolist()
+            y, x = torch.meshgrid(torch.arange(y_min, y_max + 1), torch.arange(x_min, x_max + 1), indexing='ij')
+            v2x = x.to(face_vertices.dtype) - p0[i, 0]
+            v2y = y.to(face_vertices.dtype) - p0[i, 1]
+            dot02 = v0[i, 0]*v2x + v0[i, 1]*v2y
+            dot12 = v1[i, 0]*v2x + v1[i, 1]*v2y
+            u = (dot11[i]*dot02 - dot01[i]*dot12)*inverse_deno[i]
+            v = (dot00[i]*dot12 - dot01[i]*dot02)*inverse_deno[i]
+            bw = torch.stack([1 - u - v, v, u], -1)
+            face_z = face_vertices[b, i, :, 2]
+            zp = 1/(bw[..., 0]/face_z[0] + bw[..., 1]/face_z[1] + bw[..., 2]/face_z[2])
+            update = (bw[..., 2] >= 0) & (bw[..., 1] >= 0) & (bw[..., 0] > 0) & \
+                (zp < depth_buffer[b, y_min:y_max + 1, x_min:x_max + 1])
+            depth_buffer[b, y_min:y_max + 1, x_min:x_max + 1][update] = zp[update]
+            triangle_buffer[b, y_min:y_max + 1, x_min:x_max + 1][update] = i
+            baryw_buffer[b, y_min:y_max + 1, x_min:x_max + 1][update] = bw[update]
+    return [depth_buffer, triangle_buffer, baryw_buffer]
+
+
+def make_scenes():
+    ''' {name: (face_vertices [bz, ntri, 3, 3] in pixels, h, w)}: a FLAME-sized mesh, a UV-like grid,
+    and a triangle soup with overlaps, shared depths, degenerate and off-screen faces
+    '''
+    generator = torch.Generator().manual_seed(0)
+    scenes = {}
+
+    def grid_mesh(n, h, w, bz):
+        ys, xs = torch.meshgrid(torch.linspace(-0.1, 1.1, n), torch.linspace(-0.05, 0.95, n), indexing='ij')
+        triangles = []
+        for y in range(n - 1):
+            for x in range(n - 1):
+                triangles.append([y*n + x, (y + 1)*n + x, y*n + x + 1])
+                triangles.append([y*n + x + 1, (y + 1)*n + x, (y + 1)*n + x + 1])
+        triangles = torch.tensor(triangles)
+        batch = []
+        for b in range(bz):
+            wave = torch.rand(2, generator=generator)
+            xx = xs*w + 3*torch.sin(6*ys + wave[0])
+            yy = ys*h + 3*torch.cos(5*xs + wave[1])
+            zz = 50 + 20*torch.sin(4*xs)*torch.cos(3*ys)
+            verts = torch.stack([xx, yy, zz], -1).reshape(-1, 3)
+            batch.append(verts[triangles])
+        return torch.stack(batch)
+
+    scenes['mesh_224'] = (grid_mesh(72, 224, 224, 2), 224, 224)
+    scenes['uv_256'] = (grid_mesh(40, 256, 256, 1), 256, 256)
+
+    h, w, ntri = 96, 128, 400
+    centers = torch.rand(ntri, 1, 2, generator=generator)*torch.tensor([w*1.2, h*1.2]) - torch.tensor([w*0.1, h*0.1])
+    sizes = torch.rand(ntri, 1, 1, generator=generator)**3*40 + 0.5
+    xy = centers + (torch.rand(ntri, 3, 2, generator=generator) - 0.5)*sizes
+    zz = torch.randint(1, 8, (ntri, 1, 1), generator=generator).float().repeat(1, 3, 1)*10
+    zz[::3] = zz[::3] + torch.rand(len(zz[::3]), 3, 1, generator=generator)*5
+    soup = torch.cat([xy, zz], -1)
+    soup[::17, 2] = soup[::17, 0]
+    soup[::29] = torch.round(soup[::29])
+    scenes['soup_96x128'] = (soup[None], h, w)
+    return scenes
+
+
+def empty_buffers(face_vertices, h, w):
+    ''' the buffers StandardRasterizer.forward starts from '''
+    bz = face_vertices.shape[0]
+    device = face_vertices.device
+    return (torch.zeros([bz, h, w]).float().to(device) + 1e6,
+            torch.zeros([bz, h, w]).int().to(device) - 1,
+            torch.zeros([bz, h, w, 3]).float().to(device))
+
+
+def compare(name, expected, result, max_mismatch=1e-3, tolerance=1e-4):
+    ''' buffers agree up to float rounding; the triangle id (or coverage) may only differ on a few
+    pixels, where faces tie in depth or a pixel center lies on an edge
+    '''
+    expected_depth, expected_triangle, expected_baryw = [np.asarray(x) for x in expected]
+    depth, triangle, baryw = [x.cpu().numpy() for x in result]
+    same_face = triangle == expected_triangle
+    matched = same_face & (expected_triangle >= 0)
+    depth_error, baryw_error = 0., 0.
+    if matched.any():
+        depth_error = (np.abs(depth - expected_depth)[matched]/np.abs(expected_depth[matched])).max()
+        baryw_error = np.abs(baryw - expected_baryw)[matched].max()
+    mismatch = (~same_face).mean()
+    ok = depth_error < tolerance and baryw_error < tolerance and mismatch <= max_mismatch
+    print(f"{'✅' if ok else '❌'} {name}: {(expected_triangle >= 0).mean()*100:.1f}% covered, triangle id differs on "
+          f"{mismatch*100:.3f}% of pixels, depth error {depth_error:.2e} (relative), "
+          f"barycentric error {baryw_error:.2e}")
+    return ok
+
+
+def run_cuda(face_vertices, h, w):
+    from prebuilt_extensions import EXTENSIONS, load_extension
+    sources, build_kwargs = EXTENSIONS['standard_rasterize_cuda']
+    standard_rasterize_cuda = load_extension('standard_rasterize_cuda', sources, **build_kwargs)
+    face_vertices = face_vertices.cuda()
+    buffers = empty_buffers(face_vertices, h, w)
+    standard_rasterize_cuda.standard_rasterize(face_vertices, *buffers, h, w)
+    return [x.cpu() for x in buffers]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parity check and timing of the CPU standard rasterizer')
+    parser.add_argument('--record', action='store_true',
+                        help='rasterize the scenes with the CUDA kernel and save its buffers as fixtures')
+    parser.add_argument('--fixtures', default=FIXTURES_PATH, help='fixture file (.npz)')
+    parser.add_argument('--repeat', default=5, type=int, help='timed runs per scene')
+    parser.add_argument('--reference-only', action='store_true',
+                        help='pass without CUDA fixtures, checking against the face-by-face reference only')
+    args = parser.parse_args()
+
+    scenes = make_scenes()
+    if args.record:
+        fixtures = {}
+        for name, (face_vertices, h, w) in scenes.items():
+            for key, value in zip(['depth', 'triangle', 'baryw'], run_cuda(face_vertices, h, w)):
+                fixtures[f'{name}/{key}'] = value.numpy()
+            fixtures[f'{name}/face_vertices'] = face_vertices.numpy()
+        os.makedirs(os.path.dirname(args.fixtures), exist_ok=True)
+        np.savez_compressed(args.fixtures, **fixtures)
+        print(f'✅ Recorded CUDA fixtures for {", ".join(scenes)} in {args.fixtures}')
+
+    fixtures = np.load(args.fixtures) if os.path.exists(args.fixtures) else None
+    ok = True
+    if fixtures is None:
+        print(f'{"⚠️" if args.reference_only else "❌"} No CUDA fixtures at {args.fixtures}, parity with the CUDA kernel '
+              f'is NOT verified (record them with --record on a CUDA machine); checking against the face-by-face reference only')
+        ok = args.reference_only
+    for name, (face_vertices, h, w) in scenes.items():
+        if fixtures is not None:
+            face_vertices = torch.from_numpy(fixtures[f'{name}/face_vertices'])
+        result = standard_rasterize(face_vertices, *empty_buffers(face_vertices, h, w), h, w)
+        reference = reference_rasterize(face_vertices, *empty_buffers(face_vertices, h, w), h, w)
+        ok &= compare(f'{name} vs reference', reference, result, max_mismatch=0, tolerance=1e-6)
+        if fixtures is not None:
+            expected = [fixtures[f'{name}/{key}'] for key in ['depth', 'triangle', 'baryw']]
+            ok &= compare(f'{name} vs CUDA', expected, result)
+
+        buffers = empty_buffers(face_vertices, h, w)
+        start = time.time()
+        for _ in range(args.repeat):
+            standard_rasterize(face_vertices, *buffers, h, w)
+        print(f'   {face_vertices.shape[0]}x{face_vertices.shape[1]} faces at {h}x{w}: '
+              f'{(time.time() - start)/args.repeat*1000:.1f} ms')
+    sys.exit(0 if ok else 1)
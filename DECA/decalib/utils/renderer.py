@@ -22,29 +22,37 @@ import imageio
 from . import util
 
 def set_rasterizer(type = 'pytorch3d'):
+    # every name a backend below binds; declared once, so no branch relies on another one's declaration
+    global Meshes, load_obj, rasterize_meshes, standard_rasterize
     if type == 'pytorch3d':
-        global Meshes, load_obj, rasterize_meshes
         from pytorch3d.structures import Meshes
         from pytorch3d.io import load_obj
         from pytorch3d.renderer.mesh import rasterize_meshes
     elif type == 'standard':
-        global standard_rasterize, load_obj
         import os
         from .util import load_obj
-        # Use JIT Compiling Extensions
+        # Prebuilt by `python prebuilt_extensions.py` (repository root), compiled on first use otherwise
         # ref: https://pytorch.org/tutorials/advanced/cpp_extension.html
-        from torch.utils.cpp_extension import load, CUDA_HOME
         curr_dir = os.path.dirname(__file__)
+        try:
+            from prebuilt_extensions import load_extension
+        except ImportError:
+            # the repository root is not on sys.path (DECA run on its own): JIT compile as upstream
+            from torch.utils.cpp_extension import load as load_extension
         standard_rasterize_cuda = \
-            load(name='standard_rasterize_cuda', 
-                sources=[f'{curr_dir}/rasterizer/standard_rasterize_cuda.cpp', f'{curr_dir}/rasterizer/standard_rasterize_cuda_kernel.cu'], 
-                #extra_cuda_cflags = ['-std=c++14'])
+            load_extension('standard_rasterize_cuda',
+                sources=[os.path.join(curr_dir, 'rasterizer', 'standard_rasterize_cuda.cpp'),
+                         os.path.join(curr_dir, 'rasterizer', 'standard_rasterize_cuda_kernel.cu')],
                 extra_cuda_cflags = ['-std=c++14'])
                 #extra_cuda_cflags = ['-std=c++14', '-ccbin=$$(which gcc-7)']) # cuda10.2 is not compatible with gcc9. Specify gcc 7 
-        from standard_rasterize_cuda import standard_rasterize
+        standard_rasterize = standard_rasterize_cuda.standard_rasterize
         # If JIT does not work, try manually installation first
         # 1. see instruction here: pixielib/utils/rasterizer/INSTALL.md
         # 2. add this: "from .rasterizer.standard_rasterize_cuda import standard_rasterize" here
+    elif type == 'cpu':
+        # same buffers as the 'standard' CUDA kernel, for machines without CUDA
+        from .util import load_obj
+        from .rasterizer.standard_rasterize_cpu import standard_rasterize
 
 class StandardRasterizer(nn.Module):
     """ Alg: https://www.scratchapixel.com/lessons/3d-basic-rendering/rasterization-practical-implementation
@@ -183,7 +191,7 @@ class SRenderY(nn.Module):
             uvcoords = aux.verts_uvs[None, ...]      # (N, V, 2)
             uvfaces = faces.textures_idx[None, ...] # (N, F, 3)
             faces = faces.verts_idx[None,...]
-        elif rasterizer_type == 'standard':
+        elif rasterizer_type in ['standard', 'cpu']:
             self.rasterizer = StandardRasterizer(image_size)
             self.uv_rasterizer = StandardRasterizer(uv_size)
             verts, uvcoords, faces, uvfaces = load_obj(obj_filename)
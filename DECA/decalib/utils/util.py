@@ -60,6 +60,24 @@ def upsample_mesh(vertices, normals, faces, displacement_map, texture_map, dense
     dense_vertices = pixel_3d_points + offsets
     return dense_vertices, dense_colors, dense_faces
 
+def format_rows(line_format, *columns):
+    ''' formats whole arrays at once: one line of `line_format` (%s fields) per row,
+    with the row's values of every array in `columns` taken in order.
+    '{}'.format() of a numpy scalar formats the matching python int/float,
+    so formatting the tolist() values gives the same text as formatting
+    each line separately, without the per-line numpy overhead
+    '''
+    columns = [np.asarray(column).reshape(len(column), -1) for column in columns]
+    n = columns[0].shape[0]
+    width = sum(column.shape[1] for column in columns)
+    values = [None]*(n*width)
+    offset = 0
+    for column in columns:
+        for j in range(column.shape[1]):
+            values[offset+j::width] = column[:, j].tolist()
+        offset += column.shape[1]
+    return (line_format * n) % tuple(values)
+
 # borrowed from https://github.com/YadiraF/PRNet/blob/master/utils/write.py
 def write_obj(obj_name,
               vertices,
@@ -106,32 +124,22 @@ def write_obj(obj_name,
 
         # write vertices
         if colors is None:
-            for i in range(vertices.shape[0]):
-                f.write('v {} {} {}\n'.format(vertices[i, 0], vertices[i, 1], vertices[i, 2]))
+            f.write(format_rows('v %s %s %s\n', vertices[:, :3]))
         else:
-            for i in range(vertices.shape[0]):
-                f.write('v {} {} {} {} {} {}\n'.format(vertices[i, 0], vertices[i, 1], vertices[i, 2], colors[i, 0], colors[i, 1], colors[i, 2]))
+            f.write(format_rows('v %s %s %s %s %s %s\n', vertices[:, :3], colors[:, :3]))
 
         # write uv coords
         if texture is None:
-            for i in range(faces.shape[0]):
-                f.write('f {} {} {}\n'.format(faces[i, 2], faces[i, 1], faces[i, 0]))
+            f.write(format_rows('f %s %s %s\n', faces[:, [2, 1, 0]]))
         else:
-            for i in range(uvcoords.shape[0]):
-                f.write('vt {} {}\n'.format(uvcoords[i,0], uvcoords[i,1]))
+            f.write(format_rows('vt %s %s\n', uvcoords[:, :2]))
             f.write('usemtl %s\n' % material_name)
             # write f: ver ind/ uv ind
             uvfaces = uvfaces + 1
-            for i in range(faces.shape[0]):
-                f.write('f {}/{} {}/{} {}/{}\n'.format(
-                    #  faces[i, 2], uvfaces[i, 2],
-                    #  faces[i, 1], uvfaces[i, 1],
-                    #  faces[i, 0], uvfaces[i, 0]
-                    faces[i, 0], uvfaces[i, 0],
-                    faces[i, 1], uvfaces[i, 1],
-                    faces[i, 2], uvfaces[i, 2]
-                )
-                )
+            f.write(format_rows('f %s/%s %s/%s %s/%s\n',
+                                faces[:, [0]], uvfaces[:, [0]],
+                                faces[:, [1]], uvfaces[:, [1]],
+                                faces[:, [2]], uvfaces[:, [2]]))
             # write mtl
             with open(mtl_name, 'w') as f:
                 f.write('newmtl %s\n' % material_name)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of util.write_obj against the former per-line writer, on the FLAME
+head topology (data/head_template.obj) and, when data/texture_data_256.npy is
+available, on the dense `_detail.obj` mesh built by util.upsample_mesh.
+Both writers must produce byte-identical files.
+
+    python demos/benchmark_write_obj.py
+'''
+import os, sys
+import filecmp
+import tempfile
+import argparse
+import numpy as np
+from time import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from decalib.utils import util
+from decalib.utils.config import cfg as deca_cfg
+
+def write_obj_legacy(obj_name, vertices, faces, colors=None, texture=None, uvcoords=None, uvfaces=None,
+                     inverse_face_order=False):
+    ''' the former writer: one str.format + f.write per line (textures are not written)
+    '''
+    mtl_name = obj_name.replace('.obj', '.mtl')
+    material_name = 'FaceTexture'
+    faces = faces.copy()
+    faces += 1
+    if inverse_face_order:
+        faces = faces[:, [2, 1, 0]]
+        if uvfaces is not None:
+            uvfaces = uvfaces[:, [2, 1, 0]]
+    with open(obj_name, 'w') as f:
+        if texture is not None:
+            f.write('mtllib %s\n\n' % os.path.basename(mtl_name))
+        if colors is None:
+            for i in range(vertices.shape[0]):
+                f.write('v {} {} {}\n'.format(vertices[i, 0], vertices[i, 1], vertices[i, 2]))
+        else:
+            for i in range(vertices.shape[0]):
+                f.write('v {} {} {} {} {} {}\n'.format(vertices[i, 0], vertices[i, 1], vertices[i, 2], colors[i, 0], colors[i, 1], colors[i, 2]))
+        if texture is None:
+            for i in range(faces.shape[0]):
+                f.write('f {} {} {}\n'.format(faces[i, 2], faces[i, 1], faces[i, 0]))
+        else:
+            for i in range(uvcoords.shape[0]):
+                f.write('vt {} {}\n'.format(uvcoords[i,0], uvcoords[i,1]))
+            f.write('usemtl %s\n' % material_name)
+            uvfaces = uvfaces + 1
+            for i in range(faces.shape[0]):
+                f.write('f {}/{} {}/{} {}/{}\n'.format(
+                    faces[i, 0], uvfaces[i, 0],
+                    faces[i, 1], uvfaces[i, 1],
+                    faces[i, 2], uvfaces[i, 2]
+                ))
+
+def run(name, folder, repeat, kwargs):
+    # same file name in both folders, the obj references its mtl by name
+    os.makedirs(os.path.join(folder, 'legacy'), exist_ok=True)
+    os.makedirs(os.path.join(folder, 'new'), exist_ok=True)
+    legacy_path = os.path.join(folder, 'legacy', name + '.obj')
+    new_path = os.path.join(folder, 'new', name + '.obj')
+    start = time()
+    for _ in range(repeat):
+        write_obj_legacy(legacy_path, **kwargs)
+    legacy_time = (time() - start) / repeat
+    start = time()
+    for _ in range(repeat):
+        util.write_obj(new_path, **kwargs)
+    new_time = (time() - start) / repeat
+    identical = filecmp.cmp(legacy_path, new_path, shallow=False)
+    print(f'{name:>8}: {kwargs["vertices"].shape[0]:>6} verts {kwargs["faces"].shape[0]:>6} faces | '
+          f'legacy {legacy_time*1000:8.1f} ms | vectorized {new_time*1000:8.1f} ms | '
+          f'x{legacy_time/new_time:5.1f} | identical: {identical}')
+    return identical
+
+def main(args):
+    verts, uvcoords, faces, uvfaces = util.load_obj(deca_cfg.model.topology_path)
+    vertices = verts.numpy().astype(np.float32) + np.random.randn(*verts.shape).astype(np.float32) * 1e-3
+    faces = faces.numpy()
+    uvcoords = uvcoords.numpy()
+    uvfaces = uvfaces.numpy()
+    texture = np.random.randint(0, 255, (256, 256, 3), dtype=np.uint8)
+
+    all_identical = True
+    with tempfile.TemporaryDirectory() as folder:
+        all_identical &= run('coarse', folder, args.repeat, dict(
+            vertices=vertices, faces=faces, texture=texture, uvcoords=uvcoords, uvfaces=uvfaces))
+        if os.path.exists(deca_cfg.model.dense_template_path):
+            dense_template = np.load(deca_cfg.model.dense_template_path, allow_pickle=True, encoding='latin1').item()
+            normals = vertices / np.linalg.norm(vertices, axis=-1, keepdims=True)
+            displacement_map = np.random.randn(256, 256).astype(np.float32) * 1e-3
+            dense_vertices, dense_colors, dense_faces = util.upsample_mesh(vertices, normals, faces, displacement_map, texture, dense_template)
+            all_identical &= run('detail', folder, args.repeat, dict(
+                vertices=dense_vertices, faces=dense_faces, colors=dense_colors, inverse_face_order=True))
+        else:
+            print(f'{deca_cfg.model.dense_template_path} not found, skipping the detail mesh')
+    print('all outputs byte-identical' if all_identical else 'OUTPUTS DIFFER')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark util.write_obj')
+    parser.add_argument('--repeat', default=3, type=int, help='runs per writer')
+    main(parser.parse_args())
@@ -21,6 +21,7 @@ from scipy.io import savemat
 import argparse
 from tqdm import tqdm
 import torch
+from torch.utils.data import DataLoader
 
 
 
@@ -31,7 +32,92 @@ from decalib.utils import util
 from decalib.utils.config import cfg as deca_cfg
 from decalib.utils.tensor_cropper import transform_points
 
-def main(args):
+def load_deca(args):
+    """Builds DECA (FLAME, encoders, renderer) once; it can then serve many reconstructions."""
+    deca_cfg.model.use_tex = args.useTex
+    deca_cfg.rasterizer_type = args.rasterizer_type
+    deca_cfg.model.extract_tex = args.extractTex
+    return DECA(config = deca_cfg, device=args.device)
+
+def slice_dict(tensor_dict, index):
+    ''' keeps item `index` of every batched tensor, as a batch of one
+    '''
+    return {key: value[index:index+1] for key, value in tensor_dict.items()}
+
+def reconstruct_batch(deca, batch, device, render_orig=False, lean=False):
+    ''' runs encode/decode once for a batch collated by datasets.collate_test_data
+    returns opdict, visdict (batched) and one orig_visdict per item (None without render_orig)
+    lean: only compute what save_obj needs, visdict is then None
+    '''
+    images = batch['image'].to(device)
+    with torch.no_grad():
+        codedict = deca.encode(images)
+        orig_visdicts = [None]*images.shape[0]
+        if lean:
+            return deca.decode_lean(codedict), None, orig_visdicts
+        opdict, visdict = deca.decode(codedict) #tensor
+        if render_orig:
+            # original images differ in size, so render them in groups of equal size
+            groups = {}
+            for j, original_image in enumerate(batch['original_image']):
+                groups.setdefault(tuple(original_image.shape), []).append(j)
+            for index in groups.values():
+                group_codedict = {key: value[index] for key, value in codedict.items()}
+                tform = torch.inverse(batch['tform'][index]).transpose(1,2).to(device)
+                original_image = torch.stack([batch['original_image'][j] for j in index]).to(device)
+                _, orig_visdict = deca.decode(group_codedict, render_orig=True, original_image=original_image, tform=tform)
+                orig_visdict['inputs'] = original_image
+                for k, j in enumerate(index):
+                    orig_visdicts[j] = slice_dict(orig_visdict, k)
+    return opdict, visdict, orig_visdicts
+
+def save_results(args, deca, name, opdict, visdict, orig_visdict=None):
+    savefolder = args.savefolder
+    if args.saveDepth or args.saveKpt or args.saveObj or args.saveMat or args.saveImages:
+        os.makedirs(os.path.join(savefolder, name), exist_ok=True)
+    if visdict is None:
+        # lean mode: only the meshes and texture exist
+        if args.saveObj:
+            obj_path = os.path.join(savefolder, name, name + '.obj')
+            deca.save_obj(obj_path, opdict)
+            print(f'[INFO] Saved OBJ file: {obj_path}')
+        return
+    # -- save results
+    if args.saveDepth:
+        depth_image = deca.render.render_depth(opdict['trans_verts']).repeat(1,3,1,1)
+        visdict['depth_images'] = depth_image
+        cv2.imwrite(os.path.join(savefolder, name, name + '_depth.jpg'), util.tensor2image(depth_image[0]))
+    if args.saveKpt:
+        np.savetxt(os.path.join(savefolder, name, name + '_kpt2d.txt'), opdict['landmarks2d'][0].cpu().numpy())
+        np.savetxt(os.path.join(savefolder, name, name + '_kpt3d.txt'), opdict['landmarks3d'][0].cpu().numpy())
+    if args.saveObj:
+        obj_path = os.path.join(savefolder, name, name + '.obj')
+        deca.save_obj(obj_path, opdict)
+        print(f'[INFO] Saved OBJ file: {obj_path}')
+        
+
+    if args.saveMat:
+        opdict = util.dict_tensor2npy(opdict)
+        savemat(os.path.join(savefolder, name, name + '.mat'), opdict)
+    if args.saveVis:
+        cv2.imwrite(os.path.join(savefolder, name + '_vis.jpg'), deca.visualize(visdict))
+        if orig_visdict is not None:
+            cv2.imwrite(os.path.join(savefolder, name + '_vis_original_size.jpg'), deca.visualize(orig_visdict))
+    if args.saveImages:
+        for vis_name in ['inputs', 'rendered_images', 'albedo_images', 'shape_images', 'shape_detail_images', 'landmarks2d']:
+            if vis_name not in visdict.keys():
+                continue
+            image = util.tensor2image(visdict[vis_name][0])
+            cv2.imwrite(os.path.join(savefolder, name, name + '_' + vis_name +'.jpg'), util.tensor2image(visdict[vis_name][0]))
+            if orig_visdict is not None:
+                image = util.tensor2image(orig_visdict[vis_name][0])
+                cv2.imwrite(os.path.join(savefolder, name, 'orig_' + name + '_' + vis_name +'.jpg'), util.tensor2image(orig_visdict[vis_name][0]))
+
+def main(args, deca=None, face_detector=None, images=None, landmarks=None):
+    ''' images: optional {imagename: RGB(A) array} reconstructed instead of args.inputpath
+    landmarks: optional {imagename: (68, 2) keypoints} cropping the faces without the detector
+    returns {imagename: deca.head_mesh arrays}, the coarse meshes the OBJs are written from
+    '''
     # if args.rasterizer_type != 'standard':
     #     args.render_orig = False
     savefolder = args.savefolder
@@ -39,66 +125,26 @@ def main(args):
     os.makedirs(savefolder, exist_ok=True)
 
     # load test images 
-    testdata = datasets.TestData(args.inputpath, iscrop=args.iscrop, face_detector=args.detector, sample_step=args.sample_step)
+    testdata = datasets.TestData(args.inputpath if images is None else images, iscrop=args.iscrop, face_detector=face_detector or args.detector, sample_step=args.sample_step, landmarks=landmarks)
+    dataloader = DataLoader(testdata, batch_size=args.batch_size, shuffle=False,
+                            num_workers=args.num_workers, collate_fn=datasets.collate_test_data)
 
     # run DECA
-    deca_cfg.model.use_tex = args.useTex
-    deca_cfg.rasterizer_type = args.rasterizer_type
-    deca_cfg.model.extract_tex = args.extractTex
-    deca = DECA(config = deca_cfg, device=device)
-    # for i in range(len(testdata)):
-    for i in tqdm(range(len(testdata))):
-        name = testdata[i]['imagename']
-        images = testdata[i]['image'].to(device)[None,...]
-        with torch.no_grad():
-            
-            codedict = deca.encode(images)
-            opdict, visdict = deca.decode(codedict) #tensor
-            if args.render_orig:
-                tform = testdata[i]['tform'][None, ...]
-                tform = torch.inverse(tform).transpose(1,2).to(device)
-                original_image = testdata[i]['original_image'][None, ...].to(device)
-                _, orig_visdict = deca.decode(codedict, render_orig=True, original_image=original_image, tform=tform)    
-                orig_visdict['inputs'] = original_image            
-
-        if args.saveDepth or args.saveKpt or args.saveObj or args.saveMat or args.saveImages:
-            os.makedirs(os.path.join(savefolder, name), exist_ok=True)
-        # -- save results
-        if args.saveDepth:
-            depth_image = deca.render.render_depth(opdict['trans_verts']).repeat(1,3,1,1)
-            visdict['depth_images'] = depth_image
-            cv2.imwrite(os.path.join(savefolder, name, name + '_depth.jpg'), util.tensor2image(depth_image[0]))
-        if args.saveKpt:
-            np.savetxt(os.path.join(savefolder, name, name + '_kpt2d.txt'), opdict['landmarks2d'][0].cpu().numpy())
-            np.savetxt(os.path.join(savefolder, name, name + '_kpt3d.txt'), opdict['landmarks3d'][0].cpu().numpy())
-        if args.saveObj:
-            obj_path = os.path.join(savefolder, name, name + '.obj')
-            deca.save_obj(obj_path, opdict)
-            print(f'[INFO] Saved OBJ file: {obj_path}')
-            
-
-        if args.saveMat:
-            opdict = util.dict_tensor2npy(opdict)
-            savemat(os.path.join(savefolder, name, name + '.mat'), opdict)
-        if args.saveVis:
-            cv2.imwrite(os.path.join(savefolder, name + '_vis.jpg'), deca.visualize(visdict))
-            if args.render_orig:
-                cv2.imwrite(os.path.join(savefolder, name + '_vis_original_size.jpg'), deca.visualize(orig_visdict))
-        if args.saveImages:
-            for vis_name in ['inputs', 'rendered_images', 'albedo_images', 'shape_images', 'shape_detail_images', 'landmarks2d']:
-                if vis_name not in visdict.keys():
-                    continue
-                image = util.tensor2image(visdict[vis_name][0])
-                cv2.imwrite(os.path.join(savefolder, name, name + '_' + vis_name +'.jpg'), util.tensor2image(visdict[vis_name][0]))
-                if args.render_orig:
-                    image = util.tensor2image(orig_visdict[vis_name][0])
-                    cv2.imwrite(os.path.join(savefolder, name, 'orig_' + name + '_' + vis_name +'.jpg'), util.tensor2image(orig_visdict[vis_name][0]))
+    if deca is None:
+        deca = load_deca(args)
+    meshes = {}
+    for batch in tqdm(dataloader):
+        opdict, visdict, orig_visdicts = reconstruct_batch(deca, batch, device, render_orig=args.render_orig, lean=args.lean)
+        for j, name in enumerate(batch['imagename']):
+            meshes[name] = deca.head_mesh(opdict, j)
+            save_results(args, deca, name, slice_dict(opdict, j), slice_dict(visdict, j) if visdict is not None else None, orig_visdicts[j])
     print(f'-- please check the results in {savefolder}')
+    return meshes
 
 
 
         
-if __name__ == '__main__':
+def get_parser():
     parser = argparse.ArgumentParser(description='DECA: Detailed Expression Capture and Animation')
 
     parser.add_argument('-i', '--inputpath', default='TestSamples/examples', type=str,
@@ -112,11 +158,18 @@ if __name__ == '__main__':
                         help='whether to crop input image, set false only when the test image are well cropped' )
     parser.add_argument('--sample_step', default=10, type=int,
                         help='sample images from video data for every step' )
+    parser.add_argument('--batch_size', default=1, type=int,
+                        help='number of faces reconstructed together in one forward pass' )
+    parser.add_argument('--num_workers', default=0, type=int,
+                        help='dataloader workers for loading and cropping; keep 0 when the face detector runs on cuda' )
     parser.add_argument('--detector', default='fan', type=str,
                         help='detector for cropping face, check decalib/detectors.py for details' )
     # rendering option
     parser.add_argument('--rasterizer_type', default='standard', type=str,
-                        help='rasterizer type: pytorch3d or standard' )
+                        help='rasterizer type: pytorch3d, standard (CUDA) or cpu' )
+    parser.add_argument('--lean', default=False, type=lambda x: x.lower() in ['true', '1'],
+                        help='production mode: only compute and save the obj and its textures, \
+                            skipping every visualization, depth and keypoint output' )
     parser.add_argument('--render_orig', default=True, type=lambda x: x.lower() in ['true', '1'],
                         help='whether to render results in original image size, currently only works when rasterizer_type=standard')
     # save
@@ -138,7 +191,10 @@ if __name__ == '__main__':
                         help='whether to save outputs as .mat' )
     parser.add_argument('--saveImages', default=False, type=lambda x: x.lower() in ['true', '1'],
                         help='whether to save visualization output as seperate images' )
-    main(parser.parse_args())
+    return parser
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
 
 
 
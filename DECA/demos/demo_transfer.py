@@ -106,7 +106,7 @@ if __name__ == '__main__':
                         help='set device, cpu for using cpu' )
     # rendering option
     parser.add_argument('--rasterizer_type', default='standard', type=str,
-                        help='rasterizer type: pytorch3d or standard' )
+                        help='rasterizer type: pytorch3d, standard (CUDA) or cpu' )
     # process test images
     parser.add_argument('--iscrop', default=True, type=lambda x: x.lower() in ['true', '1'],
                         help='whether to crop input image, set false only when the test image are well cropped' )
@@ -0,0 +1,142 @@
+import os
+import sys
+import cv2
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+
+# Get the directory where the current script is located
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_CACHE = os.getenv("TEXTURE_ASSET_CACHE", os.path.join(BASE_DIR, "cache", "assets.npz"))
+
+sys.path.append(os.path.dirname(BASE_DIR))
+from poisson_blend import PoissonBlender
+
+# bump whenever the cached layout changes
+ASSET_VERSION = 2
+
+SOURCE_FILES = ("default_texture.JPG", "facemask.png", "maskeye.jpg")
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def source_hash(base_dir=BASE_DIR):
+    """Hash of the cache layout version and the bytes of the three source images."""
+    digest = hashlib.sha256(f"texture-assets-v{ASSET_VERSION}".encode())
+    for name in SOURCE_FILES:
+        with open(os.path.join(base_dir, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def precompute_assets(base_dir=BASE_DIR):
+    """Everything compose_texture needs from the static images, as arrays.
+
+        default_texture, default_hsv    BGR image and its HSV planes
+        default_hsv_mean                mean HSV of the whole default texture
+        face_mask, face_box             binary face mask and its bounding box (x, y, w, h)
+        face_clone_mask                 mask of the face clone, in face_box coordinates
+        eye_masks, eye_boxes            one filled mask and bounding box per eye contour
+    """
+    default_texture = cv2.imread(os.path.join(base_dir, "default_texture.JPG"))
+    if default_texture is None:
+        raise FileNotFoundError(f"❌ default_texture.JPG not found in {base_dir}")
+    default_hsv = cv2.cvtColor(default_texture, cv2.COLOR_BGR2HSV)
+
+    # Face mask: binary, plus its bounding box
+    face_mask = cv2.imread(os.path.join(base_dir, "facemask.png"), cv2.IMREAD_UNCHANGED)
+    _, face_mask = cv2.threshold(cv2.cvtColor(face_mask, cv2.COLOR_BGR2GRAY), 10, 255, cv2.THRESH_BINARY)
+
+    # The former script ran a NORMAL clone before the MIXED one it kept, and
+    # cv2.seamlessClone rewrites its mask in place: the outer frame is zeroed
+    # and the bounding box of the rest holds the inverted, 3x eroded mask.
+    # The MIXED clone used that mask, so the texture keeps using it.
+    x, y, w, h = cv2.boundingRect(face_mask)
+    face_clone_mask = face_mask[y:y+h, x:x+w].copy()
+    face_clone_mask[[0, -1], :] = 0
+    face_clone_mask[:, [0, -1]] = 0
+    bx, by, bw, bh = cv2.boundingRect(face_clone_mask)
+    eroded = cv2.erode(face_clone_mask, np.ones((3, 3), np.uint8), iterations=3)
+    face_clone_mask[by:by+bh, bx:bx+bw] = 255 - eroded[by:by+bh, bx:bx+bw]
+
+    # Eye mask: one filled mask per external contour
+    eye_mask = cv2.imread(os.path.join(base_dir, "maskeye.jpg"), cv2.IMREAD_GRAYSCALE)
+    _, eye_mask = cv2.threshold(eye_mask, 10, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(eye_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    eye_masks = np.zeros((len(contours),) + eye_mask.shape, dtype=bool)
+    for i, contour in enumerate(contours):
+        single = np.zeros_like(eye_mask)
+        cv2.drawContours(single, [contour], -1, 255, -1)
+        eye_masks[i] = single > 0
+
+    return {
+        "default_texture": default_texture,
+        "default_hsv": default_hsv,
+        "default_hsv_mean": default_hsv.mean(axis=(0, 1)).astype(np.int32),
+        "face_mask": face_mask,
+        "face_box": np.array([x, y, w, h], dtype=np.int32),
+        "face_clone_mask": face_clone_mask,
+        "eye_masks": eye_masks,
+        "eye_boxes": np.array([cv2.boundingRect(c) for c in contours], dtype=np.int32).reshape(-1, 4),
+    }
+
+
+def bake_assets(base_dir=BASE_DIR, cache_path=ASSET_CACHE):
+    """Writes `precompute_assets` to `cache_path` (.npz), tagged with `source_hash`."""
+    print("🔥 Precomputing texture assets ...")
+    assets = precompute_assets(base_dir)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp = cache_path + ".tmp.npz"
+    np.savez_compressed(tmp, hash=np.array(source_hash(base_dir)), **assets)
+    os.replace(tmp, cache_path)
+    print(f"✅ Cached texture assets to {cache_path}")
+    return assets
+
+
+def read_cache(cache_path, expected_hash):
+    """Cached assets, or None when the cache is missing, unreadable or built from other sources."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with np.load(cache_path) as data:
+            if str(data["hash"]) != expected_hash:
+                return None
+            return {name: data[name] for name in data.files if name != "hash"}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def face_blender(assets):
+    """PoissonBlender of the face clone mask, centered on the face box."""
+    x, y, w, h = assets["face_box"].tolist()
+    return PoissonBlender(assets["face_clone_mask"], (x + w // 2, y + h // 2))
+
+
+def load_assets(base_dir=BASE_DIR, cache_path=ASSET_CACHE):
+    """Texture assets from the .npz cache, rebuilt when the source images change.
+
+    Loaded once per process, with the face `blender` set up for the fixed mask;
+    every job afterwards only runs the per-avatar math.
+    """
+    with _lock:
+        if cache_path in _loaded:
+            return _loaded[cache_path]
+        assets = read_cache(cache_path, source_hash(base_dir))
+        if assets is None:
+            assets = bake_assets(base_dir, cache_path)
+        assets["blender"] = face_blender(assets)
+        _loaded[cache_path] = assets
+        return assets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the static texture assets")
+    parser.add_argument("--force", action="store_true", help="Rebuild even when the cache is up to date")
+    args = parser.parse_args()
+    if args.force or read_cache(ASSET_CACHE, source_hash()) is None:
+        bake_assets()
+    else:
+        print("✅ Texture asset cache is up to date")
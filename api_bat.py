@@ -1,8 +1,10 @@
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI
 import os
 import shutil
 import subprocess
+from job_queue import get_job_queue, WorkerPool
+from job_routes import create_job_router
+from workspace import Workspace
 
 app = FastAPI()
 
@@ -16,25 +18,32 @@ def run_bat_file(gender: str):
         return {"status": "error", "message": result.stderr}
     return {"status": "success", "output": result.stdout}
 
-@app.post("/upload")
-async def upload_image(
-    file: UploadFile = File(...), 
-    gender: str = Form(...)
-):
-    filename = file.filename or "default.png"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
-    # Save the uploaded file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Run the .bat file with the specified gender
-    run_result = run_bat_file(gender)
-    
-    return JSONResponse({
-        "status": run_result["status"],
-        "gender": gender,
-        "saved_path": file_path,
-        "output": run_result.get("output", ""),
-        "error_message": run_result.get("message", ""),
-    })
+def run_job(job, report_progress=None):
+    """Job queue runner: moves the staged upload into `input/` and runs the .bat pipeline."""
+    workspace = Workspace(job["id"])
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    staged_path = workspace.input_path(job["payload"]["filename"])
+    shutil.move(staged_path, os.path.join(UPLOAD_DIR, os.path.basename(staged_path)))
+    workspace.cleanup()
+
+    if report_progress: report_progress("Running pipeline")
+    run_result = run_bat_file(job["payload"]["gender"])
+    if run_result["status"] != "success":
+        raise RuntimeError(run_result["message"])
+    return {"output": run_result["output"]}
+
+
+# run_pipeline.bat works in the shared repo folders, so jobs must run one at a time
+job_queue = get_job_queue()
+worker_pool = WorkerPool(job_queue, run_job, max_workers=1)
+app.include_router(create_job_router(job_queue))
+
+
+@app.on_event("startup")
+def start_workers():
+    worker_pool.start()
+
+
+@app.on_event("shutdown")
+def stop_workers():
+    worker_pool.stop(wait=False)
@@ -1,35 +1,31 @@
 
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI
 import os
-import shutil
-from full_code import main_function
+from full_code import run_job
+from job_queue import get_job_queue, InMemoryJobQueue, WorkerPool
+from job_routes import create_job_router
+from model_server import get_model_server
 
 app = FastAPI()
 
-UPLOAD_DIR = "input"
+# JOB_WORKERS=0 only enqueues; jobs are then run by `python job_queue.py` (SQLite backend)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+job_queue = get_job_queue()
+if JOB_WORKERS == 0 and isinstance(job_queue, InMemoryJobQueue):
+    # nothing outside this process can see an in-memory queue, so its jobs would never run
+    raise ValueError("❌ JOB_WORKERS=0 needs JOB_QUEUE_BACKEND=sqlite, so that `python job_queue.py` can run the jobs")
+worker_pool = WorkerPool(job_queue, run_job, max_workers=JOB_WORKERS)
+app.include_router(create_job_router(job_queue))
 
-def process_image(image_path: str, gender: str) -> str:
-    processed_path = os.path.join(UPLOAD_DIR, f"processed_{gender}.png")
-    shutil.copy(image_path, processed_path)
-    return processed_path
 
-@app.post("/upload")
-async def upload_image(
-    file: UploadFile = File(...), 
-    gender: str = Form(...)
-):
-    filename = file.filename or "default.png"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    await main_function(gender=gender)
-
-    return JSONResponse({
-        "status": "success",
-        "gender": gender,
-        "saved_path": file_path,
-
-    })
+@app.on_event("startup")
+def load_models():
+    if JOB_WORKERS > 0:
+        # keep every model resident so each upload only pays for inference
+        get_model_server().warmup()
+        worker_pool.start()
 
 
+@app.on_event("shutdown")
+def stop_workers():
+    worker_pool.stop(wait=False)
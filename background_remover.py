@@ -1,5 +1,6 @@
 import os
-from rembg import remove
+import numpy as np
+import onnxruntime as ort
 from PIL import Image
 
 
@@ -8,13 +9,178 @@ base_dir = os.path.dirname(os.path.abspath(__file__))
 input_folder = os.path.join(base_dir, "hair_mapper/HairMapper/test_data/mapper_res")
 output_folder = os.path.join(base_dir, "DECA/TestSamples/examples")
 
+# images per session.run call, and ONNX Runtime threads per call (0 lets ONNX Runtime decide)
+BACKGROUND_BATCH_SIZE = int(os.getenv("BACKGROUND_BATCH_SIZE", "4"))
+BACKGROUND_THREADS = int(os.getenv("BACKGROUND_THREADS", "0"))
+# U2Net ONNX model; empty uses the u2net.onnx rembg downloads to U2NET_HOME (default ~/.u2net)
+BACKGROUND_MODEL = os.getenv("BACKGROUND_MODEL", "")
 
-for file in os.listdir(input_folder):
-    if file.lower().endswith((".png", ".jpg", ".jpeg")):
-        input_path = os.path.join(input_folder, file)
-        output_path = os.path.join(output_folder, os.path.splitext(file)[0] + ".png")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
 
-        with Image.open(input_path) as img:
-            output = remove(img)
-            output.save(output_path)
-            print(f"Saved: {output_path}")
+
+def model_path():
+    """Path of the U2Net ONNX model, downloaded through rembg on first use."""
+    if BACKGROUND_MODEL:
+        return BACKGROUND_MODEL
+    path = os.path.join(os.path.expanduser(os.getenv("U2NET_HOME", os.path.join("~", ".u2net"))), "u2net.onnx")
+    if not os.path.exists(path):
+        from rembg import new_session
+        new_session("u2net")
+    return path
+
+
+def dynamic_batch_model(path):
+    """Copy of the ONNX model at `path` whose batch dimension is free, cached next to it.
+
+    The stock u2net.onnx declares a batch of one. Returns None when the
+    `onnx` package is missing or the copy cannot be written.
+    """
+    try:
+        import onnx
+    except ImportError:
+        return None
+    root, ext = os.path.splitext(path)
+    batched = f"{root}.dynamic_batch{ext}"
+    if os.path.exists(batched) and os.path.getmtime(batched) >= os.path.getmtime(path):
+        return batched
+    model = onnx.load(path)
+    for value in list(model.graph.input) + list(model.graph.output):
+        value.type.tensor_type.shape.dim[0].dim_param = "batch"
+    # intermediate shapes were inferred for a batch of one
+    del model.graph.value_info[:]
+    tmp = f"{batched}.tmp-{os.getpid()}"
+    try:
+        onnx.save(model, tmp)
+        os.replace(tmp, batched)
+    except OSError as e:
+        print(f"⚠️ Could not write {batched}: {e}")
+        return None
+    return batched
+
+
+def create_session(path, threads=BACKGROUND_THREADS):
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(path, sess_options=options, providers=ort.get_available_providers())
+
+
+def batches_match(session, tolerance=1e-4):
+    """Whether a batch of two inputs gives the same output as two single-image runs."""
+    model_input = session.get_inputs()[0]
+    shape = [2] + [dim if isinstance(dim, int) else 320 for dim in model_input.shape[1:]]
+    inputs = np.random.RandomState(0).standard_normal(shape).astype(np.float32)
+    try:
+        batch = session.run(None, {model_input.name: inputs})[0]
+    except Exception as e:
+        print(f"⚠️ U2Net does not run on a batch: {e}")
+        return False
+    single = np.concatenate([session.run(None, {model_input.name: inputs[i:i + 1]})[0] for i in range(2)])
+    return batch.shape == single.shape and np.abs(batch - single).max() < tolerance
+
+
+def load_session(threads=BACKGROUND_THREADS, batch_size=BACKGROUND_BATCH_SIZE):
+    """Loads the U2Net ONNX model once so it can be reused for every image.
+
+    With `batch_size` > 1 the session runs a copy of the model with a free
+    batch dimension, once a batch of two has been checked against single runs
+    (a graph hard-coding a batch of one falls back to the stock model).
+    """
+    path = model_path()
+    if batch_size > 1:
+        batched = dynamic_batch_model(path)
+        if batched is not None:
+            session = create_session(batched, threads)
+            if batches_match(session):
+                return session
+            print("⚠️ Batched U2Net output differs from single images, removing backgrounds one at a time")
+    return create_session(path, threads)
+
+
+def cutout(img, mask):
+    """`img` with `mask` as its alpha channel, transparent elsewhere."""
+    empty = Image.new("RGBA", img.size, 0)
+    return Image.composite(img, empty, mask)
+
+
+class BackgroundRemover:
+    """Background removal with one resident U2Net session, on in-memory images.
+
+    Same pre/post-processing as `rembg.remove` with its u2net model, but on our
+    own ONNX Runtime session (`load_session`): up to `batch_size` images go
+    through a single `session.run` call when the model accepts a batch.
+    """
+
+    MEAN = (0.485, 0.456, 0.406)
+    STD = (0.229, 0.224, 0.225)
+    SIZE = (320, 320)
+
+    def __init__(self, session=None, threads=BACKGROUND_THREADS, batch_size=BACKGROUND_BATCH_SIZE):
+        self.session = session or load_session(threads, batch_size)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # a fixed batch dimension means one image per run
+        self.batch_size = batch_size if not isinstance(model_input.shape[0], int) else 1
+
+    def _normalize(self, img):
+        im = np.array(img.convert("RGB").resize(self.SIZE, Image.LANCZOS))
+        im = im / np.max(im)
+        im = (im - self.MEAN) / self.STD
+        return im.transpose((2, 0, 1)).astype(np.float32)
+
+    def predict_masks(self, images):
+        """U2Net alpha masks (PIL "L", image size) of a list of PIL images."""
+        masks = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            inputs = np.stack([self._normalize(img) for img in chunk])
+            preds = self.session.run(None, {self.input_name: inputs})[0][:, 0]
+            for img, pred in zip(chunk, preds):
+                pred = (pred - pred.min()) / (pred.max() - pred.min())
+                mask = Image.fromarray((pred * 255).astype("uint8"), mode="L")
+                masks.append(mask.resize(img.size, Image.LANCZOS))
+        return masks
+
+    def remove(self, images):
+        """RGBA cutouts of a list of PIL images."""
+        return [cutout(img, mask) for img, mask in zip(images, self.predict_masks(images))]
+
+    def remove_arrays(self, arrays):
+        """RGBA uint8 cutouts of a list of RGB uint8 arrays."""
+        cutouts = self.remove([Image.fromarray(np.asarray(array)) for array in arrays])
+        return [np.array(cutout) for cutout in cutouts]
+
+
+def list_images(folder):
+    return sorted(file for file in os.listdir(folder) if file.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def load_images(folder):
+    """{name without extension: RGB array} of every image in `folder`."""
+    images = {}
+    for file in list_images(folder):
+        with Image.open(os.path.join(folder, file)) as img:
+            images[os.path.splitext(file)[0]] = np.array(img.convert("RGB"))
+    return images
+
+
+def save_cutouts(cutouts, output_folder):
+    """Saves {name: RGBA array} as `output_folder/<name>.png`."""
+    os.makedirs(output_folder, exist_ok=True)
+    for name, cutout in cutouts.items():
+        output_path = os.path.join(output_folder, name + ".png")
+        Image.fromarray(cutout).save(output_path)
+        print(f"Saved: {output_path}")
+
+
+def remove_background_dir(input_folder, output_folder, session=None, remover=None):
+    if remover is None:
+        remover = BackgroundRemover(session)
+    images = load_images(input_folder)
+    cutouts = dict(zip(images, remover.remove_arrays(list(images.values()))))
+    save_cutouts(cutouts, output_folder)
+    return cutouts
+
+
+if __name__ == "__main__":
+    remove_background_dir(input_folder, output_folder)
@@ -0,0 +1,68 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "4"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "20"))
+
+
+class BatchScheduler:
+    """Groups single-item requests from concurrent jobs into batched model calls.
+
+    `process_batch(items)` receives a list of items and must return one result
+    per item, in order. A batch is run as soon as `max_batch_size` items are
+    waiting, or `max_wait_ms` after the first one arrived. All batches run on
+    one background thread, which is therefore the only user of the model.
+    """
+
+    def __init__(self, process_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, name="batch"):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"{name}-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queues one item and returns a Future for its result."""
+        future = Future()
+        self._pending.put((item, future))
+        return future
+
+    def __call__(self, item):
+        """Queues one item and blocks until its result is ready."""
+        return self.submit(item).result()
+
+    def _collect(self):
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            futures = [future for _, future in batch if future.set_running_or_notify_cancel()]
+            items = [item for item, future in batch if future in futures]
+            if not items:
+                continue
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            if len(items) > 1:
+                print(f"📦 {self.name}: ran a batch of {len(items)}")
+            for future, result in zip(futures, results):
+                future.set_result(result)
@@ -5,10 +5,25 @@ import shutil
 import os
 import glob
 import argparse
+import asyncio
+import json
 from dotenv import load_dotenv
+from model_server import get_model_server
+from workspace import Workspace
+from tone_cache import get_tone_cache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Blender"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Texture"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Blender", "Texture_body"))
+import glb_export
+import texture
+import texture_body
 
 load_dotenv()
 
+# "numpy" assembles the GLB in-process with Blender/glb_export.py, "blender" runs blender_merging.py
+GLB_EXPORTER = os.getenv("GLB_EXPORTER", "numpy")
+
 
 def move_resources(src_dir,dst_dir):
     os.makedirs(dst_dir, exist_ok=True)
@@ -80,20 +95,59 @@ def move_deca_result(base_dir, obj_destination, tex_destination):
 python_executable = sys.executable
 import os
 
-python_37 = os.getenv('PYTHON_37_PATH')
 python_311 = os.getenv('PYTHON_311_PATH')
 
 
+def upload_outputs(output_dir, prefix):
+    """Pushes the exported GLBs to S3 and returns the `uploaded` list printed by s3_push_objs.py."""
+    result = subprocess.run(
+        [
+            python_311,
+            "s3_push_objs.py",
+            "--dir", output_dir,
+            "--bucket", "3dglbops",
+            "--prefix", prefix,
+            "--region", "ap-south-1",
+            "--public"
+        ],
+        capture_output=True, text=True,
+    )
+    print(result.stdout)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "s3_push_objs.py failed")
+    # the JSON summary comes first, followed by one plain URL per line
+    summary, _ = json.JSONDecoder().raw_decode(result.stdout[result.stdout.index("{"):])
+    return summary["uploaded"]
+
+
+
 
+async def main_function(gender, websocket=None, workspace=None, on_progress=None):
+    """Runs the whole avatar pipeline for the photo(s) in `workspace.input_dir`.
 
+    Every stage reads and writes inside the job's own workspace, so several
+    calls can run at the same time without touching each other's files.
+    `on_progress(message)` is called with the title of each step.
+
+    Returns {"status": "success", "uploaded": [...]} with the S3 upload list,
+    or {"status": "error", "step": ..., "message": ...} for the failing step.
+    """
+    server = get_model_server()
+    ws = workspace or Workspace()
+    uploaded = []
+    failure = {}
+    # background-removed faces go straight from rembg to DECA, without PNGs in between
+    faces = {}
+    # and DECA's head meshes straight to the GLB export, without re-parsing the OBJ
+    heads = {}
 
-async def main_function(gender, websocket=None):
     async def send_progress(step_msg):
         if websocket:
             await websocket.send_json({"status": "progress", "message": step_msg})
 
     async def run_command(step, step_index):
-        print(f"\n🔧 Running Step {step_index + 1}: {step['title']} ({step['dir']})")
+        print(f"\n🔧 Running Step {step_index + 1}: {step['title']} ({step['dir']}) [job {ws.job_id}]")
+        if on_progress: on_progress(step["title"])
         if websocket:await websocket.send_json({"status": "progress","stepIndex": step_index,"title": step["title"]})
         try:
             if callable(step["command"]):
@@ -101,210 +155,118 @@ async def main_function(gender, websocket=None):
             else:
                 result = subprocess.run(step["command"], cwd=step["dir"])
                 if result.returncode != 0:
+                    failure.update(step=step["title"], message=f"exit code {result.returncode}")
                     await send_progress(f"❌ Failed at step: {' '.join(step['command'])}")
                     return False
         except Exception as e:
+            failure.update(step=step["title"], message=str(e))
             await send_progress(f"🔥 Exception at {step['dir']}: {str(e)}")
             return False
         return True
         
 
     commands = [
-        {
-            "title": "Moving Input Image",
-            "dir": ".",  
-            "command": lambda: move_resources(
-                "input",
-                "hair_mapper/stylegan-encoder/raw_images"
-            )
-        },
         {
             "title": "Analyzing Image",
             "dir": "hair_mapper/stylegan-encoder",
-            "command": [
-                python_37,
-                "align_images.py",
-                "raw_images",
-                "aligned_images"
-            ]
-        },
-        {
-            "title": "Cleaning image",
-            "dir": "hair_mapper/stylegan-encoder",
-            "command": lambda: [
-                os.remove(os.path.join("hair_mapper/stylegan-encoder/raw_images", f))
-                for f in os.listdir("hair_mapper/stylegan-encoder/raw_images")
-                if os.path.isfile(os.path.join("hair_mapper/stylegan-encoder/raw_images", f))
-            ]
-        },
-        
-        {
-            "title": "Moving",
-            "dir": ".",  
-            "command": lambda: move_resources(
-                "hair_mapper/stylegan-encoder/aligned_images",
-                "hair_mapper/HairMapper/test_data/origin"
-            )
+            "command": lambda: server.align_images(ws.input_dir, ws.origin_dir)
         },
         {
             "title": "Encoding image",
             "dir": "hair_mapper/HairMapper/encoder4editing",
-            "command": [
-                python_37,
-                "encode.py",
-                "--data_dir",
-                "../test_data"
-            ]
+            "command": lambda: server.encode_images(ws.mapper_dir)
         },
         {
             "title": "Hair removal",
             "dir":"hair_mapper/HairMapper",
-            "command":[
-                python_37,
-                "main_mapper.py",
-                "--data_dir",
-                "test_data"
-            ]
+            "command": lambda: server.remove_hair(ws.mapper_dir)
         },
         {
             "title": "Background Removal",
             "dir": ".",  
-            "command":[python_37,
-                       "background_remover.py"]
+            "command": lambda: faces.update(server.remove_background(ws.mapper_res_dir))
         },
-        {
-            "title": "Cleaning",
-            "dir": ".",
-            "command": lambda: [
-                os.remove(os.path.join("hair_mapper/HairMapper/test_data/mapper_res", f))
-                for f in os.listdir("hair_mapper/HairMapper/test_data/mapper_res")
-                if os.path.isfile(os.path.join("hair_mapper/HairMapper/test_data/mapper_res", f))
-            ]
-        },
-        {
-            "title": "Removing raw image",
-            "dir": "hair_mapper/HairMapper/test_data",
-            "command": lambda: [
-                shutil.rmtree(os.path.join("hair_mapper/HairMapper/test_data", folder, item))
-                if os.path.isdir(os.path.join("hair_mapper/HairMapper/test_data", folder, item))
-                else os.remove(os.path.join("hair_mapper/HairMapper/test_data", folder, item))
-                for folder in ["code", "mapper_res", "origin"]
-                for item in os.listdir(os.path.join("hair_mapper/HairMapper/test_data", folder))
-            ]
-        },
-
-
         {
             "title": "Building 3D Mesh",
             "dir": "DECA",
-            "command": [
-                python_37,
-                "demos/demo_reconstruct.py",
-                "-i", "TestSamples/examples",
-                "--saveDepth", "True",
-                "--saveObj", "True",
-                "--useTex", "True"
-            ]
+            # the alignment landmarks crop the faces, so FAN is not needed
+            "command": lambda: heads.update(server.reconstruct(ws.deca_input_dir, ws.deca_results_dir, images=faces,
+                                                               landmarks=server.face_landmarks(ws.origin_dir)))
         },
         {
             "title": "Moving",
             "dir": ".",
-            "command": lambda: (
-                move_deca_result("DECA/TestSamples/examples/results", "Blender/ready to use model/head", "Texture/input"),
-                [os.remove(f) for f in glob.glob("DECA/TestSamples/examples/*.png")]
-            ) and None  
+            "command": lambda: move_deca_result(ws.deca_results_dir, ws.head_dir, ws.texture_input_dir)
         },
         {
             "title": "Applying Textures",
             "dir": "Texture",
-            "command": [
-                python_311,
-                "texture.py",
-            ]
-        },
-        {
-            "title": "Cleaning",
-            "dir": "Texture",
-            "command": [
-                python_311,
-                "-c",
-                "import os, glob; [os.remove(f) for f in glob.glob('input/*.png')]"
-            ]
-        },
-
-        {
-            "title": "Moving",
-            "dir": ".",  
-            "command": lambda: shutil.move(
-                "Texture/output/final_texture.jpeg",
-                "Blender/ready to use model/head/final_texture.jpeg"
-            )
-        },
-        {
-            "title": "Texture moving",
-            "dir": ".",  
-            "command": lambda: shutil.move(
-                "Texture/output/blend_image.jpg",
-                "Blender/Texture_body/input/blend_image.jpg"
-            )
-
-
+            # the MIXED seamless clone amplifies small tone changes, so heads only reuse exact tones
+            "command": lambda: texture.compose_texture_dir(
+                ws.texture_input_dir, ws.texture_output_dir, tone_cache=get_tone_cache("head", 64, step=(1, 1, 1)))
         },
         {
             "title": "body Importing",
             "dir": "Blender/Texture_body",
-            "command": [
-                python_311,
-                "texture_body.py",
-            ]
+            "command": lambda: texture_body.recolor_body_dir(
+                gender, os.path.join(ws.texture_output_dir, "blend_image.jpg"), ws.body_dir,
+                tone_cache=get_tone_cache("body"))
         },
        
         {
             "title": "Final Rendering",
             "dir": "Blender",
-            "command": [
+            "command": (lambda: glb_export.export_avatar_from_dir(
+                gender,
+                ws.head_dir,
+                os.path.join(ws.texture_output_dir, "final_texture.jpeg"),
+                ws.body_dir,
+                ws.output_dir,
+                heads=heads,
+            )) if GLB_EXPORTER == "numpy" else [
                 python_311,
                 "blender_merging.py",
                 "--g",
                 gender,
+                "--head_dir", ws.head_dir,
+                "--head_texture", os.path.join(ws.texture_output_dir, "final_texture.jpeg"),
+                "--body_texture_dir", ws.body_dir,
+                "--output_dir", ws.output_dir,
             ]
         },
-        {
-            "title": "Output",
-            "dir": "Blender/ready to use model/head",
-            "command": lambda: (
-                [os.remove(os.path.join("Blender/ready to use model/head", f)) 
-                for f in os.listdir("Blender/ready to use model/head") 
-                if os.path.isfile(os.path.join("Blender/ready to use model/head", f))]
-            )
-        },
         {
             "title": "Upload to S3",
             "dir": ".",
-            "command": [
-                "python_311",
-                "s3_push_objs.py",
-                "--dir", "Blender/output",
-                "--bucket", "3dglbops",
-                "--prefix", "blender/outputs",
-                "--region", "ap-south-1",
-                "--public"
-            ]
+            "command": lambda: uploaded.extend(upload_outputs(ws.output_dir, f"blender/outputs/{ws.job_id}"))
         },
-        {
-            "title": "Cleaning Up",
-            "dir": ".",
-            "command": lambda: (
-                [os.remove(f) for f in glob.glob("Blender/output/*.glb")]
-            ) and None
-        }
 
 
     ]
 
-    for index, step in enumerate(commands):
-        success = await run_command(step, index)
-        if not success:
-            break
+    try:
+        for index, step in enumerate(commands):
+            success = await run_command(step, index)
+            if not success:
+                return {"status": "error", **failure}
+    finally:
+        # failed and cancelled jobs must not leave their jobs/<id> folder behind either
+        print(f"\n🧹 Cleaning up workspace [job {ws.job_id}]")
+        ws.cleanup()
 
     await send_progress("✅ Avatar generation completed.")
+    return {"status": "success", "uploaded": uploaded}
+
+
+def run_job(job, report_progress=None):
+    """Job queue runner: processes one queued upload inside its workspace.
+
+    Runs on a worker thread, so the pipeline gets its own event loop and never
+    blocks the API's.
+    """
+    payload = job["payload"]
+    workspace = Workspace(job["id"])
+    result = asyncio.run(main_function(payload["gender"], workspace=workspace, on_progress=report_progress))
+    if result["status"] != "success":
+        raise RuntimeError(f"{result['step']}: {result['message']}")
+    return {"urls": [item.get("presigned_url") or item["url"] for item in result["uploaded"]],
+            "uploaded": result["uploaded"]}
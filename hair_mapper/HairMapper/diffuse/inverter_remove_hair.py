@@ -7,7 +7,7 @@ import torch
 import torch.nn.functional as F
 from styleGAN2_ada_model.perceptual_model import PerceptualModel
 
-__all__ = ['InverterRemoveHair']
+__all__ = ['InverterRemoveHair', 'PlateauStopper']
 
 DTYPE_NAME_TO_TORCH_TENSOR_TYPE = {
     'float16': torch.HalfTensor,
@@ -41,6 +41,65 @@ def _get_tensor_value(tensors):
 from torchvision import transforms
 
 
+class PlateauStopper(object):
+    """Decides when each sample of `mask_diffuse_batch` has converged, reading the loss back rarely.
+
+    The per-step, per-sample losses are summed on the device; every
+    `check_interval` steps their means are read back with one sync. A sample
+    stops once its mean has not improved by more than `tolerance` (relative)
+    over its best one for `patience` checks in a row, and not before `min_steps`.
+    """
+
+    def __init__(self, check_interval=5, patience=3, tolerance=2e-3, min_steps=20):
+        self.check_interval = check_interval
+        self.patience = patience
+        self.tolerance = tolerance
+        self.min_steps = min_steps
+        self.reset()
+
+    def reset(self, batch_size=1):
+        """Starts a new optimization of `batch_size` samples."""
+        self.best = np.full(batch_size, np.inf)
+        self.stale = np.zeros(batch_size, dtype=np.int64)
+        self.sums = {}
+        self.count = 0
+        self.last = {}
+
+    def reset_best(self):
+        """Forgets the best losses, e.g. when the loss definition changes."""
+        self.best[:] = np.inf
+        self.stale[:] = 0
+
+    def keep(self, kept):
+        """Drops the samples that are not in the boolean mask `kept` from the batch."""
+        self.best = self.best[kept]
+        self.stale = self.stale[kept]
+        self.last = {name: value[kept] for name, value in self.last.items()}
+
+    def update(self, step, **losses):
+        """Accumulates this step's losses, each of shape (batch,).
+
+        Returns a boolean array telling which samples should stop.
+        """
+        for name, value in losses.items():
+            value = value.detach().reshape(len(self.best), -1).mean(dim=1)
+            self.sums[name] = self.sums[name] + value if name in self.sums else value
+        self.count += 1
+        if self.count < self.check_interval:
+            return np.zeros(len(self.best), dtype=bool)
+        names = list(self.sums)
+        readings = torch.stack([self.sums[name] for name in names]).cpu().numpy() / self.count
+        self.last = dict(zip(names, readings))
+        self.sums = {}
+        self.count = 0
+
+        current = self.last['loss']
+        improved = current < self.best * (1.0 - self.tolerance)
+        self.best = np.where(improved, current, self.best)
+        self.stale = np.where(improved, 0, self.stale + 1)
+        return (self.stale >= self.patience) & (step >= self.min_steps)
+
+
 class InverterRemoveHair(object):
     """Defines the class for StyleGAN inversion.
 
@@ -189,11 +248,16 @@ class InverterRemoveHair(object):
 
         return images
 
-    def easy_mask_diffuse(self, target, init_code,mask,iteration):
+    def easy_mask_diffuse(self, target, init_code,mask,iteration, **kwargs):
         """Wraps functions `preprocess()` and `diffuse()` together."""
         return self.mask_diffuse(self.preprocess(target),
                                  init_code,
-                                 mask,iteration)
+                                 mask,iteration, **kwargs)
+    def easy_mask_diffuse_batch(self, targets, init_codes, masks, iteration, **kwargs):
+        """Wraps functions `preprocess()` and `mask_diffuse_batch()` together."""
+        return self.mask_diffuse_batch([self.preprocess(target) for target in targets],
+                                       init_codes,
+                                       masks, iteration, **kwargs)
     def easy_diffuse(self, target, init_code,iteration):
         """Wraps functions `preprocess()` and `diffuse()` together."""
         return self.diffuse(self.preprocess(target),
@@ -224,31 +288,78 @@ class InverterRemoveHair(object):
     def mask_diffuse(self,
                      target,
                      init_code,
-                     mask,iteration):
+                     mask,iteration,
+                     **kwargs):
+        """Optimizes the first latent layers so the unmasked pixels match `target`.
 
-        mask = 1 - mask.astype(np.uint8) / 255.0
-        mask = mask.transpose(2, 0, 1)
-        mask = mask[np.newaxis]
+        A batch of one for `mask_diffuse_batch`, which documents the arguments.
+        """
+        return self.mask_diffuse_batch([target], [init_code], [mask], iteration, **kwargs)[0]
+
+    def mask_diffuse_batch(self,
+                           targets,
+                           init_codes,
+                           masks,
+                           iteration,
+                           stopper=None,
+                           log_interval=25,
+                           coarse_feat_steps=0,
+                           coarse_feat_size=128):
+        """Runs `mask_diffuse` for several targets, each with its own code and mask, in one batch.
+
+        Each sample has its own latent and Adam state, so it converges as it
+        would alone. Runs at most `iteration` steps; a sample leaves the batch
+        as soon as `stopper` (a PlateauStopper, None to always run them all)
+        sees its loss plateau. Losses are printed every `log_interval` steps
+        (0 for never) from the stopper's readings. The first
+        `coarse_feat_steps` steps compute the perceptual loss at
+        `coarse_feat_size` instead of 256 px.
+
+        Returns one (wp code, style space latent, image) tuple per target.
+        """
+        batch_size = len(targets)
+        mask = np.stack([(1 - mask.astype(np.uint8) / 255.0).transpose(2, 0, 1) for mask in masks])
         mask = self.to_tensor(mask.astype(np.float32))
-        target = target[np.newaxis]
-        x = target
-
-        x = self.to_tensor(x.astype(np.float32))
+        x = self.to_tensor(np.stack(targets).astype(np.float32))
         x.requires_grad = False
-        style_code = torch.from_numpy(init_code[:,-11:,:]).type(torch.FloatTensor).to(self.run_device)
+        init_codes = np.concatenate([np.reshape(code, (-1,) + code.shape[-2:]) for code in init_codes])
+        style_code = torch.from_numpy(init_codes[:,-11:,:]).type(torch.FloatTensor).to(self.run_device)
         style_code.requires_grad = False
-        train_latent = torch.from_numpy(init_code[:,:-11,:]).type(torch.FloatTensor).to(self.run_device)
-        train_latent.requires_grad = True
-        optimizer = torch.optim.Adam([train_latent], lr=self.learning_rate)
-
-        #pbar = tqdm(range(1, self.iteration + 1), leave=True,ncols=130)
+        # one leaf per sample: Adam then keeps per-sample state, and samples without a gradient are skipped
+        train_latents = []
+        for i in range(batch_size):
+            train_latent = torch.from_numpy(init_codes[i:i+1,:-11,:]).type(torch.FloatTensor).to(self.run_device)
+            train_latent.requires_grad = True
+            train_latents.append(train_latent)
+        optimizer = torch.optim.Adam(train_latents, lr=self.learning_rate)
+        if stopper is None:
+            # reads the losses for the log only
+            stopper = PlateauStopper(check_interval=log_interval or iteration, patience=iteration + 1)
+        stopper.reset(batch_size)
+
+        # the targets never change, so their features are computed once per resolution
+        feat_sizes = {256: self.face_pool}
+        if coarse_feat_steps:
+            feat_sizes[coarse_feat_size] = torch.nn.AdaptiveAvgPool2d((coarse_feat_size, coarse_feat_size))
+        x_feats = {}
+        if self.loss_feat_weight:
+            with torch.no_grad():
+                x_feats = {size: self.F.net(pool(x)) for size, pool in feat_sizes.items()}
+
+        results = [None] * batch_size
+        active = np.arange(batch_size)
         for step in range(1, iteration + 1):
             loss = 0.0
-            log_message = ''
+            losses = {}
+            index = torch.as_tensor(active, device=x.device)
+            feat_size = coarse_feat_size if step <= coarse_feat_steps else 256
+            if step == coarse_feat_steps + 1 and coarse_feat_steps:
+                # the full-resolution perceptual loss is on another scale
+                stopper.reset_best()
 
             # Reconstruction loss.
             x_rec, styleSpace_latent = self.G.model(
-                z=torch.cat([train_latent,style_code],dim=1),
+                z=torch.cat([torch.cat([train_latents[i] for i in active]), style_code[index]], dim=1),
                 c=self.G.model.c_dim,
                 truncation_psi=self.truncation_psi,
                 truncation_cutoff=None,
@@ -256,18 +367,16 @@ class InverterRemoveHair(object):
             )
 
             if self.loss_pix_weight:
-                loss_pix = torch.mean(((x - x_rec) * mask) ** 2, dim=[1, 2, 3])
+                loss_pix = torch.mean(((x[index] - x_rec) * mask[index]) ** 2, dim=[1, 2, 3])
                 loss = loss + loss_pix * self.loss_pix_weight
-                log_message = f'loss_pix: {np.mean(_get_tensor_value(loss_pix)):.3f}'
+                losses['loss_pix'] = loss_pix
 
             # Perceptual loss.
             if self.loss_feat_weight:
-                #print(self.face_pool(x).size())
-                x_feat = self.F.net(self.face_pool(x))
-                x_rec_feat = self.F.net(self.face_pool(x_rec))
-                loss_feat = torch.mean((x_feat - x_rec_feat) ** 2, dim=[1, 2, 3])
+                x_rec_feat = self.F.net(feat_sizes[feat_size](x_rec))
+                loss_feat = torch.mean((x_feats[feat_size][index] - x_rec_feat) ** 2, dim=[1, 2, 3])
                 loss = loss + loss_feat * self.loss_feat_weight
-                log_message += f', loss_feat: {np.mean(_get_tensor_value(loss_feat * self.loss_feat_weight)):.3f}'
+                losses['loss_feat'] = loss_feat * self.loss_feat_weight
             # if self.loss_smoothness:
             #     loss_smooth = F.smooth_l1_loss(x , x_rec , reduction='sum')
             #     loss = loss + loss_smooth * self.loss_smoothness
@@ -276,18 +385,36 @@ class InverterRemoveHair(object):
             #     loss_id, sim_improvement = self.id_loss(x , x_rec )
             #     loss = loss +loss_id *self.loss_weight_id
             #     log_message += f', loss_id: {loss_id *self.loss_weight_id:.3f}, id improvement:{sim_improvement:.3f}'
-            log_message += f', loss: {np.mean(_get_tensor_value(loss)):.3f}'
-            print('\r',f'step{step}/{iteration }, '+log_message,end='', flush=(step>1))
+            converged = stopper.update(step, loss=loss, **losses)
+            if step == iteration:
+                converged[:] = True
+            if log_interval and step % log_interval == 0 and stopper.last:
+                log_message = ', '.join(f'{name}: {np.mean(value):.3f}' for name, value in stopper.last.items())
+                print('\r', f'step{step}/{iteration }, active {len(active)}/{batch_size}, ' + log_message, end='', flush=True)
+
+            for k in np.nonzero(converged)[0]:
+                i = active[k]
+                wp = torch.cat([train_latents[i], style_code[i:i+1]], dim=1)
+                results[i] = (_get_tensor_value(wp),
+                              _get_tensor_value([latent[k:k+1] for latent in styleSpace_latent]),
+                              self.postprocess(_get_tensor_value(x_rec[k:k+1]))[0])
+                if step < iteration:
+                    print(f'\n✅ Diffusion of sample {i} converged after {step} steps')
+            if converged.all():
+                break
             # Do optimization.
-            optimizer.zero_grad()
+            for train_latent in train_latents:
+                train_latent.grad = None
             loss.backward(torch.ones_like(loss))
+            # converged samples keep their latent: no gradient, no Adam update
+            for i in active[converged]:
+                train_latents[i].grad = None
             optimizer.step()
+            if converged.any():
+                active = active[~converged]
+                stopper.keep(~converged)
 
-
-        res_img = self.postprocess(_get_tensor_value(x_rec))[0]
-
-        #assert wps.shape == (1, 18, 512)
-        return _get_tensor_value(torch.cat([train_latent,style_code],dim=1)),_get_tensor_value(styleSpace_latent), res_img
+        return results
 
 
 
@@ -14,6 +14,13 @@ ImageFile.LOAD_TRUNCATED_IMAGES = True
 
 from models.psp import pSp
 
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../ckpts/e4e_ffhq_encode.pt')
+
+img_transforms = transforms.Compose([
+        transforms.Resize((256, 256)),
+        transforms.ToTensor(),
+        transforms.Normalize([0.5, 0.5, 0.5], [0.5, 0.5, 0.5])])
+
 
 def parse_args():
     """Parses arguments."""
@@ -26,15 +33,9 @@ def run_on_batch(inputs, net):
     latents = net(inputs.to("cuda").float(), randomize_noise=False, return_latents=True)
     return latents
 
-def run():
-    args = parse_args()
-    img_transforms = transforms.Compose([
-            transforms.Resize((256, 256)),
-            transforms.ToTensor(),
-            transforms.Normalize([0.5, 0.5, 0.5], [0.5, 0.5, 0.5])])
-
 
-    model_path = "../ckpts/e4e_ffhq_encode.pt"
+def load_encoder(model_path=MODEL_PATH):
+    """Loads the e4e encoder once so that it can be reused across images."""
     ckpt = torch.load(model_path, map_location='cpu')
     opts = ckpt['opts']
     opts['checkpoint_path'] = model_path
@@ -42,9 +43,32 @@ def run():
     net = pSp(opts)
     net.eval()
     net.cuda()
+    return net
+
+
+def encode_image(net, input_image):
+    """Encodes an aligned PIL image into a W+ code of shape (1, 18, 512)."""
+    return encode_images(net, [input_image])[0]
+
 
-    file_dir = os.path.join(args.data_dir,'origin')
-    code_dir = os.path.join(args.data_dir,'code')
+def encode_images(net, input_images):
+    """Encodes a list of aligned PIL images in one forward pass; returns one (1, 18, 512) code per image."""
+    transformed_images = torch.stack([img_transforms(image.convert('RGB')) for image in input_images])
+    with torch.no_grad():
+        latents = run_on_batch(transformed_images, net).cpu().numpy()
+    return [np.reshape(latent,(1,18,512)) for latent in latents]
+
+
+def encode_dir(net, data_dir, encode_fn=None):
+    """Encodes every image of `data_dir/origin` into `data_dir/code`.
+
+    `encode_fn(pil_image)` defaults to `encode_image` with `net`; the model
+    server passes its batching scheduler instead.
+    """
+    if encode_fn is None:
+        encode_fn = lambda image: encode_image(net, image)
+    file_dir = os.path.join(data_dir,'origin')
+    code_dir = os.path.join(data_dir,'code')
     if not os.path.exists(code_dir):
         os.mkdir(code_dir)
     for file_path in glob.glob(os.path.join(file_dir,'*.png'))+glob.glob(os.path.join(file_dir,'*.jpg')):
@@ -53,16 +77,17 @@ def run():
       if os.path.exists(code_path):
           continue
       input_image = PIL.Image.open(file_path)
-      transformed_image = img_transforms(input_image)
-      with torch.no_grad():
-        latents = run_on_batch(transformed_image.unsqueeze(0), net)
-        latent = latents[0].cpu().numpy()
-        latent = np.reshape(latent,(1,18,512))
-        np.save(code_path,latent)
-        print(f'save to {code_path}')
+      latent = encode_fn(input_image)
+      np.save(code_path,latent)
+      print(f'save to {code_path}')
+
+
+def run():
+    args = parse_args()
+    net = load_encoder()
+    encode_dir(net, args.data_dir)
 
 
 
 if __name__ == '__main__':
     run()
-
@@ -3,10 +3,15 @@ import os
 import torch
 from torch import nn
 from torch.autograd import Function
-from torch.utils.cpp_extension import load
+
+try:
+    from prebuilt_extensions import load_extension
+except ImportError:
+    # the repository root is not on sys.path (a script run on its own): JIT compile as upstream
+    from torch.utils.cpp_extension import load as load_extension
 
 module_path = os.path.dirname(__file__)
-fused = load(
+fused = load_extension(
     'fused',
     sources=[
         os.path.join(module_path, 'fused_bias_act.cpp'),
@@ -2,10 +2,15 @@ import os
 
 import torch
 from torch.autograd import Function
-from torch.utils.cpp_extension import load
+
+try:
+    from prebuilt_extensions import load_extension
+except ImportError:
+    # the repository root is not on sys.path (a script run on its own): JIT compile as upstream
+    from torch.utils.cpp_extension import load as load_extension
 
 module_path = os.path.dirname(__file__)
-upfirdn2d_op = load(
+upfirdn2d_op = load_extension(
     'upfirdn2d',
     sources=[
         os.path.join(module_path, 'upfirdn2d.cpp'),
@@ -1,5 +1,6 @@
 import os.path
 import argparse
+import contextlib
 import cv2
 from styleGAN2_ada_model.stylegan2_ada_generator import StyleGAN2adaGenerator
 from tqdm import tqdm
@@ -7,12 +8,16 @@ from classifier.src.feature_extractor.hair_mask_extractor import get_hair_mask,
 from mapper.networks.level_mapper import LevelMapper
 import torch
 import glob
-from diffuse.inverter_remove_hair import InverterRemoveHair
+from diffuse.inverter_remove_hair import InverterRemoveHair, PlateauStopper
 import numpy as np
 from PIL import ImageFile
 import os
+import sys
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from poisson_blend import seamless_clone
+
 
 def parse_args():
     """Parses arguments."""
@@ -35,12 +40,28 @@ def parse_args():
                         help="if set, perform an additional diffusion method",
                         action="store_true")
 
+    parser.add_argument('--diffuse_iterations', type=int, default=150,
+                        help='Maximum number of diffusion steps.')
+    parser.add_argument('--diffuse_patience', type=int, default=3,
+                        help='Stop the diffusion after this many loss checks without improvement (0: never stop early).')
+    parser.add_argument('--diffuse_tolerance', type=float, default=2e-3,
+                        help='Relative loss decrease that counts as an improvement.')
+    parser.add_argument('--diffuse_check_interval', type=int, default=5,
+                        help='Steps between two loss checks (one device sync each).')
+    parser.add_argument('--diffuse_log_interval', type=int, default=25,
+                        help='Steps between two loss prints (0: never).')
+    parser.add_argument('--coarse_feat_steps', type=int, default=0,
+                        help='First diffusion steps computing the perceptual loss at 128px.')
+
     parser.add_argument('--dilate_kernel_size', type=int, default=50,
                         help='dilate kernel size')
 
     parser.add_argument('--blur_kernel_size', type=int, default=30,
                         help='blur kernel size')
 
+    parser.add_argument('--synthesis_resolution', type=parse_resolution, default='auto',
+                        help='Generator resolution of the edit: "auto" (what DECA\'s face crop needs) or 256-1024.')
+
     parser.add_argument('--truncation_psi', type=float, default='0.75')
     return parser.parse_args()
 
@@ -50,32 +71,183 @@ def mkdir(path):
         os.mkdir(path)
 
 
-def run():
-    args = parse_args()
+HAIR_MAPPER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_models(truncation_psi=0.75):
+    """Loads the generator, mapper, parsing net and inverter once for reuse."""
     model_name = 'stylegan2_ada'
-    latent_space_type = 'wp'
 
     print(f'Initializing generator.')
-    model = StyleGAN2adaGenerator(model_name, logger=None, truncation_psi=args.truncation_psi)
+    model = StyleGAN2adaGenerator(model_name, logger=None, truncation_psi=truncation_psi)
 
-    mapper = LevelMapper(input_dim=512).eval().cuda()
-    ckpt = torch.load('./mapper/checkpoints/final/best_model.pt')
+    mapper = LevelMapper(input_dim=512).eval().to(model.run_device)
+    ckpt = torch.load(os.path.join(HAIR_MAPPER_DIR, 'mapper/checkpoints/final/best_model.pt'),
+                      map_location=model.run_device)
     alpha = float(ckpt['alpha']) * 1.2
     mapper.load_state_dict(ckpt['state_dict'], strict=True)
-    kwargs = {'latent_space_type': latent_space_type}
-    parsingNet = get_parsingNet(save_pth='./ckpts/face_parsing.pth')
+    parsingNet = get_parsingNet(save_pth=os.path.join(HAIR_MAPPER_DIR, 'ckpts/face_parsing.pth'))
     inverter = InverterRemoveHair(
         model_name,
         Generator=model,
         learning_rate=0.01,
         reconstruction_loss_weight=1.0,
         perceptual_loss_weight=5e-5,
-        truncation_psi=args.truncation_psi,
+        truncation_psi=truncation_psi,
         logger=None)
+    return {'model': model, 'mapper': mapper, 'alpha': alpha, 'parsingNet': parsingNet, 'inverter': inverter}
+
+
+def parse_resolution(value):
+    """'auto' or a generator resolution (a power of two from 4 to 1024)."""
+    if value == 'auto':
+        return value
+    resolution = int(value)
+    if resolution < 4 or resolution > 1024 or resolution & (resolution - 1):
+        raise ValueError(f'Synthesis resolution should be "auto" or a power of two up to 1024, got {value!r}')
+    return resolution
+
+
+def required_resolution(landmarks, image_size=1024, crop_size=224, scale=1.25, min_resolution=256,
+                        max_resolution=1024):
+    """Smallest generator resolution at which DECA's crop of this face still has `crop_size` px.
+
+    `landmarks` are the 68 points of the `image_size` aligned face; the crop
+    box is the one DECA's TestData derives from them (kpt68 box, x1.1, x`scale`).
+    """
+    width, height = np.ptp(landmarks, axis=0)
+    crop = (width + height) / 2 * 1.1 * scale
+    needed = crop_size * image_size / crop
+    resolution = 2 ** int(np.ceil(np.log2(needed)))
+    return int(np.clip(resolution, min_resolution, max_resolution))
+
+
+def edit_latents(models, latent_codes, resolution=None):
+    """Runs the mapper and the generator on a batch of e4e codes of shape (N, 18, 512).
+
+    Returns one (edited BGR image, edited code of shape (1, 18, 512)) pair per code.
+    With a `resolution` below 1024 the generator stops at that block and the
+    images are `resolution` px wide.
+    """
+    model = models['model']
+    mapper = models['mapper']
+    alpha = models['alpha']
+    kwargs = {'latent_space_type': 'wp'}
+
+    latent_codes_origin = np.reshape(latent_codes, (-1, 18, 512))
+    mapper_input = latent_codes_origin.copy()
+    with torch.no_grad():
+        mapper_input_tensor = torch.from_numpy(mapper_input).to(model.run_device).float()
+        edited_latent_codes = latent_codes_origin
+        edited_latent_codes[:, :8, :] += alpha * mapper(mapper_input_tensor).to('cpu').detach().numpy()
+
+        outputs = model.easy_style_mixing(latent_codes=edited_latent_codes,
+                                          style_range=range(7, 18),
+                                          style_codes=latent_codes_origin,
+                                          mix_ratio=0.8,
+                                          resolution=resolution,
+                                          **kwargs
+                                          )
 
-    code_dir = os.path.join(args.data_dir, 'code')
-    origin_img_dir = os.path.join(args.data_dir, 'origin')
-    res_dir = os.path.join(args.data_dir, 'mapper_res')
+    return [(outputs['image'][i][:, :, ::-1], edited_latent_codes[i:i + 1])
+            for i in range(len(edited_latent_codes))]
+
+
+def diffuse_options(iterations=150, patience=3, tolerance=2e-3, check_interval=5, log_interval=25,
+                    coarse_feat_steps=0):
+    """Keyword arguments of `InverterRemoveHair.easy_mask_diffuse`; patience 0 runs every iteration."""
+    stopper = PlateauStopper(check_interval=check_interval, patience=patience, tolerance=tolerance) if patience else None
+    return {'iteration': iterations, 'stopper': stopper, 'log_interval': log_interval,
+            'coarse_feat_steps': coarse_feat_steps}
+
+
+def diffuse_images(models, items, diffuse_kwargs=None):
+    """Diffuses several (RGB target, init code, hair mask) items in one batch; returns the RGB results."""
+    targets, init_codes, masks = zip(*items)
+    results = models['inverter'].easy_mask_diffuse_batch(list(targets), list(init_codes), list(masks),
+                                                         **(diffuse_kwargs or diffuse_options()))
+    return [res_img for _, _, res_img in results]
+
+
+def remove_hair(models, origin_img, latent_codes_origin, remain_ear=False, diffuse=False,
+                dilate_kernel_size=50, blur_kernel_size=30, edit_fn=None, diffuse_kwargs=None, diffuse_fn=None,
+                resolution=None, parse_lock=None):
+    """Removes the hair of one aligned BGR image given its e4e code; returns the BGR result.
+
+    `edit_fn((code, resolution))` returns the (edited image, edited code) pair
+    for one code; it defaults to `edit_latents` and is swapped for a batching
+    scheduler by the model server. A lower `resolution` (see
+    `required_resolution`) skips the top generator blocks; the edit is then
+    upsampled to the original image before blending. `diffuse_kwargs` (see
+    `diffuse_options`) configure the optional diffusion, and
+    `diffuse_fn((target, code, mask))` can replace it (the model server
+    batches it across jobs). `parse_lock` is held while BiSeNet parses the
+    hair mask, for callers sharing `models` between threads.
+    """
+    if diffuse:
+        # the diffusion optimizes against the full resolution edit
+        resolution = None
+    if edit_fn is None:
+        edit_fn = lambda item: edit_latents(models, item[0], resolution=item[1])[0]
+    edited_img, edited_latent_codes = edit_fn((np.reshape(latent_codes_origin, (1, 18, 512)), resolution))
+    if edited_img.shape[:2] != origin_img.shape[:2]:
+        edited_img = cv2.resize(edited_img, (origin_img.shape[1], origin_img.shape[0]),
+                                interpolation=cv2.INTER_CUBIC)
+
+    # --remain_ear: preserve the ears in the original input image.
+    with parse_lock or contextlib.nullcontext():
+        hair_mask = get_hair_mask(img_path=origin_img, net=models['parsingNet'], include_hat=True,
+                                  include_ear=not remain_ear)
+
+    mask_dilate = cv2.dilate(hair_mask,
+                             kernel=np.ones((dilate_kernel_size, dilate_kernel_size), np.uint8))
+    mask_dilate_blur = cv2.blur(mask_dilate, ksize=(blur_kernel_size, blur_kernel_size))
+    mask_dilate_blur = (hair_mask + (255 - hair_mask) / 255 * mask_dilate_blur).astype(np.uint8)
+
+    face_mask = 255 - mask_dilate_blur
+
+    index = np.where(face_mask > 0)
+    cy = (np.min(index[0]) + np.max(index[0])) // 2
+    cx = (np.min(index[1]) + np.max(index[1])) // 2
+    center = (cx, cy)
+
+    if diffuse:
+        synthesis_image = origin_img * (1 - hair_mask // 255) + edited_img * (hair_mask // 255)
+
+        target_image = (synthesis_image[:, :, ::-1]).astype(np.uint8)
+        if diffuse_fn is None:
+            diffuse_fn = lambda item: diffuse_images(models, [item], diffuse_kwargs)[0]
+        res_img = diffuse_fn((target_image, edited_latent_codes, hair_mask))
+
+        # Image Blending in Sec 3.7
+        mixed_clone = seamless_clone(origin_img, res_img[:, :, ::-1], face_mask[:, :, 0], center,
+                                     cv2.NORMAL_CLONE)
+    else:
+
+        mixed_clone = seamless_clone(origin_img, edited_img, face_mask[:, :, 0], center, cv2.NORMAL_CLONE)
+    return mixed_clone
+
+
+def face_resolution(origin_img_path, image_size, resolution='auto'):
+    """Generator resolution for one face; "auto" reads the landmarks `align_faces` saved next to it."""
+    if resolution != 'auto':
+        return resolution
+    landmarks_path = os.path.splitext(origin_img_path)[0] + '.txt'
+    if not os.path.exists(landmarks_path):
+        return None
+    return required_resolution(np.loadtxt(landmarks_path), image_size=image_size)
+
+
+def run_dir(models, data_dir, remain_ear=False, diffuse=False, dilate_kernel_size=50, blur_kernel_size=30,
+            edit_fn=None, diffuse_kwargs=None, diffuse_fn=None, resolution='auto', parse_lock=None):
+    """Edits every code of `data_dir/code` and writes the results to `data_dir/mapper_res`.
+
+    `resolution` is the generator resolution of the edits, "auto" picks it per
+    face from its `origin/<name>.txt` landmarks (full resolution without them).
+    """
+    code_dir = os.path.join(data_dir, 'code')
+    origin_img_dir = os.path.join(data_dir, 'origin')
+    res_dir = os.path.join(data_dir, 'mapper_res')
 
     mkdir(res_dir)
 
@@ -101,58 +273,37 @@ def run():
             continue
 
         latent_codes_origin = np.reshape(np.load(code_path), (1, 18, 512))
-
-        mapper_input = latent_codes_origin.copy()
-        mapper_input_tensor = torch.from_numpy(mapper_input).cuda().float()
-        edited_latent_codes = latent_codes_origin
-        edited_latent_codes[:, :8, :] += alpha * mapper(mapper_input_tensor).to('cpu').detach().numpy()
-
         origin_img = cv2.imread(origin_img_path)
 
-        outputs = model.easy_style_mixing(latent_codes=edited_latent_codes,
-                                          style_range=range(7, 18),
-                                          style_codes=latent_codes_origin,
-                                          mix_ratio=0.8,
-                                          **kwargs
-                                          )
-
-        edited_img = outputs['image'][0][:, :, ::-1]
-
-        # --remain_ear: preserve the ears in the original input image.
-        if args.remain_ear:
-            hair_mask = get_hair_mask(img_path=origin_img, net=parsingNet, include_hat=True, include_ear=False)
-        else:
-            hair_mask = get_hair_mask(img_path=origin_img, net=parsingNet, include_hat=True, include_ear=True)
-
-        mask_dilate = cv2.dilate(hair_mask,
-                                 kernel=np.ones((args.dilate_kernel_size, args.dilate_kernel_size), np.uint8))
-        mask_dilate_blur = cv2.blur(mask_dilate, ksize=(args.blur_kernel_size, args.blur_kernel_size))
-        mask_dilate_blur = (hair_mask + (255 - hair_mask) / 255 * mask_dilate_blur).astype(np.uint8)
-
-        face_mask = 255 - mask_dilate_blur
-
-        index = np.where(face_mask > 0)
-        cy = (np.min(index[0]) + np.max(index[0])) // 2
-        cx = (np.min(index[1]) + np.max(index[1])) // 2
-        center = (cx, cy)
-
+        mixed_clone = remove_hair(models, origin_img, latent_codes_origin,
+                                  remain_ear=remain_ear,
+                                  diffuse=diffuse,
+                                  dilate_kernel_size=dilate_kernel_size,
+                                  blur_kernel_size=blur_kernel_size,
+                                  edit_fn=edit_fn,
+                                  diffuse_kwargs=diffuse_kwargs,
+                                  diffuse_fn=diffuse_fn,
+                                  resolution=face_resolution(origin_img_path, origin_img.shape[0], resolution),
+                                  parse_lock=parse_lock)
         res_save_path = os.path.join(res_dir, f'{name}.png')
+        cv2.imwrite(res_save_path, mixed_clone)
 
-        if args.diffuse:
-            synthesis_image = origin_img * (1 - hair_mask // 255) + edited_img * (hair_mask // 255)
-
-            target_image = (synthesis_image[:, :, ::-1]).astype(np.uint8)
-            res_wp, _, res_img = inverter.easy_mask_diffuse(target=target_image,
-                                                            init_code=edited_latent_codes,
-                                                            mask=hair_mask, iteration=150)
-
-            # Image Blending in Sec 3.7
-            mixed_clone = cv2.seamlessClone(origin_img, res_img[:, :, ::-1], face_mask[:, :, 0], center,
-                                            cv2.NORMAL_CLONE)
-        else:
 
-            mixed_clone = cv2.seamlessClone(origin_img, edited_img, face_mask[:, :, 0], center, cv2.NORMAL_CLONE)
-        cv2.imwrite(res_save_path, mixed_clone)
+def run():
+    args = parse_args()
+    models = load_models(truncation_psi=args.truncation_psi)
+    run_dir(models, args.data_dir,
+            remain_ear=args.remain_ear,
+            diffuse=args.diffuse,
+            dilate_kernel_size=args.dilate_kernel_size,
+            blur_kernel_size=args.blur_kernel_size,
+            resolution=args.synthesis_resolution,
+            diffuse_kwargs=diffuse_options(iterations=args.diffuse_iterations,
+                                           patience=args.diffuse_patience,
+                                           tolerance=args.diffuse_tolerance,
+                                           check_interval=args.diffuse_check_interval,
+                                           log_interval=args.diffuse_log_interval,
+                                           coarse_feat_steps=args.coarse_feat_steps))
 
 
 if __name__ == '__main__':
@@ -24,21 +24,21 @@ _inited = False
 _plugin = None
 
 USING_CUDA_TO_SPEED_UP = True
+# CPU tensors use _upfirdn2d_cpu (STYLEGAN_CPU_OPS=ref keeps the slow reference implementation)
+USING_CPU_FAST_PATH = os.getenv('STYLEGAN_CPU_OPS', 'fast') != 'ref'
 
 
 
 def _init():
     global _inited, _plugin
     if not _inited:
-
+        _inited = True
         sources = ['upfirdn2d.cpp', 'upfirdn2d.cu']
         sources = [os.path.join(os.path.dirname(__file__), s) for s in sources]
-        _plugin = custom_ops.get_plugin('upfirdn2d_plugin', sources=sources, extra_cuda_cflags=['--use_fast_math'])
         try:
             _plugin = custom_ops.get_plugin('upfirdn2d_plugin', sources=sources, extra_cuda_cflags=['--use_fast_math'])
         except:
-            pass
-            warnings.warn('Failed to build CUDA kernels for upfirdn2d. Falling back to slow reference implementation. Details:\n\n' + traceback.format_exc())
+            warnings.warn('Failed to load CUDA kernels for upfirdn2d. Falling back to slow reference implementation. Details:\n\n' + traceback.format_exc())
     return _plugin is not None
 
 def _parse_scaling(scaling):
@@ -160,6 +160,7 @@ def upfirdn2d(x, f, up=1, down=1, padding=0, flip_filter=False, gain=1, impl='re
         flip_filter: False = convolution, True = correlation (default: False).
         gain:        Overall scaling factor for signal magnitude (default: 1).
         impl:        Implementation to use. Can be `'ref'` or `'cuda'` (default: `'cuda'`).
+                     CPU tensors use `_upfirdn2d_cpu` with either.
 
     Returns:
         Tensor of the shape `[batch_size, num_channels, out_height, out_width]`.
@@ -169,6 +170,8 @@ def upfirdn2d(x, f, up=1, down=1, padding=0, flip_filter=False, gain=1, impl='re
 
     if USING_CUDA_TO_SPEED_UP and impl == 'cuda' and x.device.type == 'cuda' and _init():
         return  _upfirdn2d_cuda(up=up, down=down, padding=padding, flip_filter=flip_filter, gain=gain).apply(x, f)
+    if USING_CPU_FAST_PATH and x.device.type == 'cpu':
+        return _upfirdn2d_cpu(x, f, up=up, down=down, padding=padding, flip_filter=flip_filter, gain=gain)
     return _upfirdn2d_ref(x, f, up=up, down=down, padding=padding, flip_filter=flip_filter, gain=gain)
 
 #----------------------------------------------------------------------------
@@ -217,6 +220,88 @@ def _upfirdn2d_ref(x, f, up=1, down=1, padding=0, flip_filter=False, gain=1):
 
 #----------------------------------------------------------------------------
 
+def _polyphase_layout(taps, up, pad0):
+    """Polyphase decomposition of one axis of `upfirdn2d()`.
+
+    Output pixel `n = up * q + r` only sees the taps `[offset::up]` of phase
+    `r`, applied from input pixel `q + shift`. Returns the first input pixel
+    `base` of the common window, its length `span`, and the (start in the
+    window, tap offset) of every phase.
+    """
+    shifts = [-((pad0 - r) // up) for r in range(up)]
+    offsets = [(pad0 - r) % up for r in range(up)]
+    base = min(shifts)
+    span = max(shift - base + len(range(offset, taps, up)) for shift, offset in zip(shifts, offsets))
+    return base, span, [(shift - base, offset) for shift, offset in zip(shifts, offsets)]
+
+@misc.profiled_function
+def _upfirdn2d_cpu(x, f, up=1, down=1, padding=0, flip_filter=False, gain=1):
+    """Fast CPU implementation of `upfirdn2d()` using standard PyTorch ops.
+
+    Polyphase FIR in one grouped `conv2d`: the `upx * upy` phases of the
+    filter are stacked as output channels and applied to the input itself,
+    then interleaved, so the zeros inserted by upsampling are never
+    multiplied. Downsampling without upsampling is the convolution stride,
+    so the discarded pixels are never computed.
+    """
+    # Validate arguments.
+    assert isinstance(x, torch.Tensor) and x.ndim == 4
+    batch_size, num_channels, in_height, in_width = x.shape
+    upx, upy = _parse_scaling(up)
+    downx, downy = _parse_scaling(down)
+    padx0, padx1, pady0, pady1 = _parse_padding(padding)
+
+    # Identity filter without resampling: only pad or crop.
+    if f is None and upx == upy == downx == downy == 1:
+        x = torch.nn.functional.pad(x, [padx0, padx1, pady0, pady1])
+        return x * gain if gain != 1 else x
+
+    if f is None:
+        f = torch.ones([1, 1], dtype=torch.float32, device=x.device)
+    assert isinstance(f, torch.Tensor) and f.ndim in [1, 2]
+    assert f.dtype == torch.float32 and not f.requires_grad
+
+    # Setup filter, as 2D correlation taps.
+    if f.ndim == 1:
+        f = f.ger(f) * gain
+    else:
+        f = f * gain
+    f = f.to(x.dtype)
+    if not flip_filter:
+        f = f.flip([0, 1])
+    fh, fw = f.shape
+    out_height = in_height * upy + pady0 + pady1 - fh + 1
+    out_width = in_width * upx + padx0 + padx1 - fw + 1
+
+    # Polyphase kernel, one output channel per (row phase, column phase).
+    basey, spany, phasesy = _polyphase_layout(fh, upy, pady0)
+    basex, spanx, phasesx = _polyphase_layout(fw, upx, padx0)
+    kernel = f.new_zeros([upy, upx, spany, spanx])
+    for ry, (starty, offsety) in enumerate(phasesy):
+        for rx, (startx, offsetx) in enumerate(phasesx):
+            taps = f[offsety::upy, offsetx::upx]
+            kernel[ry, rx, starty:starty + taps.shape[0], startx:startx + taps.shape[1]] = taps
+    kernel = kernel.reshape([upy * upx, 1, spany, spanx]).repeat([num_channels, 1, 1, 1])
+
+    # Pad or crop the input to the window of the outputs, and convolve.
+    stridey = downy if upy == 1 else 1
+    stridex = downx if upx == 1 else 1
+    rows = -(-out_height // (upy * stridey))
+    cols = -(-out_width // (upx * stridex))
+    pady = [-basey, (rows - 1) * stridey + spany + basey - in_height]
+    padx = [-basex, (cols - 1) * stridex + spanx + basex - in_width]
+    x = torch.nn.functional.pad(x, padx + pady)
+    x = conv2d_gradfix.conv2d(input=x, weight=kernel, stride=[stridey, stridex], groups=num_channels)
+
+    # Interleave the phases, then downsample what the stride did not.
+    if upx > 1 or upy > 1:
+        x = x.reshape([batch_size, num_channels, upy, upx, rows, cols]).permute(0, 1, 4, 2, 5, 3)
+        x = x.reshape([batch_size, num_channels, rows * upy, cols * upx])[:, :, :out_height, :out_width]
+        x = x[:, :, ::downy // stridey, ::downx // stridex]
+    return x
+
+#----------------------------------------------------------------------------
+
 _upfirdn2d_cuda_cache = dict()
 
 def _upfirdn2d_cuda(up=1, down=1, padding=0, flip_filter=False, gain=1):
@@ -390,3 +475,43 @@ def downsample2d(x, f, down=2, padding=0, flip_filter=False, gain=1, impl='cuda'
     return upfirdn2d(x, f, down=down, padding=p, flip_filter=flip_filter, gain=gain, impl=impl)
 
 #----------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    # Checks `_upfirdn2d_cpu` against the reference and times both:
+    # python -m torch_utils.ops.upfirdn2d    (from the stylegan2_ada directory)
+    import itertools
+    import time
+    torch.manual_seed(0)
+    filters = {'4 taps': setup_filter([1, 3, 3, 1]), '8 taps': setup_filter([1] * 8), 'non-separable': setup_filter(np.random.rand(3, 4)), 'none': None}
+    worst = 0
+    for (name, f), up, down, padding, flip_filter in itertools.product(
+            filters.items(), [1, 2, 3, [2, 1]], [1, 2, [1, 3]], [0, 2, -1, [1, 2, 0, 3]], [False, True]):
+        x = torch.randn([2, 5, 12, 13], dtype=torch.float64, requires_grad=True)
+        kwargs = dict(up=up, down=down, padding=padding, flip_filter=flip_filter, gain=3)
+        y_ref = _upfirdn2d_ref(x, f, **kwargs)
+        y_cpu = _upfirdn2d_cpu(x, f, **kwargs)
+        assert y_ref.shape == y_cpu.shape, (name, kwargs, y_ref.shape, y_cpu.shape)
+        dy = torch.randn_like(y_ref)
+        dx_ref, = torch.autograd.grad(y_ref, x, dy)
+        dx_cpu, = torch.autograd.grad(y_cpu, x, dy)
+        worst = max(worst, (y_ref - y_cpu).abs().max().item(), (dx_ref - dx_cpu).abs().max().item())
+    print(f'max abs difference to the reference (values and gradients): {worst:.2e}')
+    assert worst < 1e-6 # the filters are float32
+
+    def timed(fn, repeat=5):
+        fn()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - start) / repeat * 1000
+
+    # Calls made by the 1024 px generator: skip image upsampling, FIR after the transposed convolutions.
+    f = setup_filter([1, 3, 3, 1])
+    with torch.no_grad():
+        for shape, kwargs in [([1, 3, 512, 512], dict(up=2, padding=[2, 1, 2, 1], gain=4)),
+                              ([1, 64, 513, 513], dict(padding=[1, 1, 1, 1], gain=4)),
+                              ([1, 512, 33, 33], dict(padding=[1, 1, 1, 1], gain=4)),
+                              ([1, 3, 1024, 1024], dict(down=2, padding=[1, 1, 1, 1]))]:
+            x = torch.randn(shape)
+            print(f'{str(shape):20s} {str(kwargs):50s} ref {timed(lambda: _upfirdn2d_ref(x, f, **kwargs)):7.1f} ms'
+                  f' | cpu {timed(lambda: _upfirdn2d_cpu(x, f, **kwargs)):7.1f} ms')
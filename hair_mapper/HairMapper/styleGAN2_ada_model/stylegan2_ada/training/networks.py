@@ -571,7 +571,8 @@ class SynthesisNetwork(torch.nn.Module):
                 self.num_ws += block.num_torgb
             setattr(self, f'b{res}', block)
 
-    def forward(self, ws,input_style_latent=False, **block_kwargs):
+    def forward(self, ws,input_style_latent=False, max_resolution=None, **block_kwargs):
+        # max_resolution stops after that block and returns its (skip) image, without the higher blocks
         if not input_style_latent:
             block_ws = []
             StyleSpace_latent=[]
@@ -588,6 +589,8 @@ class SynthesisNetwork(torch.nn.Module):
             F_code = None
             count  = 0
             for res, cur_ws in zip(self.block_resolutions, block_ws):
+                if max_resolution is not None and res > max_resolution:
+                    break
                 block = getattr(self, f'b{res}')
                 if block.in_channels==0:
                     x, img,Conv_latent,ToRGB_latent = block(x, img, cur_ws, **block_kwargs)
@@ -602,7 +605,8 @@ class SynthesisNetwork(torch.nn.Module):
                         F_code = ToRGB_latent
                 count +=1
 
-            assert sum([len(i) for i in StyleSpace_latent])==26
+            # one style tensor per layer, whatever the batch size
+            assert len(StyleSpace_latent)==26 or max_resolution is not None
 
 
 
@@ -611,6 +615,8 @@ class SynthesisNetwork(torch.nn.Module):
             x = img = None
             assert sum([len(i) for i in ws]) == 26
             for res, cur_ws in zip(self.block_resolutions, ws):
+                if max_resolution is not None and res > max_resolution:
+                    break
                 block = getattr(self, f'b{res}')
                 x, img= block(x, img, cur_ws,input_styleSpace_latent=True, **block_kwargs)
             return img
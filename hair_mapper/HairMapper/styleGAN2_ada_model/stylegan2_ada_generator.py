@@ -61,7 +61,7 @@ class StyleGAN2adaGenerator(BaseGenerator):
                 mapping_kwargs      = {},   # Arguments for MappingNetwork.
                 synthesis_kwargs    = {},   # Arguments for SynthesisNetwork.)
                          ).to(self.run_device)
-        self.model.load_state_dict(torch.load(self.model_path), strict=True)
+        self.model.load_state_dict(torch.load(self.model_path, map_location=self.run_device), strict=True)
         self.model.eval().to(self.run_device)
 
 
@@ -354,7 +354,8 @@ class StyleGAN2adaGenerator(BaseGenerator):
                      mix_ratio=0.5,
                    latent_space_type='Z',
                      generate_image=True,
-                   generate_style=False):
+                   generate_style=False,
+                     resolution=None):
         """Synthesizes images with given latent codes.
 
         One can choose whether to generate the layer-wise style codes.
@@ -367,6 +368,10 @@ class StyleGAN2adaGenerator(BaseGenerator):
             False)
           generate_image: Whether to generate the final image synthesis. (default:
             True)
+          resolution: Stop the synthesis network at this block (a power of two up
+            to 1024) and return its toRGB output, skipping the higher blocks; their
+            style codes are then missing from `stylespace_latent`. (default: None,
+            full resolution)
 
         Returns:
           A dictionary whose values are raw outputs from the generator.
@@ -391,7 +396,8 @@ class StyleGAN2adaGenerator(BaseGenerator):
             c=self.model.c_dim,
             truncation_psi=self.truncation_psi,
             truncation_cutoff=None,
-            input_latent_space_type='wp'
+            input_latent_space_type='wp',
+            max_resolution=resolution
         )
         results['image'] = self.get_value(mixed_img)
         results['stylespace_latent']=self.get_value(stylespace_latent)
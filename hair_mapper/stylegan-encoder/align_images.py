@@ -1,11 +1,20 @@
 import os
 import sys
 import bz2
+import glob
+import time
+import numpy as np
+import PIL.Image
 from keras.utils import get_file
-from ffhq_dataset.face_alignment import image_align
-from ffhq_dataset.landmarks_detector import LandmarksDetector
+from ffhq_dataset.face_alignment import image_align, image_align_fast, psnr, FAST_MIN_PSNR, FAST_MAX_LANDMARK_ERROR
+from ffhq_dataset.landmarks_detector import LandmarksDetector, CnnDetector, FACE_DETECTOR
 
 LANDMARKS_MODEL_URL = 'http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2'
+CNN_FACE_MODEL_URL = 'http://dlib.net/files/mmod_human_face_detector.dat.bz2'
+
+# "fast" warps straight to 1024 px with OpenCV, "ffhq" runs the reference FFHQ alignment
+ALIGN_MODE = os.getenv('ALIGN_MODE', 'fast')
+ALIGN_FUNCTIONS = {'fast': image_align_fast, 'ffhq': image_align}
 
 
 def unpack_bz2(src_path):
@@ -16,22 +25,87 @@ def unpack_bz2(src_path):
     return dst_path
 
 
+def load_landmarks_detector(detector=FACE_DETECTOR):
+    """Downloads (once) and loads the dlib 68-point landmarks detector, on the "hog" or "cnn" face detector."""
+    landmarks_model_path = unpack_bz2(get_file('shape_predictor_68_face_landmarks.dat.bz2',
+                                               LANDMARKS_MODEL_URL, cache_subdir='temp'))
+    if detector == 'hog':
+        face_detector = None
+    elif detector == 'cnn':
+        face_detector = CnnDetector(unpack_bz2(get_file('mmod_human_face_detector.dat.bz2',
+                                                        CNN_FACE_MODEL_URL, cache_subdir='temp')))
+    else:
+        raise ValueError("Unknown face detector %r, use 'hog' or 'cnn'" % detector)
+    return LandmarksDetector(landmarks_model_path, face_detector)
+
+
+def align_faces(landmarks_detector, raw_img_path, aligned_dir, mode=ALIGN_MODE):
+    """Aligns every face found in `raw_img_path` and returns the aligned image paths.
+
+    The 68 landmarks of each face, in aligned-image coordinates, are saved next
+    to it as `<face>.txt` (the keypoint file DECA's TestData reads instead of
+    running its own detector).
+    """
+    img_name = os.path.basename(raw_img_path)
+    aligned_paths = []
+    for i, face_landmarks in enumerate(landmarks_detector.get_landmarks(raw_img_path), start=1):
+        face_img_name = '%s_%02d.png' % (os.path.splitext(img_name)[0], i)
+        aligned_face_path = os.path.join(aligned_dir, face_img_name)
+
+        aligned_landmarks = ALIGN_FUNCTIONS[mode](raw_img_path, aligned_face_path, face_landmarks)
+        if aligned_landmarks is None:
+            continue
+        np.savetxt(os.path.splitext(aligned_face_path)[0] + '.txt', aligned_landmarks)
+        aligned_paths.append(aligned_face_path)
+    return aligned_paths
+
+
+def read_landmarks(aligned_dir):
+    """{face name: (68, 2) landmarks} saved by `align_faces` in `aligned_dir`."""
+    return {os.path.splitext(os.path.basename(path))[0]: np.loadtxt(path)
+            for path in sorted(glob.glob(os.path.join(aligned_dir, '*.txt')))}
+
+
+def compare_modes(landmarks_detector, raw_img_path, aligned_dir):
+    """Aligns every face of `raw_img_path` both ways, prints the timings and the PSNR between them,
+    and returns whether every face is within FAST_MIN_PSNR / FAST_MAX_LANDMARK_ERROR of the reference."""
+    img_name = os.path.splitext(os.path.basename(raw_img_path))[0]
+    ok = True
+    for i, face_landmarks in enumerate(landmarks_detector.get_landmarks(raw_img_path), start=1):
+        results = {}
+        for mode, align in ALIGN_FUNCTIONS.items():
+            path = os.path.join(aligned_dir, '%s_%02d_%s.png' % (img_name, i, mode))
+            start = time.time()
+            landmarks = align(raw_img_path, path, face_landmarks)
+            results[mode] = (time.time() - start, landmarks, PIL.Image.open(path).convert('RGB'))
+        value = psnr(results['fast'][2], results['ffhq'][2])
+        lm_error = np.abs(results['fast'][1] - results['ffhq'][1]).max()
+        passed = value >= FAST_MIN_PSNR and lm_error <= FAST_MAX_LANDMARK_ERROR
+        ok &= passed
+        print('%s %s_%02d: ffhq %.2f s | fast %.2f s | PSNR %.1f dB (min %.1f) | landmarks %.3f px (max %.2f)' % (
+            '✅' if passed else '❌', img_name, i, results['ffhq'][0], results['fast'][0],
+            value, FAST_MIN_PSNR, lm_error, FAST_MAX_LANDMARK_ERROR))
+    return ok
+
+
 if __name__ == "__main__":
     """
     Extracts and aligns all faces from images using DLib and a function from original FFHQ dataset preparation step
     python align_images.py /raw_images /aligned_images
+    python align_images.py /raw_images /aligned_images --compare    # fast vs. FFHQ alignment, side by side, fails past the tolerance
+    python -m ffhq_dataset.face_alignment                           # the same check on synthetic faces, no dlib needed
     """
 
-    landmarks_model_path = unpack_bz2(get_file('shape_predictor_68_face_landmarks.dat.bz2',
-                                               LANDMARKS_MODEL_URL, cache_subdir='temp'))
     RAW_IMAGES_DIR = sys.argv[1]
     ALIGNED_IMAGES_DIR = sys.argv[2]
+    compare = '--compare' in sys.argv[3:]
 
-    landmarks_detector = LandmarksDetector(landmarks_model_path)
+    landmarks_detector = load_landmarks_detector()
+    ok = True
     for img_name in os.listdir(RAW_IMAGES_DIR):
         raw_img_path = os.path.join(RAW_IMAGES_DIR, img_name)
-        for i, face_landmarks in enumerate(landmarks_detector.get_landmarks(raw_img_path), start=1):
-            face_img_name = '%s_%02d.png' % (os.path.splitext(img_name)[0], i)
-            aligned_face_path = os.path.join(ALIGNED_IMAGES_DIR, face_img_name)
-
-            image_align(raw_img_path, aligned_face_path, face_landmarks)
+        if compare:
+            ok &= compare_modes(landmarks_detector, raw_img_path, ALIGNED_IMAGES_DIR)
+        else:
+            align_faces(landmarks_detector, raw_img_path, ALIGNED_IMAGES_DIR)
+    sys.exit(0 if ok else 1)
@@ -1,13 +1,32 @@
+import cv2
 import numpy as np
 import scipy.ndimage
 import os
 import PIL.Image
 
+# lowest PSNR (dB) between image_align_fast and image_align on the same face the self-check accepts
+FAST_MIN_PSNR = 34.0
+# largest landmark offset (aligned pixels) between the two the self-check accepts
+FAST_MAX_LANDMARK_ERROR = 0.01
 
-def image_align(src_file, dst_file, face_landmarks, output_size=1024, transform_size=4096, enable_padding=True):
-        # Align function from FFHQ dataset pre-processing step
-        # https://github.com/NVlabs/ffhq-dataset/blob/master/download_ffhq.py
 
+def psnr(a, b):
+        # PSNR (dB) between two 8-bit images
+        mse = np.mean((np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)) ** 2)
+        return 10 * np.log10(255.0 ** 2 / mse) if mse else float('inf')
+
+
+def quad_to_aligned(points, quad, transform_size, output_size):
+        # Maps pixel coordinates of the image the quad lives in to the aligned
+        # image: PIL's QUAD transform sends the output square to the quad, and
+        # the quad is a parallelogram, so the inverse mapping is affine.
+        axes = np.stack([quad[3] - quad[0], quad[1] - quad[0]], axis=1)
+        uv = np.linalg.solve(axes, (points - quad[0]).T).T * transform_size
+        return uv * (float(output_size) / transform_size) - 0.5
+
+
+def align_quad(face_landmarks):
+        # Oriented FFHQ crop rectangle of 68 landmarks: quad corners and side length.
         lm = np.array(face_landmarks)
         lm_chin          = lm[0  : 17]  # left-right
         lm_eyebrow_left  = lm[17 : 22]  # left-right
@@ -37,6 +56,17 @@ def image_align(src_file, dst_file, face_landmarks, output_size=1024, transform_
         c = eye_avg + eye_to_mouth * 0.1
         quad = np.stack([c - x - y, c - x + y, c + x + y, c + x - y])
         qsize = np.hypot(*x) * 2
+        return quad, qsize
+
+
+def image_align(src_file, dst_file, face_landmarks, output_size=1024, transform_size=4096, enable_padding=True):
+        # Align function from FFHQ dataset pre-processing step
+        # https://github.com/NVlabs/ffhq-dataset/blob/master/download_ffhq.py
+        # Returns the landmarks in aligned-image pixel coordinates.
+
+        # landmarks follow the quad through the shrink/crop/pad steps below
+        lm_img = np.array(face_landmarks, dtype=np.float64)
+        quad, qsize = align_quad(face_landmarks)
 
         # Load in-the-wild image.
         if not os.path.isfile(src_file):
@@ -51,6 +81,7 @@ def image_align(src_file, dst_file, face_landmarks, output_size=1024, transform_
             img = img.resize(rsize, PIL.Image.ANTIALIAS)
             quad /= shrink
             qsize /= shrink
+            lm_img /= shrink
 
         # Crop.
         border = max(int(np.rint(qsize * 0.1)), 3)
@@ -59,6 +90,7 @@ def image_align(src_file, dst_file, face_landmarks, output_size=1024, transform_
         if crop[2] - crop[0] < img.size[0] or crop[3] - crop[1] < img.size[1]:
             img = img.crop(crop)
             quad -= crop[0:2]
+            lm_img -= crop[0:2]
 
         # Pad.
         pad = (int(np.floor(min(quad[:,0]))), int(np.floor(min(quad[:,1]))), int(np.ceil(max(quad[:,0]))), int(np.ceil(max(quad[:,1]))))
@@ -74,6 +106,7 @@ def image_align(src_file, dst_file, face_landmarks, output_size=1024, transform_
             img += (np.median(img, axis=(0,1)) - img) * np.clip(mask, 0.0, 1.0)
             img = PIL.Image.fromarray(np.uint8(np.clip(np.rint(img), 0, 255)), 'RGB')
             quad += pad[:2]
+            lm_img += pad[:2]
 
         # Transform.
         img = img.transform((transform_size, transform_size), PIL.Image.QUAD, (quad + 0.5).flatten(), PIL.Image.BILINEAR)
@@ -82,3 +115,127 @@ def image_align(src_file, dst_file, face_landmarks, output_size=1024, transform_
 
         # Save aligned image.
         img.save(dst_file, 'PNG')
+        return quad_to_aligned(lm_img, quad, transform_size, output_size)
+
+
+def image_align_fast(src_file, dst_file, face_landmarks, output_size=1024, enable_padding=True):
+        # Same crop as image_align, with the image brought to output resolution first:
+        # an area resize of the crop, reflect padding of the sides the quad leaves
+        # (blurred and faded to the median as in FFHQ), then one affine warp
+        # straight to output_size. Returns the landmarks in aligned-image pixel coordinates.
+        quad, qsize = align_quad(face_landmarks)
+        if not os.path.isfile(src_file):
+            print('\nCannot find source image. Please run "--wilds" before "--align".')
+            return
+        # raw orientation, like dlib.load_rgb_image; BGR throughout, as nothing mixes channels
+        img = cv2.imread(src_file, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        img_h, img_w = img.shape[:2]
+
+        # Crop (full resolution), as in image_align.
+        border = max(int(np.rint(qsize * 0.1)), 3)
+        crop = (int(np.floor(min(quad[:,0]))), int(np.floor(min(quad[:,1]))), int(np.ceil(max(quad[:,0]))), int(np.ceil(max(quad[:,1]))))
+        crop = (max(crop[0] - border, 0), max(crop[1] - border, 0), min(crop[2] + border, img_w), min(crop[3] + border, img_h))
+        pad = (max(crop[0] - min(quad[:,0]) + border, 0), max(crop[1] - min(quad[:,1]) + border, 0),
+               max(max(quad[:,0]) + border - crop[2], 0), max(max(quad[:,1]) + border - crop[3], 0))
+        pad = tuple(int(np.ceil(p)) for p in pad)
+        padding = enable_padding and max(pad) > border - 4
+        if padding:
+            pad = np.maximum(pad, int(np.rint(qsize * 0.3)))
+
+        # Area resize of the crop to about output resolution.
+        region = img[crop[1]:crop[3], crop[0]:crop[2]]
+        scale = min(float(output_size) / qsize, 1.0)
+        size = (max(int(np.rint(region.shape[1] * scale)), 1), max(int(np.rint(region.shape[0] * scale)), 1))
+        fx, fy = float(size[0]) / region.shape[1], float(size[1]) / region.shape[0]
+        if scale < 1.0:
+            region = cv2.resize(region, size, interpolation=cv2.INTER_AREA)
+        offset = np.zeros(2)
+
+        # Pad only the needed sides, at the reduced resolution.
+        if padding:
+            pad = (int(np.ceil(pad[0] * fx)), int(np.ceil(pad[1] * fy)), int(np.ceil(pad[2] * fx)), int(np.ceil(pad[3] * fy)))
+            region = cv2.copyMakeBorder(region, pad[1], pad[3], pad[0], pad[2], cv2.BORDER_REFLECT_101).astype(np.float32)
+            h, w, _ = region.shape
+            y, x, _ = np.ogrid[:h, :w, :1]
+            mask = np.maximum(1.0 - np.minimum(np.float32(x) / pad[0], np.float32(w-1-x) / pad[2]), 1.0 - np.minimum(np.float32(y) / pad[1], np.float32(h-1-y) / pad[3]))
+            # the wide blur is computed at 1/step resolution, where it is a few pixels
+            blur = qsize * 0.02 * scale
+            step = max(int(blur // 4), 1)
+            blurred = cv2.resize(region, (max(w // step, 1), max(h // step, 1)), interpolation=cv2.INTER_AREA)
+            blurred = cv2.resize(cv2.GaussianBlur(blurred, (0, 0), blur / step), (w, h), interpolation=cv2.INTER_LINEAR)
+            region += (blurred - region) * np.clip(mask * 3.0 + 1.0, 0.0, 1.0)
+            region += (np.median(region, axis=(0,1)) - region) * np.clip(mask, 0.0, 1.0)
+            region = np.uint8(np.clip(np.rint(region), 0, 255))
+            offset = np.array(pad[:2], dtype=np.float64)
+
+        # One warp: output pixel centers -> quad (full-resolution pixels) -> region pixels.
+        factor = np.array([fx, fy])
+        def to_region(points):
+                return (points - crop[:2] + 0.5) * factor - 0.5 + offset
+        origin = to_region(quad[0] + (quad[3] - quad[0] + quad[1] - quad[0]) * 0.5 / output_size)
+        axes = np.stack([(quad[3] - quad[0]) * factor, (quad[1] - quad[0]) * factor], axis=1) / output_size
+        matrix = np.hstack([axes, origin[:, None]])
+        aligned = cv2.warpAffine(region, matrix, (output_size, output_size),
+                                 flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_CONSTANT)
+
+        cv2.imwrite(dst_file, aligned)
+        return quad_to_aligned(np.array(face_landmarks, dtype=np.float64), quad, output_size, output_size)
+
+
+def synthetic_landmarks(center, width, angle=0.0):
+        # 68 dlib-ordered landmarks of a schematic frontal face, `width` px wide, rotated by `angle` degrees
+        def arc(cx, cy, rx, ry, start, stop, n):
+                t = np.linspace(start, stop, n)
+                return np.stack([cx + rx * np.cos(t), cy + ry * np.sin(t)], axis=1)
+        def line(x0, y0, x1, y1, n):
+                return np.stack([np.linspace(x0, x1, n), np.linspace(y0, y1, n)], axis=1)
+        ring = lambda n: (np.pi, -np.pi + 2 * np.pi / n)
+        lm = np.concatenate([
+                arc(0, -0.1, 0.5, 0.6, np.pi, 0, 17),                         # chin
+                line(-0.4, -0.3, -0.1, -0.3, 5), line(0.1, -0.3, 0.4, -0.3, 5), # eyebrows
+                line(0, -0.15, 0, 0.15, 4), line(-0.1, 0.2, 0.1, 0.2, 5),      # nose, nostrils
+                arc(-0.22, -0.15, 0.08, 0.03, *ring(6), 6),                    # eyes
+                arc(0.22, -0.15, 0.08, 0.03, *ring(6), 6),
+                arc(0, 0.38, 0.2, 0.07, *ring(12), 12),                        # mouth
+                arc(0, 0.38, 0.15, 0.03, *ring(8), 8)])
+        a = np.deg2rad(angle)
+        rotation = np.array([[np.cos(a), -np.sin(a)], [np.sin(a), np.cos(a)]])
+        return lm @ rotation.T * width + center
+
+
+if __name__ == '__main__':
+        # Checks image_align_fast against image_align on synthetic faces, the way
+        # align_images.py --compare does on photos (from the stylegan-encoder directory):
+        # python -m ffhq_dataset.face_alignment
+        import sys
+        import tempfile
+        import time
+        rng = np.random.RandomState(0)
+        # (image size, face center, face width, rotation): no resize, downscale + shrink, upscale, padding
+        scenes = {'plain': ((1600, 1200), (800, 600), 500, 10),
+                  'large': ((4000, 4000), (2000, 2000), 1700, -5),
+                  'small': ((640, 480), (320, 240), 150, 0),
+                  'edge':  ((1200, 900), (150, 820), 400, 25)}
+        ok = True
+        with tempfile.TemporaryDirectory() as tmp:
+                for name, ((w, h), center, width, angle) in scenes.items():
+                        # smooth, photo-like content with some fine detail
+                        img = cv2.resize(rng.randint(0, 255, (24, 32, 3)).astype(np.float32), (w, h), interpolation=cv2.INTER_CUBIC)
+                        img += cv2.resize(rng.randn(h // 2, w // 2, 3).astype(np.float32) * 20, (w, h), interpolation=cv2.INTER_LINEAR)
+                        src = os.path.join(tmp, name + '.png')
+                        cv2.imwrite(src, np.uint8(np.clip(img, 0, 255)))
+                        face_landmarks = synthetic_landmarks(np.array(center, dtype=np.float64), width, angle)
+                        results = {}
+                        for align in (image_align, image_align_fast):
+                                dst = os.path.join(tmp, '%s_%s.png' % (name, align.__name__))
+                                start = time.time()
+                                landmarks = align(src, dst, face_landmarks)
+                                results[align] = (time.time() - start, landmarks, np.asarray(PIL.Image.open(dst).convert('RGB')))
+                        (ref_time, ref_lm, ref_img), (fast_time, fast_lm, fast_img) = results[image_align], results[image_align_fast]
+                        value = psnr(ref_img, fast_img)
+                        lm_error = np.abs(ref_lm - fast_lm).max()
+                        passed = value >= FAST_MIN_PSNR and lm_error <= FAST_MAX_LANDMARK_ERROR
+                        ok &= passed
+                        print('%s %-5s %dx%d: ffhq %.2f s | fast %.2f s | PSNR %.1f dB (min %.1f) | landmarks %.3f px (max %.2f)' % (
+                                '✅' if passed else '❌', name, w, h, ref_time, fast_time, value, FAST_MIN_PSNR, lm_error, FAST_MAX_LANDMARK_ERROR))
+        sys.exit(0 if ok else 1)
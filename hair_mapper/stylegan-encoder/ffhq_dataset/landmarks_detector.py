@@ -1,18 +1,69 @@
+import os
+import cv2
 import dlib
 
+# "hog" (dlib's frontal face detector) or "cnn" (dlib's MMOD CNN, slower on CPU but finds harder poses)
+FACE_DETECTOR = os.getenv('FACE_DETECTOR', 'hog')
+# longest side of the copy the detector runs on; 0 detects at full resolution
+DETECT_MAX_SIZE = int(os.getenv('DETECT_MAX_SIZE', '1024'))
+DETECT_UPSAMPLE = int(os.getenv('DETECT_UPSAMPLE', '1'))
+# faces kept per image, largest first; 0 keeps them all
+MAX_FACES = int(os.getenv('MAX_FACES', '1'))
+
+
+class HogDetector:
+    def __init__(self):
+        self.detector = dlib.get_frontal_face_detector()
+
+    def __call__(self, img, upsample):
+        return list(self.detector(img, upsample))
+
+
+class CnnDetector:
+    def __init__(self, model_path):
+        """
+        :param model_path: path to mmod_human_face_detector.dat file
+        """
+        self.detector = dlib.cnn_face_detection_model_v1(model_path)
+
+    def __call__(self, img, upsample):
+        return [detection.rect for detection in self.detector(img, upsample)]
+
 
 class LandmarksDetector:
-    def __init__(self, predictor_model_path):
+    def __init__(self, predictor_model_path, face_detector=None, detect_max_size=DETECT_MAX_SIZE,
+                 upsample=DETECT_UPSAMPLE, max_faces=MAX_FACES):
         """
         :param predictor_model_path: path to shape_predictor_68_face_landmarks.dat file
+        :param face_detector: HogDetector (default) or CnnDetector
         """
-        self.detector = dlib.get_frontal_face_detector() # cnn_face_detection_model_v1 also can be used
+        self.detector = face_detector or HogDetector()
         self.shape_predictor = dlib.shape_predictor(predictor_model_path)
+        self.detect_max_size = detect_max_size
+        self.upsample = upsample
+        self.max_faces = max_faces
+
+    def detect(self, img):
+        """Face rectangles of `img` (full-resolution coordinates), largest first.
+
+        The detector runs on a copy downscaled to `detect_max_size`; only the
+        shape predictor needs the full resolution.
+        """
+        h, w = img.shape[:2]
+        scale = 1.0
+        small = img
+        if self.detect_max_size and max(h, w) > self.detect_max_size:
+            scale = float(self.detect_max_size) / max(h, w)
+            small = cv2.resize(img, (int(round(w * scale)), int(round(h * scale))), interpolation=cv2.INTER_AREA)
+        rects = [dlib.rectangle(int(round(rect.left() / scale)), int(round(rect.top() / scale)),
+                                int(round(rect.right() / scale)), int(round(rect.bottom() / scale)))
+                 for rect in self.detector(small, self.upsample)]
+        rects.sort(key=lambda rect: rect.area(), reverse=True)
+        return rects[:self.max_faces] if self.max_faces else rects
 
     def get_landmarks(self, image):
         img = dlib.load_rgb_image(image)
-        dets = self.detector(img, 1)
 
-        for detection in dets:
+        for detection in self.detect(img):
             face_landmarks = [(item.x, item.y) for item in self.shape_predictor(img, detection).parts()]
             yield face_landmarks
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+import traceback
+from contextlib import closing
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# running jobs not updated for this many seconds were left behind by a crashed worker
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "300"))
+# how often worker pools touch their running jobs, well below JOB_STALE_AFTER
+HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+
+
+def new_job(payload, job_id=None):
+    now = time.time()
+    return {
+        "id": job_id or uuid.uuid4().hex,
+        "status": QUEUED,
+        "payload": payload,
+        "progress": None,
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class InMemoryJobQueue:
+    """Job queue living inside the API process; jobs are lost on restart."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+
+    def put(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+        self._pending.put(job["id"])
+        return job["id"]
+
+    def claim(self, timeout=1.0):
+        """Marks the oldest queued job as running and returns it, or None after `timeout`."""
+        try:
+            job_id = self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return self.update(job_id, status=RUNNING)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields, updated_at=time.time())
+            return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class SQLiteJobQueue:
+    """Job queue stored in a local SQLite file.
+
+    Survives restarts and can be shared between the API process and separate
+    worker processes on the same machine (`python job_queue.py`).
+    """
+
+    def __init__(self, path, poll_interval=0.5, stale_after=JOB_STALE_AFTER):
+        self.path = path
+        self.poll_interval = poll_interval
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT, progress TEXT,"
+                " result TEXT, error TEXT, created_at REAL, updated_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self.fail_stale(stale_after)
+
+    def fail_stale(self, stale_after=JOB_STALE_AFTER):
+        """Marks as failed the running jobs whose worker stopped sending heartbeats; returns their ids.
+
+        Jobs of live workers (in this or another process) are touched every
+        HEARTBEAT_INTERVAL seconds and are left alone.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("SELECT id FROM jobs WHERE status = ? AND updated_at < ?",
+                                (RUNNING, now - stale_after)).fetchall()
+            job_ids = [row["id"] for row in rows]
+            conn.executemany("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                             [(FAILED, "worker stopped while running the job", now, job_id) for job_id in job_ids])
+            conn.execute("COMMIT")
+        if job_ids:
+            print(f"⚠️ Marked {len(job_ids)} abandoned running job(s) as failed: {', '.join(job_ids)}")
+        return job_ids
+
+    def _connect(self):
+        # one short-lived connection per call keeps the queue thread- and process-safe
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"]) if job["payload"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def put(self, job):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, progress, result, error, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job["id"], job["status"], json.dumps(job["payload"]), job["progress"],
+                 json.dumps(job["result"]) if job["result"] is not None else None,
+                 job["error"], job["created_at"], job["updated_at"]),
+            )
+        return job["id"]
+
+    def claim(self, timeout=1.0):
+        """Marks the oldest queued job as running and returns it, or None after `timeout`."""
+        deadline = time.time() + timeout
+        while True:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                                 (RUNNING, time.time(), row["id"]))
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+            if row is not None:
+                return self.get(row["id"])
+            if time.time() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with closing(self._connect()) as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", list(fields.values()) + [job_id])
+        return self.get(job_id)
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            return self._to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        finally:
+            conn.close()
+
+
+def get_job_queue():
+    """Builds the queue selected by the JOB_QUEUE_BACKEND env variable (`memory` or `sqlite`)."""
+    backend = os.getenv("JOB_QUEUE_BACKEND", "memory").lower()
+    if backend == "memory":
+        return InMemoryJobQueue()
+    if backend == "sqlite":
+        return SQLiteJobQueue(os.getenv("JOB_QUEUE_DB", os.path.join(BASE_DIR, "jobs.sqlite3")))
+    raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {backend}")
+
+
+class WorkerPool:
+    """Bounded pool of threads that take jobs off a queue and run them.
+
+    `runner(job, report_progress)` does the work and returns the job result;
+    any exception marks the job as failed.
+    """
+
+    def __init__(self, job_queue, runner, max_workers=2):
+        self.job_queue = job_queue
+        self.runner = runner
+        self.max_workers = max_workers
+        self._stop = threading.Event()
+        self._threads = []
+        self._running = set()
+        self._running_lock = threading.Lock()
+
+    def start(self):
+        for index in range(self.max_workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self.job_queue.claim(timeout=1.0)
+            if job is None:
+                continue
+            job_id = job["id"]
+
+            def report_progress(message):
+                self.job_queue.update(job_id, progress=message)
+
+            with self._running_lock:
+                self._running.add(job_id)
+            try:
+                result = self.runner(job, report_progress)
+                self.job_queue.update(job_id, status=SUCCEEDED, result=result)
+            except Exception as e:
+                traceback.print_exc()
+                self.job_queue.update(job_id, status=FAILED, error=str(e))
+            finally:
+                with self._running_lock:
+                    self._running.discard(job_id)
+
+    def _heartbeat(self):
+        """Keeps `updated_at` of the running jobs fresh, so `fail_stale` knows their worker is alive."""
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            with self._running_lock:
+                job_ids = list(self._running)
+            for job_id in job_ids:
+                self.job_queue.update(job_id)
+
+
+if __name__ == "__main__":
+    import argparse
+    from full_code import run_job
+    from model_server import get_model_server
+
+    parser = argparse.ArgumentParser(description="Standalone worker processing jobs from the SQLite queue")
+    parser.add_argument("--db", default=os.getenv("JOB_QUEUE_DB", os.path.join(BASE_DIR, "jobs.sqlite3")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("JOB_WORKERS", "2")))
+    args = parser.parse_args()
+
+    get_model_server().warmup()
+    pool = WorkerPool(SQLiteJobQueue(args.db), run_job, max_workers=args.workers)
+    pool.start()
+    print(f"👷 {args.workers} workers waiting for jobs in {args.db}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop(wait=False)
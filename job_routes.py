@@ -0,0 +1,65 @@
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse
+import os
+import shutil
+from job_queue import new_job, SUCCEEDED, FAILED
+from workspace import Workspace
+
+
+def create_job_router(job_queue):
+    """`/upload`, `/jobs/{job_id}` and `/jobs/{job_id}/result`, shared by `api_function` and `api_bat`.
+
+    Uploads are staged in their own workspace and queued on `job_queue`;
+    whichever worker pool the app runs picks them up.
+    """
+    router = APIRouter()
+
+    @router.post("/upload")
+    async def upload_image(
+        file: UploadFile = File(...),
+        gender: str = Form(...)
+    ):
+        # stage the upload in its own folder until a worker picks the job up
+        workspace = Workspace()
+        file_path = workspace.input_path(file.filename or "default.png")
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        job_queue.put(new_job({"gender": gender, "filename": os.path.basename(file_path)}, job_id=workspace.job_id))
+
+        return JSONResponse({
+            "status": "queued",
+            "gender": gender,
+            "job_id": workspace.job_id,
+            "status_url": f"/jobs/{workspace.job_id}",
+            "result_url": f"/jobs/{workspace.job_id}/result",
+        }, status_code=202)
+
+    def get_job_or_404(job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+        return job
+
+    @router.get("/jobs/{job_id}")
+    async def job_status(job_id: str):
+        job = get_job_or_404(job_id)
+        return JSONResponse({
+            "job_id": job["id"],
+            "status": job["status"],
+            "progress": job["progress"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+        })
+
+    @router.get("/jobs/{job_id}/result")
+    async def job_result(job_id: str):
+        job = get_job_or_404(job_id)
+        if job["status"] == SUCCEEDED:
+            return JSONResponse({"job_id": job["id"], "status": job["status"], **job["result"]})
+        if job["status"] == FAILED:
+            return JSONResponse({"job_id": job["id"], "status": job["status"], "error": job["error"]}, status_code=500)
+        # still queued or running
+        return JSONResponse({"job_id": job["id"], "status": job["status"], "progress": job["progress"]}, status_code=202)
+
+    return router
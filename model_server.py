@@ -0,0 +1,271 @@
+import os
+import sys
+import threading
+import importlib
+
+import numpy as np
+
+from batch_scheduler import BatchScheduler
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STYLEGAN_ENCODER_DIR = os.path.join(BASE_DIR, "hair_mapper", "stylegan-encoder")
+HAIR_MAPPER_DIR = os.path.join(BASE_DIR, "hair_mapper", "HairMapper")
+E4E_DIR = os.path.join(HAIR_MAPPER_DIR, "encoder4editing")
+DECA_DIR = os.path.join(BASE_DIR, "DECA")
+# "1" refines the hair-removed faces with HairMapper's latent diffusion (slow, batched across jobs)
+HAIR_DIFFUSE = os.getenv("HAIR_DIFFUSE", "0") == "1"
+# generator resolution of the hair edit: "auto" (what DECA's face crop needs) or a power of two up to 1024
+HAIR_SYNTHESIS_RESOLUTION = os.getenv("HAIR_SYNTHESIS_RESOLUTION", "auto")
+# DECA's rasterizer: "standard" (CUDA kernel), "cpu" or "pytorch3d". "auto" is "standard": the CPU port
+# is opt-in until its parity with the CUDA kernel is checked against recorded fixtures
+DECA_RASTERIZER = os.getenv("DECA_RASTERIZER", "auto")
+
+
+def _import_isolated(directory, module_name):
+    """Imports `module_name` from `directory` without leaving it on sys.path.
+
+    stylegan-encoder ships its own `dnnlib`/`training` packages that would
+    shadow the StyleGAN2-ada ones used by HairMapper.
+    """
+    sys.path.insert(0, directory)
+    try:
+        return importlib.import_module(module_name)
+    finally:
+        sys.path.remove(directory)
+
+
+def _add_path(directory):
+    if directory not in sys.path:
+        sys.path.append(directory)
+
+
+# the vendored C++/CUDA ops (e4e, StyleGAN2-ada, DECA) import `prebuilt_extensions` from the repository root
+_add_path(BASE_DIR)
+
+
+class ModelServer:
+    """Keeps every model of the avatar pipeline loaded for the lifetime of the process.
+
+    Models are loaded lazily on first use (or all at once with `warmup`), so
+    per-request latency is inference only. Each stage method mirrors one of the
+    scripts that `full_code.py` used to run as a subprocess.
+
+    Stage methods may be called from several job workers at once: each stage
+    holds its own lock, so one model is never run by two threads together
+    while different jobs can still be in different stages. The e4e encoder,
+    the HairMapper mapper/generator and the rembg session are instead fed
+    through batch schedulers, which merge the faces of concurrent jobs into
+    one forward pass. `remove_hair` only locks its BiSeNet hair parsing: the
+    mask dilation and Poisson blend around it work on the job's own arrays.
+    """
+
+    def __init__(self):
+        # re-entrant: loading a model first loads the module that defines it
+        self._lock = threading.RLock()
+        self._models = {}
+        self._stage_locks = {}
+
+    def _get(self, name, loader):
+        with self._lock:
+            if name not in self._models:
+                print(f"📦 Loading {name} ...")
+                self._models[name] = loader()
+        return self._models[name]
+
+    def _stage_lock(self, name):
+        with self._lock:
+            return self._stage_locks.setdefault(name, threading.Lock())
+
+    # ---------------------------------------------------------------- modules
+    @property
+    def align_module(self):
+        return self._get("align_images module", lambda: _import_isolated(STYLEGAN_ENCODER_DIR, "align_images"))
+
+    @property
+    def encode_module(self):
+        def load():
+            _add_path(E4E_DIR)
+            return importlib.import_module("encode")
+        return self._get("encode module", load)
+
+    @property
+    def mapper_module(self):
+        def load():
+            _add_path(HAIR_MAPPER_DIR)
+            return importlib.import_module("main_mapper")
+        return self._get("main_mapper module", load)
+
+    @property
+    def background_module(self):
+        def load():
+            _add_path(BASE_DIR)
+            return importlib.import_module("background_remover")
+        return self._get("background_remover module", load)
+
+    @property
+    def deca_module(self):
+        def load():
+            _add_path(DECA_DIR)
+            return importlib.import_module("demos.demo_reconstruct")
+        return self._get("demo_reconstruct module", load)
+
+    # ----------------------------------------------------------------- models
+    @property
+    def landmarks_detector(self):
+        return self._get("dlib landmarks detector", lambda: self.align_module.load_landmarks_detector())
+
+    @property
+    def encoder(self):
+        return self._get("e4e encoder", lambda: self.encode_module.load_encoder())
+
+    @property
+    def hair_models(self):
+        return self._get("HairMapper models", lambda: self.mapper_module.load_models())
+
+    @property
+    def rembg_session(self):
+        return self._get("rembg session", lambda: self.background_module.load_session())
+
+    @property
+    def background_remover(self):
+        return self._get("background remover", lambda: self.background_module.BackgroundRemover(self.rembg_session))
+
+    @property
+    def deca(self):
+        return self._get("DECA", lambda: self.deca_module.load_deca(self.deca_args("", "")))
+
+    @property
+    def fan(self):
+        # only built when a face comes without alignment landmarks
+        def load():
+            self.deca_module
+            from decalib.datasets import detectors
+            return detectors.LazyDetector(detectors.FAN)
+        return self._get("FAN detector (on first use)", load)
+
+    @property
+    def encode_batcher(self):
+        def load():
+            encode_module, encoder = self.encode_module, self.encoder
+            return BatchScheduler(lambda images: encode_module.encode_images(encoder, images), name="e4e encoder")
+        return self._get("e4e batch scheduler", load)
+
+    @property
+    def edit_batcher(self):
+        def load():
+            mapper_module, hair_models = self.mapper_module, self.hair_models
+
+            def process_batch(items):
+                codes, resolutions = zip(*items)
+                # one render per batch, at the largest resolution any of its faces needs
+                resolution = None if None in resolutions else max(resolutions)
+                with self._stage_lock("stylegan"):
+                    return mapper_module.edit_latents(hair_models, np.concatenate(codes), resolution=resolution)
+            return BatchScheduler(process_batch, name="HairMapper")
+        return self._get("HairMapper batch scheduler", load)
+
+    @property
+    def diffuse_batcher(self):
+        def load():
+            mapper_module, hair_models = self.mapper_module, self.hair_models
+
+            def process_batch(items):
+                # shares the StyleGAN generator with the edit scheduler
+                with self._stage_lock("stylegan"):
+                    return mapper_module.diffuse_images(hair_models, items)
+            return BatchScheduler(process_batch, name="HairMapper diffusion")
+        return self._get("HairMapper diffusion batch scheduler", load)
+
+    @property
+    def background_batcher(self):
+        def load():
+            remover = self.background_remover
+            return BatchScheduler(remover.remove_arrays, max_batch_size=remover.batch_size, name="rembg")
+        return self._get("rembg batch scheduler", load)
+
+    def warmup(self):
+        """Loads every model up front instead of on the first request."""
+        self.landmarks_detector
+        self.encoder
+        self.hair_models
+        self.background_remover
+        self.deca
+        self.fan
+        self.encode_batcher
+        self.edit_batcher
+        if HAIR_DIFFUSE:
+            self.diffuse_batcher
+        self.background_batcher
+
+    # ----------------------------------------------------------------- stages
+    def align_images(self, raw_dir, aligned_dir):
+        os.makedirs(aligned_dir, exist_ok=True)
+        aligned_paths = []
+        with self._stage_lock("align"):
+            for img_name in os.listdir(raw_dir):
+                raw_img_path = os.path.join(raw_dir, img_name)
+                aligned_paths += self.align_module.align_faces(self.landmarks_detector, raw_img_path, aligned_dir)
+        return aligned_paths
+
+    def encode_images(self, data_dir):
+        # no stage lock: the scheduler thread is the only one running the encoder
+        self.encode_module.encode_dir(self.encoder, data_dir, encode_fn=self.encode_batcher)
+
+    def remove_hair(self, data_dir):
+        mapper_module = self.mapper_module
+        mapper_module.run_dir(self.hair_models, data_dir, edit_fn=self.edit_batcher, diffuse=HAIR_DIFFUSE,
+                              diffuse_fn=self.diffuse_batcher if HAIR_DIFFUSE else None,
+                              resolution=mapper_module.parse_resolution(HAIR_SYNTHESIS_RESOLUTION),
+                              parse_lock=self._stage_lock("hair parsing"))
+
+    def remove_background(self, input_dir, output_dir=None):
+        """Background-removed faces of `input_dir` as {name: RGBA array}, saved to `output_dir` when given."""
+        images = self.background_module.load_images(input_dir)
+        # no stage lock: the scheduler thread is the only one running the session
+        futures = [self.background_batcher.submit(image) for image in images.values()]
+        cutouts = {name: future.result() for name, future in zip(images, futures)}
+        if output_dir:
+            self.background_module.save_cutouts(cutouts, output_dir)
+        return cutouts
+
+    def deca_args(self, input_dir, save_dir):
+        import torch
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        rasterizer = "standard" if DECA_RASTERIZER == "auto" else DECA_RASTERIZER
+        return self.deca_module.get_parser().parse_args([
+            "-i", input_dir,
+            "-s", save_dir,
+            "--device", device,
+            "--rasterizer_type", rasterizer,
+            "--saveObj", "True",
+            "--useTex", "True",
+            # the pipeline only consumes the OBJ and its texture
+            "--lean", "True",
+        ])
+
+    def face_landmarks(self, aligned_dir):
+        """{face name: (68, 2) landmarks} of the faces `align_images` wrote to `aligned_dir`."""
+        return self.align_module.read_landmarks(aligned_dir)
+
+    def reconstruct(self, input_dir, save_dir, images=None, landmarks=None):
+        """Runs DECA on the faces of `input_dir`, or on `images` ({name: array}) when given.
+
+        Faces with `landmarks` ({name: (68, 2) array}) are cropped from them, without FAN.
+        Returns {name: head mesh arrays}, as written to the OBJs.
+        """
+        with self._stage_lock("reconstruct"):
+            return self.deca_module.main(self.deca_args(input_dir, save_dir), deca=self.deca, face_detector=self.fan,
+                                  images=images, landmarks=landmarks)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_model_server():
+    """Returns the process-wide model server, creating it on first use."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ModelServer()
+    return _server
@@ -0,0 +1,154 @@
+import os
+import sys
+import shutil
+import hashlib
+import argparse
+import threading
+import warnings
+import importlib.util
+import importlib.machinery
+
+import torch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXTENSIONS_DIR = os.getenv("EXTENSIONS_DIR", os.path.join(BASE_DIR, "build", "extensions"))
+# "1" compiles a missing extension on first use (into the same cache), "0" fails right away
+EXTENSIONS_JIT = os.getenv("EXTENSIONS_JIT", "1") == "1"
+
+HEADER_EXTENSIONS = (".h", ".hpp", ".cuh")
+LIB_EXT = ".pyd" if os.name == "nt" else ".so"
+
+_STYLEGAN_OPS = os.path.join(BASE_DIR, "hair_mapper", "HairMapper", "styleGAN2_ada_model", "stylegan2_ada",
+                             "torch_utils", "ops")
+_E4E_OPS = os.path.join(BASE_DIR, "hair_mapper", "HairMapper", "encoder4editing", "models", "stylegan2", "op")
+_DECA_RASTERIZER = os.path.join(BASE_DIR, "DECA", "decalib", "utils", "rasterizer")
+
+# Every C++/CUDA extension of the pipeline: name -> (sources, build kwargs), as passed by its loader.
+EXTENSIONS = {
+    "upfirdn2d_plugin": ([os.path.join(_STYLEGAN_OPS, "upfirdn2d.cpp"), os.path.join(_STYLEGAN_OPS, "upfirdn2d.cu")],
+                         {"extra_cuda_cflags": ["--use_fast_math"]}),
+    "bias_act_plugin": ([os.path.join(_STYLEGAN_OPS, "bias_act.cpp"), os.path.join(_STYLEGAN_OPS, "bias_act.cu")],
+                        {"extra_cuda_cflags": ["--use_fast_math"]}),
+    "upfirdn2d": ([os.path.join(_E4E_OPS, "upfirdn2d.cpp"), os.path.join(_E4E_OPS, "upfirdn2d_kernel.cu")], {}),
+    "fused": ([os.path.join(_E4E_OPS, "fused_bias_act.cpp"), os.path.join(_E4E_OPS, "fused_bias_act_kernel.cu")], {}),
+    "standard_rasterize_cuda": ([os.path.join(_DECA_RASTERIZER, "standard_rasterize_cuda.cpp"),
+                                 os.path.join(_DECA_RASTERIZER, "standard_rasterize_cuda_kernel.cu")],
+                                {"extra_cuda_cflags": ["-std=c++14"]}),
+}
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def build_tag():
+    """Torch, CUDA and Python versions the extensions are compiled against."""
+    tag = f"torch{torch.__version__}-cu{torch.version.cuda or 'none'}-py{sys.version_info[0]}{sys.version_info[1]}"
+    return tag.replace("+", "_")
+
+
+def source_hash(name, sources, build_kwargs):
+    """Hash of the sources, the headers next to them and the build options."""
+    digest = hashlib.sha256(f"{name}|{sorted(build_kwargs.items())!r}".encode())
+    headers = set()
+    for source_dir in sorted(set(os.path.dirname(os.path.abspath(source)) for source in sources)):
+        headers.update(os.path.join(source_dir, file) for file in os.listdir(source_dir)
+                       if file.endswith(HEADER_EXTENSIONS))
+    for path in list(sources) + sorted(headers):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def extension_path(name, sources, build_kwargs, extensions_dir=None):
+    """`<EXTENSIONS_DIR>/<name>/<build tag>-<source hash>/<name>.so` (.pyd on Windows)."""
+    version = f"{build_tag()}-{source_hash(name, sources, build_kwargs)}"
+    return os.path.join(extensions_dir or EXTENSIONS_DIR, name, version, name + LIB_EXT)
+
+
+def is_prebuilt(name, sources, **build_kwargs):
+    """Whether the cache holds this extension for the current torch/CUDA version and sources."""
+    return os.path.exists(extension_path(name, sources, build_kwargs))
+
+
+def import_extension(name, path):
+    """Imports a compiled extension module from its file."""
+    loader = importlib.machinery.ExtensionFileLoader(name, path)
+    spec = importlib.util.spec_from_file_location(name, path, loader=loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+def build_extension(name, sources, verbose=False, extensions_dir=None, **build_kwargs):
+    """Compiles an extension with `torch.utils.cpp_extension.load`, stores it in the cache and returns the module."""
+    import torch.utils.cpp_extension
+    path = extension_path(name, sources, build_kwargs, extensions_dir)
+    build_dir = f"{os.path.dirname(path)}.build-{os.getpid()}"
+    os.makedirs(build_dir, exist_ok=True)
+    try:
+        module = torch.utils.cpp_extension.load(name=name, sources=sources, build_directory=build_dir,
+                                                verbose=verbose, **build_kwargs)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(os.path.join(build_dir, name + LIB_EXT), tmp)
+        os.replace(tmp, path)
+    finally:
+        # the module just built stays loaded (and locked on Windows), so this is best effort
+        shutil.rmtree(build_dir, ignore_errors=True)
+    return module
+
+
+def load_extension(name, sources, verbose=False, **build_kwargs):
+    """The compiled extension for these sources and options, from the prebuilt cache.
+
+    On a miss (other torch/CUDA version, changed sources, never built) it is
+    compiled into the cache when EXTENSIONS_JIT is on, so only the first
+    process pays for it; otherwise ImportError tells how to build it.
+    """
+    path = extension_path(name, sources, build_kwargs)
+    with _lock:
+        if path in _loaded:
+            return _loaded[path]
+        if not os.path.exists(path):
+            message = (f"No prebuilt {name} extension for {build_tag()} and the current sources ({path}). "
+                       f"Build it with `python prebuilt_extensions.py`.")
+            if not EXTENSIONS_JIT:
+                raise ImportError(message + " (EXTENSIONS_JIT=0)")
+            warnings.warn(message + " Compiling it now.")
+            _loaded[path] = build_extension(name, sources, verbose=verbose, **build_kwargs)
+        else:
+            _loaded[path] = import_extension(name, path)
+        return _loaded[path]
+
+
+def build_all(names=None, force=False, verbose=False, extensions_dir=None):
+    """Builds the EXTENSIONS that are not cached yet; returns the names that failed."""
+    failed = []
+    for name in names or EXTENSIONS:
+        sources, build_kwargs = EXTENSIONS[name]
+        path = extension_path(name, sources, build_kwargs, extensions_dir)
+        if os.path.exists(path) and not force:
+            print(f"✅ {name} is up to date ({path})")
+            continue
+        print(f"🔥 Building {name} ...")
+        try:
+            build_extension(name, sources, verbose=verbose, extensions_dir=extensions_dir, **build_kwargs)
+            print(f"✅ Built {name} ({path})")
+        except Exception as e:
+            print(f"❌ Failed to build {name}: {e}")
+            failed.append(name)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the C++/CUDA extensions ahead of time")
+    parser.add_argument("names", nargs="*", help=f"Extensions to build (default: all of {', '.join(EXTENSIONS)})")
+    parser.add_argument("--force", action="store_true", help="Rebuild even when the cache is up to date")
+    parser.add_argument("--verbose", action="store_true", help="Show the compiler output")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in EXTENSIONS]
+    if unknown:
+        parser.error(f"unknown extensions: {', '.join(unknown)}")
+    print(f"Extensions for {build_tag()} in {EXTENSIONS_DIR}")
+    sys.exit(1 if build_all(args.names, force=args.force, verbose=args.verbose) else 0)
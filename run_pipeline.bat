@@ -4,6 +4,8 @@ setlocal EnableExtensions EnableDelayedExpansion
 REM ==== CONFIG (portable) ====
 set "ROOT=%~dp0"
 if "%ROOT:~-1%"=="\" set "ROOT=%ROOT:~0,-1%"
+REM the vendored C++/CUDA ops of every step import prebuilt_extensions from the root
+set "PYTHONPATH=%ROOT%;%PYTHONPATH%"
 set "PY37=C:\Users\sanje_3wfdh8z\AppData\Local\Programs\Python\Python37\python.exe"
 set "PY311=C:\Users\sanje_3wfdh8z\AppData\Local\Programs\Python\Python311\python.exe"
 set "VCVARS=C:\Program Files (x86)\Microsoft Visual Studio\2019\Community\VC\Auxiliary\Build\vcvars64.bat"
@@ -33,12 +35,12 @@ set "PATH=%CUDA_HOME%\bin;%PATH%"
 echo [bootstrap] Root: %ROOT%
 cd /d "%ROOT%" || (echo Could not cd to %ROOT% & exit /b 1)
 
-REM Optional: clear failed torch extension builds
-rmdir /s /q "%LOCALAPPDATA%\Temp\torch_extensions" 2>nul
-
 where cl >nul 2>&1 || (echo [error] cl.exe not found even after vcvars. Aborting. & exit /b 1)
 nvcc --version >nul 2>&1 || (echo [warn] nvcc not found on PATH; continuing...)
 
+REM Prebuild the C++/CUDA extensions once per torch/CUDA version and source change (cached in build\extensions)
+call "%PY37%" prebuilt_extensions.py || echo [warn] Some extensions failed to build; they will be compiled on first use.
+
 echo.
 echo === Step 1: Moving Input Image (.) ===
 if not exist "hair_mapper\stylegan-encoder\raw_images" mkdir "hair_mapper\stylegan-encoder\raw_images"
@@ -96,7 +98,6 @@ for %%F in (code mapper_res origin) do (
 echo.
 echo === Step 10: Building 3D Mesh (DECA) ===
 pushd "DECA"
-rmdir /s /q "%LOCALAPPDATA%\Temp\torch_extensions" 2>nul
 call "%PY37%" "demos\demo_reconstruct.py" -i "TestSamples\examples" --saveDepth True --saveObj True --useTex True
 if errorlevel 1 goto :fail
 popd
@@ -0,0 +1,173 @@
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TONE_CACHE_DIR = os.getenv("TONE_CACHE_DIR", os.path.join(BASE_DIR, "tone_cache"))
+# H, S, V bucket sizes of the skin tone; "1,1,1" only reuses exact matches
+TONE_CACHE_STEP = tuple(int(v) for v in os.getenv("TONE_CACHE_STEP", "2,4,4").split(","))
+TONE_CACHE_ITEMS = int(os.getenv("TONE_CACHE_ITEMS", "4"))
+TONE_CACHE_DISK_ITEMS = int(os.getenv("TONE_CACHE_DISK_ITEMS", "256"))
+
+
+class ToneCache:
+    """Recolored textures keyed by the quantized skin tone (HSV) and a group
+    such as the gender.
+
+    An entry is a {file name: BGR image} dict, built by `create(target_hsv)`
+    with the bucket's HSV so every tone of the bucket gets the same images.
+    The `max_items` most recently used entries stay in memory. Entries are
+    also kept as lossless PNGs under `spill_dir/<key>/`: written when evicted
+    from memory, or right away by `write`. At most `max_disk_items` are kept
+    there (least recently used removed first).
+    """
+
+    def __init__(self, max_items, spill_dir=None, step=TONE_CACHE_STEP, max_disk_items=TONE_CACHE_DISK_ITEMS):
+        self.max_items = max_items
+        self.spill_dir = spill_dir
+        self.step = np.asarray(step, dtype=np.int32)
+        self.max_disk_items = max_disk_items
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def quantize(self, target_hsv):
+        """Center of the HSV bucket `target_hsv` falls in."""
+        target = np.asarray(target_hsv, dtype=np.int32)
+        center = target // self.step * self.step + self.step // 2
+        return tuple(np.minimum(center, [179, 255, 255]).tolist())
+
+    def key(self, group, target_hsv):
+        return "{}_{}_{}_{}".format(group, *self.quantize(target_hsv))
+
+    # ------------------------------------------------------------ memory
+    def _remember(self, key, entry):
+        """Inserts `entry` as most recently used, spilling what falls out of memory."""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_items:
+                evicted.append(self._entries.popitem(last=False))
+        for old_key, old_entry in evicted:
+            self._spill(old_key, old_entry)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        entry = self._load(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    # -------------------------------------------------------------- disk
+    def _folder(self, key):
+        return os.path.join(self.spill_dir, key) if self.spill_dir else None
+
+    def _spill(self, key, entry, files=None):
+        """Stores an entry under `spill_dir/<key>/`, copying `files` ({name: path}) when
+        they are already encoded instead of encoding the images again."""
+        folder = self._folder(key)
+        if folder is None or os.path.isdir(folder):
+            return
+        tmp = f"{folder}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp)
+        for name, image in entry.items():
+            if files and name in files:
+                shutil.copyfile(files[name], os.path.join(tmp, name))
+            else:
+                cv2.imwrite(os.path.join(tmp, name), image)
+        try:
+            os.rename(tmp, folder)
+        except OSError:
+            # another worker spilled the same tone first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._trim_disk()
+
+    def _load(self, key):
+        folder = self._folder(key)
+        if folder is None or not os.path.isdir(folder):
+            return None
+        entry = {}
+        for name in sorted(os.listdir(folder)):
+            image = cv2.imread(os.path.join(folder, name))
+            if image is None:
+                return None
+            entry[name] = image
+        os.utime(folder)
+        return entry
+
+    def _trim_disk(self):
+        folders = [os.path.join(self.spill_dir, name) for name in os.listdir(self.spill_dir)
+                   if not name.endswith(".tmp")]
+        folders = [path for path in folders if os.path.isdir(path)]
+        if len(folders) <= self.max_disk_items:
+            return
+        folders.sort(key=os.path.getmtime)
+        for path in folders[:len(folders) - self.max_disk_items]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    # ---------------------------------------------------------------- API
+    def get_or_create(self, group, target_hsv, create):
+        """Entry of the bucket of `target_hsv`, built by `create(bucket_hsv)` on a miss."""
+        key = self.key(group, target_hsv)
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = create(self.quantize(target_hsv))
+        self._remember(key, entry)
+        return entry
+
+    def write(self, group, target_hsv, create, output_dir):
+        """Writes the entry's images to `output_dir` and returns their paths.
+
+        Spilled entries are copied as files, so nothing is recolored or encoded
+        again; freshly encoded files are copied to the spill directory.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        key = self.key(group, target_hsv)
+        folder = self._folder(key)
+        if folder and os.path.isdir(folder):
+            try:
+                os.utime(folder)
+                saved = []
+                for name in sorted(os.listdir(folder)):
+                    saved.append(shutil.copyfile(os.path.join(folder, name), os.path.join(output_dir, name)))
+                self.hits += 1
+                return saved
+            except OSError:
+                # trimmed by another worker meanwhile, fall back to the images
+                pass
+
+        entry = self.get_or_create(group, target_hsv, create)
+        files = {}
+        for name, image in entry.items():
+            files[name] = os.path.join(output_dir, name)
+            cv2.imwrite(files[name], image)
+        self._spill(key, entry, files)
+        return list(files.values())
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_tone_cache(kind, max_items=TONE_CACHE_ITEMS, step=TONE_CACHE_STEP):
+    """Process-wide cache of one kind of texture ("head", "body"), spilling to TONE_CACHE_DIR/<kind>."""
+    with _caches_lock:
+        if kind not in _caches:
+            spill_dir = os.path.join(TONE_CACHE_DIR, kind)
+            os.makedirs(spill_dir, exist_ok=True)
+            _caches[kind] = ToneCache(max_items, spill_dir, step)
+        return _caches[kind]
@@ -0,0 +1,58 @@
+import os
+import shutil
+import uuid
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(BASE_DIR, "jobs"))
+
+
+class Workspace:
+    """Private scratch directory of one avatar job.
+
+    Every stage reads and writes inside `jobs/<job_id>/` instead of the shared
+    folders (`input/`, `test_data/origin`, `TestSamples/examples`, ...), so
+    several jobs can run side by side on one machine without racing.
+
+    Layout:
+        input/                  uploaded photo
+        hair_mapper/origin/     aligned faces
+        hair_mapper/code/       e4e latent codes
+        hair_mapper/mapper_res/ hair-removed faces
+        deca/input/             background-removed faces (kept in memory by the API)
+        deca/results/           DECA reconstructions
+        head/                   head OBJ for Blender
+        texture/input/          DECA UV texture
+        texture/output/         final_texture.jpeg, blend_image.jpg
+        body/                   recolored body textures
+        output/                 exported GLB
+    """
+
+    def __init__(self, job_id=None, root=JOBS_DIR):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.root = os.path.abspath(os.path.join(root, self.job_id))
+
+        self.input_dir = os.path.join(self.root, "input")
+        self.mapper_dir = os.path.join(self.root, "hair_mapper")
+        self.origin_dir = os.path.join(self.mapper_dir, "origin")
+        self.code_dir = os.path.join(self.mapper_dir, "code")
+        self.mapper_res_dir = os.path.join(self.mapper_dir, "mapper_res")
+        self.deca_input_dir = os.path.join(self.root, "deca", "input")
+        self.deca_results_dir = os.path.join(self.root, "deca", "results")
+        self.head_dir = os.path.join(self.root, "head")
+        self.texture_input_dir = os.path.join(self.root, "texture", "input")
+        self.texture_output_dir = os.path.join(self.root, "texture", "output")
+        self.body_dir = os.path.join(self.root, "body")
+        self.output_dir = os.path.join(self.root, "output")
+
+        for path in (self.input_dir, self.origin_dir, self.code_dir, self.mapper_res_dir,
+                     self.deca_input_dir, self.deca_results_dir, self.head_dir,
+                     self.texture_input_dir, self.texture_output_dir, self.body_dir,
+                     self.output_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def input_path(self, filename):
+        """Path inside `input/` for an uploaded file, stripped of any client-side directories."""
+        return os.path.join(self.input_dir, os.path.basename(filename) or "default.png")
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)